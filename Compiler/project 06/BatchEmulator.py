@@ -0,0 +1,141 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import itertools
+import sys
+import typing
+import numpy as np
+from CPUEmulator import decode, A_INSTRUCTION, \
+    ADDRESS_MASK, SIGN_BIT, RAM_SIZE, DEST_M, DEST_D, DEST_A, JUMP_GT, \
+    JUMP_EQ, JUMP_LT
+from SymbolTable import SymbolTable
+
+
+class BatchEmulator:
+    """
+    Runs N instances of one Hack program in lockstep, one instance per input
+    RAM image. Registers are arrays of shape (N,) and the RAM has shape
+    (N, 32K), so every instruction is applied to all the instances that are
+    at its address with a single vectorized operation. The comp functions of
+    CPUEmulator are reused as they are, since they work on uint16 arrays.
+
+    Instances that took different branches are masked: each step executes
+    the lowest program counter among the running instances, so the others
+    wait until they reconverge (usually right after the branch joins).
+    """
+
+    def __init__(self, words: typing.List[int], instances: int) -> None:
+        """
+        Args:
+            words (typing.List[int]): the machine code of the program.
+            instances (int): the number of machine instances.
+        """
+        self.program = [decode(word) for word in words]
+        self.instances = instances
+        self.ram = np.zeros((instances, RAM_SIZE), dtype=np.uint16)
+        self.a = np.zeros(instances, dtype=np.uint16)
+        self.d = np.zeros(instances, dtype=np.uint16)
+        self.pc = np.zeros(instances, dtype=np.int64)
+        self.cycles = np.zeros(instances, dtype=np.int64)
+        self.ended = np.zeros(instances, dtype=bool)
+
+    @staticmethod
+    def from_file(input_file: typing.TextIO, instances: int) -> "BatchEmulator":
+        """Creates a batch emulator of the given .hack file."""
+        words = [int(line, 2) for line in input_file.read().split()]
+        return BatchEmulator(words, instances)
+
+    def set_ram(self, address: int, values) -> None:
+        """Sets RAM[address] of every instance (a scalar or N values)."""
+        self.ram[:, address] = np.asarray(values, dtype=np.int64) & 0xFFFF
+
+    def get_ram(self, address: int) -> np.ndarray:
+        """Returns RAM[address] of every instance, as signed values."""
+        return self.ram[:, address].astype(np.int16)
+
+    def run(self, max_cycles: int) -> int:
+        """Runs every instance until it spent max_cycles cycles or ran off
+        the end of the program.
+
+        Args:
+            max_cycles (int): the cycle budget of each instance.
+
+        Returns:
+            int: the number of lockstep steps executed.
+        """
+        program = self.program
+        program_length = len(program)
+        ram, a, d, pc, cycles = self.ram, self.a, self.d, self.pc, self.cycles
+        budget = cycles + max_cycles
+        steps = 0
+        while True:
+            running = ~self.ended & (cycles < budget)
+            if not running.any():
+                return steps
+            current = int(pc[running].min())
+            selected = np.nonzero(running & (pc == current))[0]
+            steps += 1
+            if current >= program_length:
+                self.ended[selected] = True
+                continue
+            cycles[selected] += 1
+            instruction = program[current]
+            if instruction[0] == A_INSTRUCTION:
+                a[selected] = instruction[1]
+                pc[selected] += 1
+                continue
+            _, comp, reads_m, dest, jump = instruction
+            a_values = a[selected]
+            address = a_values & ADDRESS_MASK
+            m_values = ram[selected, address] if reads_m else 0
+            out = np.broadcast_to(np.asarray(comp(a_values, d[selected], m_values),
+                                             dtype=np.uint16), selected.shape)
+            if dest & DEST_M:
+                ram[selected, address] = out
+            if dest & DEST_D:
+                d[selected] = out
+            if dest & DEST_A:
+                a[selected] = out
+            if jump:
+                negative = (out & SIGN_BIT) != 0
+                zero = out == 0
+                taken = (negative & bool(jump & JUMP_LT)) \
+                    | (zero & bool(jump & JUMP_EQ)) \
+                    | (~negative & ~zero & bool(jump & JUMP_GT))
+                pc[selected] = np.where(taken, address, current + 1)
+            else:
+                pc[selected] += 1
+
+
+def parse_sweep(sweep: str) -> typing.Tuple[int, typing.List[int]]:
+    """Parses a "Rn=first..last" (or "Rn=value") sweep of one register."""
+    symbol, _, values = sweep.partition("=")
+    first, _, last = values.partition("..")
+    address = SymbolTable().get_address(symbol) if not symbol.isnumeric() \
+        else int(symbol)
+    return address, list(range(int(first), int(last or first) + 1))
+
+
+if "__main__" == __name__:
+    # Runs a .hack program once for every combination of the swept inputs
+    # and prints the requested outputs of every run, e.g.:
+    # BatchEmulator Mult.hack 10000 R0=-5..5 R1=0..20 R2
+    if len(sys.argv) < 4:
+        sys.exit("Invalid usage, please use: BatchEmulator <hack file> "
+                 "<max cycles> <Rn=first..last>... <Rn>...")
+    sweeps = [parse_sweep(arg) for arg in sys.argv[3:] if "=" in arg]
+    outputs = [parse_sweep(arg + "=0")[0] for arg in sys.argv[3:] if "=" not in arg]
+    inputs = list(itertools.product(*(values for _, values in sweeps)))
+    with open(sys.argv[1], "r") as hack_file:
+        batch = BatchEmulator.from_file(hack_file, len(inputs))
+    for column, (input_address, _) in enumerate(sweeps):
+        batch.set_ram(input_address, [values[column] for values in inputs])
+    batch.run(int(sys.argv[2]))
+    results = [batch.get_ram(address) for address in outputs]
+    for instance, values in enumerate(inputs):
+        print(" ".join(str(value) for value in values), "->",
+              " ".join(str(int(result[instance])) for result in results))
@@ -0,0 +1,544 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+
+WORD_MASK = 0xFFFF
+SIGN_BIT = 0x8000
+ADDRESS_MASK = 0x7FFF
+RAM_SIZE = 32768
+ROM_SIZE = 32768
+SCREEN = 16384
+KBD = 24576
+
+# kinds of pre-decoded instructions
+A_INSTRUCTION = 0
+C_INSTRUCTION = 1
+# a C instruction that jumps backwards to the address loaded right before it
+LOOP_JUMP = 2
+# kinds from here on leave the fast path of run()
+END_OF_PROGRAM = 3
+# (BREAKPOINT, original): stops before the original instruction
+BREAKPOINT = 4
+# (WATCHED, original): an instruction that writes M while watchpoints are set
+WATCHED = 5
+# (TRACED, original, writes M): an instruction recorded by a trace recorder
+TRACED = 6
+# (COUNTED, original, reads M, writes M): an instruction that accesses RAM
+# while a heatmap is attached
+COUNTED = 7
+
+# dest bits (d1 d2 d3 = A D M)
+DEST_M = 1
+DEST_D = 2
+DEST_A = 4
+
+# jump bits (j1 j2 j3 = out<0 out=0 out>0)
+JUMP_GT = 1
+JUMP_EQ = 2
+JUMP_LT = 4
+
+# halt reasons returned by run()
+HALT_CYCLES = "cycles"
+HALT_END = "end"
+HALT_IDLE = "idle"
+HALT_BREAKPOINT = "breakpoint"
+HALT_WATCHPOINT = "watchpoint"
+HALT_ERROR = "error"
+
+# a loop whose state check failed is skipped for this many visits, doubled
+# after every failure up to MAX_IDLE_BACKOFF
+MAX_IDLE_BACKOFF = 1024
+
+C_INSTRUCTION_PREFIX = 0b111
+SHIFT_INSTRUCTION_PREFIX = 0b101
+
+# the 7 comp bits ("a c1..c6") of every mnemonic in Code.comp_table, as
+# functions of (A, D, M). all values are unsigned 16-bit words.
+comp_table = {"0101010": lambda a, d, m: 0,
+              "0111111": lambda a, d, m: 1,
+              "0111010": lambda a, d, m: WORD_MASK,
+              "0001100": lambda a, d, m: d,
+              "0110000": lambda a, d, m: a,
+              "0001101": lambda a, d, m: d ^ WORD_MASK,
+              "0110001": lambda a, d, m: a ^ WORD_MASK,
+              "0001111": lambda a, d, m: -d & WORD_MASK,
+              "0110011": lambda a, d, m: -a & WORD_MASK,
+              "0011111": lambda a, d, m: (d + 1) & WORD_MASK,
+              "0110111": lambda a, d, m: (a + 1) & WORD_MASK,
+              "0001110": lambda a, d, m: (d - 1) & WORD_MASK,
+              "0110010": lambda a, d, m: (a - 1) & WORD_MASK,
+              "0000010": lambda a, d, m: (d + a) & WORD_MASK,
+              "0010011": lambda a, d, m: (d - a) & WORD_MASK,
+              "0000111": lambda a, d, m: (a - d) & WORD_MASK,
+              "0000000": lambda a, d, m: d & a,
+              "0010101": lambda a, d, m: d | a,
+              "1110000": lambda a, d, m: m,
+              "1110001": lambda a, d, m: m ^ WORD_MASK,
+              "1110011": lambda a, d, m: -m & WORD_MASK,
+              "1110111": lambda a, d, m: (m + 1) & WORD_MASK,
+              "1110010": lambda a, d, m: (m - 1) & WORD_MASK,
+              "1000010": lambda a, d, m: (d + m) & WORD_MASK,
+              "1010011": lambda a, d, m: (d - m) & WORD_MASK,
+              "1000111": lambda a, d, m: (m - d) & WORD_MASK,
+              "1000000": lambda a, d, m: d & m,
+              "1010101": lambda a, d, m: d | m}
+
+# the extended (101 prefixed) shift instructions. right shifts keep the sign.
+shift_table = {"0100000": lambda a, d, m: (a << 1) & WORD_MASK,
+               "0110000": lambda a, d, m: (d << 1) & WORD_MASK,
+               "1100000": lambda a, d, m: (m << 1) & WORD_MASK,
+               "0000000": lambda a, d, m: (a >> 1) | (a & SIGN_BIT),
+               "0010000": lambda a, d, m: (d >> 1) | (d & SIGN_BIT),
+               "1000000": lambda a, d, m: (m >> 1) | (m & SIGN_BIT)}
+
+
+def to_signed(value: int) -> int:
+    """Returns the given 16-bit word as a signed integer."""
+    return value - 0x10000 if value & SIGN_BIT else value
+
+
+def to_word(value: int) -> int:
+    """Returns the given (possibly negative) integer as a 16-bit word."""
+    return value & WORD_MASK
+
+
+def generic_comp(comp_bits: str) -> typing.Callable[[int, int, int], int]:
+    """
+    Builds a comp function straight from the ALU control bits, for comp codes
+    that have no mnemonic in the assembler.
+    """
+    use_m, zx, nx, zy, ny, f, no = (bit == "1" for bit in comp_bits)
+
+    def comp(a: int, d: int, m: int) -> int:
+        x = 0 if zx else d
+        y = 0 if zy else (m if use_m else a)
+        if nx:
+            x ^= WORD_MASK
+        if ny:
+            y ^= WORD_MASK
+        out = (x + y) & WORD_MASK if f else x & y
+        return out ^ WORD_MASK if no else out
+
+    return comp
+
+
+def decode(word: int) -> tuple:
+    """
+    Decodes a single machine instruction into the tuple the emulator executes:
+    (A_INSTRUCTION, value) or (C_INSTRUCTION, comp, reads_m, dest, jump).
+    """
+    if not word & SIGN_BIT:
+        return A_INSTRUCTION, word
+    comp_bits = format((word >> 6) & 0x7F, "07b")
+    prefix = word >> 13
+    if prefix == SHIFT_INSTRUCTION_PREFIX and comp_bits in shift_table:
+        comp = shift_table[comp_bits]
+    elif prefix == C_INSTRUCTION_PREFIX:
+        comp = comp_table.get(comp_bits) or generic_comp(comp_bits)
+    else:
+        raise ValueError("illegal instruction: " + format(word, "016b"))
+    reads_m = comp_bits[0] == "1"
+    return C_INSTRUCTION, comp, reads_m, (word >> 3) & 7, word & 7
+
+
+def mark_loop_jumps(program: typing.List[tuple]) -> None:
+    """
+    Marks the jumps that close a loop ("@LOOP" followed by a jump, where LOOP
+    is at or before the "@" itself) as LOOP_JUMP, so that only they pay for
+    idle loop detection.
+    """
+    for index in range(1, len(program)):
+        instruction = program[index]
+        previous = program[index - 1]
+        if instruction[0] == C_INSTRUCTION and instruction[4] \
+                and previous[0] == A_INSTRUCTION and previous[1] < index:
+            program[index] = (LOOP_JUMP,) + instruction[1:]
+
+
+class CPUEmulator:
+    """
+    Emulates the Hack computer: a ROM holding the pre-decoded program, a RAM
+    of 32K words (with the screen and keyboard memory maps) and the A, D and
+    PC registers. Every executed instruction costs exactly one cycle.
+
+    Idle loops, like "(END) @END 0;JMP" or the loop of Sys.halt, are detected
+    when the machine reaches the head of a loop in exactly the state (A, D and
+    the whole RAM, keyboard included) it had on a previous visit: from then on
+    it repeats itself forever, so run() either stops (stop_on_idle) or skips
+    the remaining whole periods of the loop at once.
+
+    Breakpoints and watchpoints cost nothing while none are set: a breakpoint
+    replaces the pre-decoded instruction at its address by a BREAKPOINT entry,
+    and arming a watchpoint replaces every instruction that writes M by a
+    WATCHED entry that checks the address before the write. Both kinds are
+    handled off the fast path, and removing the last one restores the
+    original entries. Attaching a trace recorder works the same way: every
+    instruction is wrapped in a TRACED entry while it is attached. So does a
+    RAM heatmap, which wraps every instruction that reads or writes M in a
+    COUNTED entry.
+    """
+    END_ENTRY = (END_OF_PROGRAM,)
+
+    def __init__(self) -> None:
+        """Creates an emulator with an empty ROM and a zeroed RAM."""
+        self.rom = []
+        self.decoded = []
+        self.program = [CPUEmulator.END_ENTRY] * (ROM_SIZE + 1)
+        self.ram = [0] * RAM_SIZE
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+        self.detect_idle = True
+        self.stop_on_idle = False
+        self.symbols = {}
+        self.breakpoints = set()
+        self.watchpoints = set()
+        self.watch_hit = None
+        self.recorder = None
+        self.heatmap = None
+        self.loop_visits = {}
+        self.idle_loop_period = 0
+
+    def load(self, input_file: typing.TextIO) -> None:
+        """Loads a .hack file (one 16 characters binary word per line).
+
+        Args:
+            input_file (typing.TextIO): the machine code to load.
+        """
+        words = [int(line, 2) for line in input_file.read().split()]
+        self.load_program(words)
+
+    def load_program(self, words: typing.List[int]) -> None:
+        """Decodes the given machine words into the ROM and resets the CPU.
+
+        Args:
+            words (typing.List[int]): the program, one word per instruction.
+        """
+        if len(words) > ROM_SIZE:
+            raise ValueError("program does not fit in the ROM")
+        self.rom = list(words)
+        self.decoded = [decode(word) for word in words]
+        mark_loop_jumps(self.decoded)
+        self.program = self.decoded + \
+            [CPUEmulator.END_ENTRY] * (ROM_SIZE + 1 - len(words))
+        self.breakpoints = set()
+        self.watchpoints = set()
+        self.wrap_all()
+        self.reset()
+
+    def load_symbols(self, symbols: typing.Dict[str, int]) -> None:
+        """Sets the assembler's symbol table of the loaded program, so that
+        breakpoints and watchpoints can be given by label or variable name.
+
+        Args:
+            symbols (typing.Dict[str, int]): symbol to address, as returned
+            in SymbolTable.table by the assembler's assemble_file.
+        """
+        self.symbols = dict(symbols)
+
+    def resolve(self, location: typing.Union[str, int]) -> int:
+        """Returns the address of a symbol, or the given address."""
+        if isinstance(location, str):
+            return self.symbols[location] if not location.isnumeric() \
+                else int(location)
+        return location
+
+    def reset(self) -> None:
+        """Resets the registers and the cycle counter. The RAM is kept."""
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+
+    def run(self, max_cycles: int) -> str:
+        """Executes instructions until max_cycles cycles were spent, the
+        program counter leaves the loaded program, a breakpoint or watchpoint
+        is hit or, with stop_on_idle, the program is stuck in an idle loop.
+        An attached trace recorder is told why the emulator stopped.
+
+        Args:
+            max_cycles (int): the cycle budget of this call.
+
+        Returns:
+            str: the reason the emulator stopped: HALT_CYCLES, HALT_END,
+            HALT_IDLE, HALT_BREAKPOINT or HALT_WATCHPOINT.
+        """
+        if self.recorder is None:
+            return self.run_cycles(max_cycles)
+        try:
+            reason = self.run_cycles(max_cycles)
+        except Exception:
+            self.recorder.halted(self, HALT_ERROR)
+            raise
+        if reason != HALT_CYCLES:
+            self.recorder.halted(self, reason)
+        return reason
+
+    def run_cycles(self, max_cycles: int) -> str:
+        """The execution loop of run()."""
+        program = self.program
+        ram = self.ram
+        a = self.a
+        d = self.d
+        pc = self.pc
+        cycles = 0
+        reason = HALT_CYCLES
+        detect_idle = self.detect_idle
+        loop_visits = self.loop_visits = {}
+        while cycles < max_cycles:
+            instruction = program[pc]
+            kind = instruction[0]
+            if kind == A_INSTRUCTION:
+                a = instruction[1]
+                pc += 1
+            elif kind >= END_OF_PROGRAM:
+                if kind == END_OF_PROGRAM:
+                    reason = HALT_END
+                    break
+                self.a = a
+                self.d = d
+                self.pc = pc
+                stop = self.execute_special(instruction, cycles)
+                a = self.a
+                d = self.d
+                pc = self.pc
+                if stop == HALT_IDLE and not self.stop_on_idle:
+                    period = self.idle_loop_period
+                    cycles += (max_cycles - cycles - 1) // period * period
+                elif stop:
+                    reason = stop
+                    if stop != HALT_BREAKPOINT:
+                        cycles += 1
+                    break
+            else:
+                address = a & ADDRESS_MASK
+                out = instruction[1](a, d, ram[address] if instruction[2] else 0)
+                dest = instruction[3]
+                if dest:
+                    if dest & DEST_M:
+                        ram[address] = out
+                    if dest & DEST_D:
+                        d = out
+                    if dest & DEST_A:
+                        a = out
+                jump = instruction[4]
+                if jump and jump & (JUMP_LT if out & SIGN_BIT else JUMP_EQ if out == 0 else JUMP_GT):
+                    pc = address
+                    if kind == LOOP_JUMP and detect_idle:
+                        period = self.idle_period(loop_visits, pc, a, d, cycles)
+                        if period:
+                            if self.stop_on_idle:
+                                reason = HALT_IDLE
+                                cycles += 1
+                                break
+                            # every period brings the machine back to this state
+                            cycles += (max_cycles - cycles - 1) // period * period
+                else:
+                    pc += 1
+            cycles += 1
+        self.a = a
+        self.d = d
+        self.pc = pc
+        self.cycles += cycles
+        return reason
+
+    def idle_period(self, loop_visits: typing.Dict[int, list], head: int,
+                    a: int, d: int, cycle: int) -> int:
+        """Checks whether the machine, about to execute the loop head, is in
+        the same state as on a previous visit to that head.
+
+        Args:
+            loop_visits (typing.Dict[int, list]): the visits of this run,
+            per loop head: [A, D, cycle, RAM snapshot, skips left, backoff].
+            head (int): the address of the loop head.
+            a (int): the A register.
+            d (int): the D register.
+            cycle (int): the cycle of this visit.
+
+        Returns:
+            int: the period of the loop in cycles, or 0 if it is not idle.
+        """
+        visit = loop_visits.get(head)
+        if visit is None:
+            loop_visits[head] = [a, d, cycle, None, 0, 1]
+            return 0
+        if visit[4]:
+            visit[4] -= 1
+            return 0
+        if visit[0] == a and visit[1] == d:
+            if visit[3] is not None:
+                if visit[3] == self.ram:
+                    return cycle - visit[2]
+                visit[5] = min(visit[5] * 2, MAX_IDLE_BACKOFF)
+                visit[4] = visit[5]
+            visit[3] = self.ram[:]
+        else:
+            visit[3] = None
+        visit[0] = a
+        visit[1] = d
+        visit[2] = cycle
+        return 0
+
+    def execute_special(self, instruction: tuple, cycle: int) -> str:
+        """Handles a BREAKPOINT, WATCHED, TRACED or COUNTED entry (and the
+        entries they wrap) on the registers in self.
+
+        Args:
+            instruction (tuple): the entry at the program counter.
+            cycle (int): the cycle of the current run. A breakpoint is
+            stepped over on the first cycle, so that a run can resume.
+
+        Returns:
+            str: HALT_BREAKPOINT if stopped before the instruction,
+            HALT_WATCHPOINT if a watched address was written, HALT_IDLE if
+            an idle loop was found (its period is in idle_loop_period) and
+            "" otherwise.
+        """
+        kind = instruction[0]
+        if kind == BREAKPOINT:
+            if cycle:
+                return HALT_BREAKPOINT
+            return self.execute_special(instruction[1], cycle)
+        if kind == TRACED:
+            pc = self.pc
+            address = self.a & ADDRESS_MASK
+            stop = self.execute_special(instruction[1], cycle)
+            self.recorder.record(pc, self.a, self.d,
+                                 address if instruction[2] else -1,
+                                 self.ram[address])
+            return stop
+        if kind == COUNTED:
+            address = self.a & ADDRESS_MASK
+            if instruction[2]:
+                self.heatmap.reads[address] += 1
+            stop = self.execute_special(instruction[1], cycle)
+            if instruction[3]:
+                self.heatmap.writes[address] += 1
+            return stop
+        if kind == LOOP_JUMP and self.detect_idle:
+            pc = self.pc
+            self.execute(instruction)
+            if self.pc != pc + 1:
+                self.idle_loop_period = self.idle_period(
+                    self.loop_visits, self.pc, self.a, self.d, cycle)
+                if self.idle_loop_period:
+                    return HALT_IDLE
+            return ""
+        if kind != WATCHED:
+            self.execute(instruction)
+            return ""
+        address = self.a & ADDRESS_MASK
+        old_value = self.ram[address]
+        self.execute(instruction[1])
+        if address in self.watchpoints:
+            self.watch_hit = (address, old_value, self.ram[address])
+            return HALT_WATCHPOINT
+        return ""
+
+    def execute(self, instruction: tuple) -> None:
+        """Executes a single decoded A or C instruction on the registers in
+        self. This is the slow path; run() inlines the same logic.
+        """
+        if instruction[0] == A_INSTRUCTION:
+            self.a = instruction[1]
+            self.pc += 1
+            return
+        _, comp, reads_m, dest, jump = instruction
+        address = self.a & ADDRESS_MASK
+        out = comp(self.a, self.d, self.ram[address] if reads_m else 0)
+        if dest & DEST_M:
+            self.ram[address] = out
+        if dest & DEST_D:
+            self.d = out
+        if dest & DEST_A:
+            self.a = out
+        if jump and jump & (JUMP_LT if out & SIGN_BIT else JUMP_EQ if out == 0 else JUMP_GT):
+            self.pc = address
+        else:
+            self.pc += 1
+
+    def wrap(self, address: int) -> None:
+        """Rebuilds the program entry at a ROM address from its decoded
+        instruction and the breakpoints, watchpoints, recorder and heatmap
+        now set.
+        """
+        instruction = self.decoded[address]
+        writes_m = instruction[0] != A_INSTRUCTION and instruction[3] & DEST_M
+        reads_m = instruction[0] != A_INSTRUCTION and instruction[2]
+        if writes_m and self.watchpoints:
+            instruction = (WATCHED, instruction)
+        if (reads_m or writes_m) and self.heatmap is not None:
+            instruction = (COUNTED, instruction, reads_m, writes_m)
+        if self.recorder is not None:
+            instruction = (TRACED, instruction, writes_m)
+        if address in self.breakpoints:
+            instruction = (BREAKPOINT, instruction)
+        self.program[address] = instruction
+
+    def wrap_all(self) -> None:
+        """Rebuilds every program entry, see wrap()."""
+        for address in range(len(self.decoded)):
+            self.wrap(address)
+
+    def add_breakpoint(self, location: typing.Union[str, int]) -> None:
+        """Stops run() before the instruction at a ROM address or label."""
+        address = self.resolve(location)
+        self.breakpoints.add(address)
+        self.wrap(address)
+
+    def remove_breakpoint(self, location: typing.Union[str, int]) -> None:
+        """Removes the breakpoint at a ROM address or label."""
+        address = self.resolve(location)
+        self.breakpoints.discard(address)
+        self.wrap(address)
+
+    def add_watchpoint(self, location: typing.Union[str, int]) -> None:
+        """Stops run() right after a write to a RAM address or variable
+        (e.g. "SP", "LCL" or "Foo.3"). The address, old and new values are
+        kept in watch_hit.
+        """
+        armed = bool(self.watchpoints)
+        self.watchpoints.add(self.resolve(location))
+        if not armed:
+            self.wrap_all()
+
+    def remove_watchpoint(self, location: typing.Union[str, int]) -> None:
+        """Removes a watchpoint. Removing the last one disarms them."""
+        self.watchpoints.discard(self.resolve(location))
+        if not self.watchpoints:
+            self.wrap_all()
+
+    def set_recorder(self, recorder) -> None:
+        """Attaches a trace recorder (see TraceRecorder), or detaches it when
+        given None. The recorder gets record(pc, a, d, address, value) after
+        every instruction (address is -1 if nothing was written) and
+        halted(emulator, reason) whenever run() stops for a reason other than
+        its cycle budget. While it is attached every instruction takes the
+        slow path of run().
+        """
+        self.recorder = recorder
+        self.wrap_all()
+
+    def set_heatmap(self, heatmap) -> None:
+        """Attaches a RAM heatmap (see RAMHeatmap), or detaches it when given
+        None. Every read and write of M adds one to heatmap.reads[address] or
+        heatmap.writes[address]. Only the instructions that access M leave
+        the fast path, and the periods skipped by idle-loop fast-forwarding
+        are not counted.
+        """
+        self.heatmap = heatmap
+        self.wrap_all()
+
+    def step(self) -> str:
+        """Executes a single instruction.
+
+        Returns:
+            str: the reason the emulator stopped, as in run().
+        """
+        return self.run(1)
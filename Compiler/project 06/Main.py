@@ -15,12 +15,16 @@ from Code import Code
 C_COMMAND_INITIAL = "111"
 
 def assemble_file(
-        input_file: typing.TextIO, output_file: typing.TextIO) -> None:
+        input_file: typing.TextIO, output_file: typing.TextIO) -> SymbolTable:
     """Assembles a single file.
 
     Args:
         input_file (typing.TextIO): the file to assemble.
         output_file (typing.TextIO): writes all output to this file.
+
+    Returns:
+        SymbolTable: the labels and variables of the file, e.g. for setting
+        breakpoints and watchpoints in the CPU emulator.
     """
     # Your code goes here!
     # A good place to start is to initialize a new Parser object:
@@ -32,6 +36,7 @@ def assemble_file(
     first_pass(parser, symbol_table)
     parser.current_line = Parser.INITIAL_INDEX
     second_pass(parser, symbol_table, output_file)
+    return symbol_table
 
 
 def first_pass(parser: Parser, symbol_table: SymbolTable) -> None:
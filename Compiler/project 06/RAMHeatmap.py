@@ -0,0 +1,122 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import array
+import os
+import sys
+import typing
+from CPUEmulator import CPUEmulator, RAM_SIZE, SCREEN, KBD
+from TraceRecorder import load_symbol_map
+
+# (name, first address, end address) of the RAM regions the VM translator
+# uses. statics are allocated by the assembler from 16, the stack starts at
+# 256 and the heap at 2048.
+REGIONS = [("pointers (SP LCL ARG THIS THAT)", 0, 5),
+           ("temp (R5-R12)", 5, 13),
+           ("scratch (R13-R15)", 13, 16),
+           ("static", 16, 256),
+           ("stack", 256, 2048),
+           ("heap", 2048, SCREEN),
+           ("screen", SCREEN, KBD),
+           ("keyboard", KBD, KBD + 1)]
+BAR_WIDTH = 40
+BAR_CHAR = "#"
+
+
+class RAMHeatmap:
+    """
+    Counts the reads and writes of every RAM address made by a CPUEmulator,
+    in two counter arrays allocated once, and summarizes them by the regions
+    of the VM memory layout.
+    """
+
+    def __init__(self) -> None:
+        self.reads = array.array("Q", [0]) * RAM_SIZE
+        self.writes = array.array("Q", [0]) * RAM_SIZE
+        self.variables = {}
+
+    def attach(self, emulator: CPUEmulator) -> None:
+        """Starts counting the RAM accesses of the given emulator."""
+        emulator.set_heatmap(self)
+
+    def load_symbols(self, variables: typing.Dict[str, int]) -> None:
+        """Sets the variable names shown next to addresses, see
+        TraceRecorder.load_symbol_map.
+        """
+        self.variables = {}
+        for symbol, address in variables.items():
+            self.variables.setdefault(address, symbol)
+
+    def clear(self) -> None:
+        for address in range(RAM_SIZE):
+            self.reads[address] = 0
+            self.writes[address] = 0
+
+    def summary(self) -> typing.List[typing.Tuple[str, int, int, int]]:
+        """Returns (region, addresses touched, reads, writes) of every region."""
+        rows = []
+        for name, first, end in REGIONS:
+            reads = sum(self.reads[first:end])
+            writes = sum(self.writes[first:end])
+            touched = sum(1 for address in range(first, end)
+                          if self.reads[address] or self.writes[address])
+            rows.append((name, touched, reads, writes))
+        return rows
+
+    def write(self, output: typing.TextIO) -> None:
+        """Writes the heatmap: the totals of every region, then every address
+        that was accessed, with a bar proportional to its accesses.
+        """
+        total = sum(self.reads) + sum(self.writes)
+        output.write("// RAM heatmap: " + str(sum(self.reads)) + " reads, "
+                     + str(sum(self.writes)) + " writes\n")
+        output.write("region".ljust(34) + "touched".rjust(9) + "reads".rjust(12)
+                     + "writes".rjust(12) + "share".rjust(8) + "\n")
+        for name, touched, reads, writes in self.summary():
+            share = (reads + writes) / total if total else 0
+            output.write(name.ljust(34) + str(touched).rjust(9)
+                         + str(reads).rjust(12) + str(writes).rjust(12)
+                         + "{:.1%}".format(share).rjust(8) + "\n")
+        output.write("\n" + "address".ljust(8) + "symbol".ljust(20)
+                     + "reads".rjust(12) + "writes".rjust(12) + "  heat\n")
+        hottest = max(self.reads[address] + self.writes[address]
+                      for address in range(RAM_SIZE))
+        for address in range(RAM_SIZE):
+            accesses = self.reads[address] + self.writes[address]
+            if not accesses:
+                continue
+            bar = BAR_CHAR * max(1, round(BAR_WIDTH * accesses / hottest))
+            output.write(str(address).ljust(8)
+                         + self.variables.get(address, "").ljust(20)
+                         + str(self.reads[address]).rjust(12)
+                         + str(self.writes[address]).rjust(12)
+                         + "  " + bar + "\n")
+
+
+if "__main__" == __name__:
+    # Runs a .hack program and writes the heatmap of its RAM accesses, e.g.:
+    # RAMHeatmap Prog.hack 1000000 Prog.heatmap
+    # Variable names are taken from Prog.asm, if it is next to Prog.hack.
+    if len(sys.argv) not in [3, 4]:
+        sys.exit("Invalid usage, please use: RAMHeatmap <hack file> "
+                 "<max cycles> [output path]")
+    hack_path = os.path.abspath(sys.argv[1])
+    emulator = CPUEmulator()
+    with open(hack_path, "r") as hack_file:
+        emulator.load(hack_file)
+    heatmap = RAMHeatmap()
+    asm_path = os.path.splitext(hack_path)[0] + ".asm"
+    if os.path.isfile(asm_path):
+        with open(asm_path, "r") as asm_file:
+            heatmap.load_symbols(load_symbol_map(asm_file)[1])
+    heatmap.attach(emulator)
+    emulator.run(int(sys.argv[2]))
+    if len(sys.argv) == 4:
+        with open(sys.argv[3], "w") as output_file:
+            heatmap.write(output_file)
+    else:
+        heatmap.write(sys.stdout)
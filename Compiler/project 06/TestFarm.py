@@ -0,0 +1,262 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import re
+import sys
+import time
+import typing
+import xml.etree.ElementTree as ElementTree
+from CPUEmulator import CPUEmulator
+import TestScript
+
+HACK_EXTENSION = ".hack"
+ASM_EXTENSION = ".asm"
+TEST_EXTENSION = ".tst"
+VM_TEST_SUFFIX = "VME.tst"
+HISTORY_FILE = ".testfarm_history.json"
+DEFAULT_MAX_CYCLES = 50000000
+DEFAULT_TIME_LIMIT = 120.0
+RAM_VARIABLE = re.compile(r"^RAM\[(\d+)\]$")
+PASSED = "passed"
+FAILED = "failed"
+ERROR = "error"
+
+
+class CPUTestTarget:
+    """Exposes a CPUEmulator to a TestScript.ScriptRunner: variables are
+    RAM[i], A, D, PC and time, and "ticktock"/"tock" execute one instruction.
+    """
+    step_commands = ["ticktock", "tock"]
+
+    def __init__(self) -> None:
+        self.emulator = CPUEmulator()
+
+    def load(self, path: str) -> None:
+        """Loads the assembled program. Scripts load Xxx.asm, and the
+        assembler writes its output next to it as Xxx.hack.
+        """
+        filename, extension = os.path.splitext(path)
+        if extension.lower() == ASM_EXTENSION:
+            path = filename + HACK_EXTENSION
+        if not os.path.isfile(path):
+            raise TestScript.ScriptError("not assembled: " + path)
+        with open(path, "r") as hack_file:
+            self.emulator.load(hack_file)
+
+    def get_value(self, name: str) -> int:
+        match = RAM_VARIABLE.match(name)
+        if match:
+            return self.emulator.ram[int(match.group(1))]
+        if name == "A":
+            return self.emulator.a
+        if name == "D":
+            return self.emulator.d
+        if name == "PC":
+            return self.emulator.pc
+        if name == "time":
+            return self.emulator.cycles
+        raise TestScript.ScriptError("unknown variable: " + name)
+
+    def set_value(self, name: str, value: int) -> None:
+        match = RAM_VARIABLE.match(name)
+        if match:
+            self.emulator.ram[int(match.group(1))] = value
+        elif name == "A":
+            self.emulator.a = value
+        elif name == "D":
+            self.emulator.d = value
+        elif name == "PC":
+            self.emulator.pc = value
+        else:
+            raise TestScript.ScriptError("unknown variable: " + name)
+
+    def run(self, steps: int) -> int:
+        before = self.emulator.cycles
+        self.emulator.run(steps)
+        return self.emulator.cycles - before
+
+    def cycles(self) -> int:
+        return self.emulator.cycles
+
+
+class TestResult:
+    """The outcome of a single test script."""
+
+    def __init__(self, name: str, status: str, message: str,
+                 cycles: int, seconds: float) -> None:
+        self.name = name
+        self.status = status
+        self.message = message
+        self.cycles = cycles
+        self.seconds = seconds
+
+
+def discover_tests(root: str) -> typing.List[typing.Tuple[str, str]]:
+    """Finds every Xxx.tst script that has an assembled Xxx.hack next to it.
+
+    Args:
+        root (str): the directory to search recursively.
+
+    Returns:
+        a sorted list of (hack path, test script path) pairs.
+    """
+    tests = []
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            if not filename.endswith(TEST_EXTENSION) \
+                    or filename.endswith(VM_TEST_SUFFIX):
+                continue
+            stem = filename[:-len(TEST_EXTENSION)]
+            hack_path = os.path.join(directory, stem + HACK_EXTENSION)
+            if os.path.isfile(hack_path):
+                tests.append((hack_path, os.path.join(directory, filename)))
+    return sorted(tests)
+
+
+def schedule(tests: typing.List[typing.Tuple[str, str]], root: str,
+             history: typing.Dict[str, int]) -> typing.List[typing.Tuple[str, str]]:
+    """Orders the tests longest job first, by the cycles they took last time.
+    Tests without history go first, since they may be the longest of all.
+    """
+    def expected_cycles(test):
+        name = test_name(test[1], root)
+        return history.get(name, sys.maxsize)
+    return sorted(tests, key=expected_cycles, reverse=True)
+
+
+def test_name(test_path: str, root: str) -> str:
+    return os.path.relpath(test_path, root).replace(os.sep, "/")
+
+
+def load_history(history_path: str) -> typing.Dict[str, int]:
+    if not os.path.isfile(history_path):
+        return {}
+    with open(history_path, "r") as history_file:
+        return json.load(history_file)
+
+
+def save_history(history_path: str, history: typing.Dict[str, int],
+                 results: typing.List[TestResult]) -> None:
+    for result in results:
+        if result.status != ERROR:
+            history[result.name] = result.cycles
+    with open(history_path, "w") as history_file:
+        json.dump(history, history_file, indent=1, sort_keys=True)
+
+
+def run_script(name: str, test_path: str, target, steps: typing.Callable[[], int],
+               max_steps: int, time_limit: float, fail_fast: bool = False) -> TestResult:
+    """Runs a single test script on a target. Any error of the script is
+    returned as an ERROR result rather than raised, which would abort the
+    whole run.
+
+    Args:
+        name (str): the name of the test in the results.
+        test_path (str): the path of the script.
+        target: the simulation target (see TestScript.ScriptRunner).
+        steps (typing.Callable[[], int]): returns the steps the target ran.
+        max_steps (int): the step budget of the script (0 = no limit).
+        time_limit (float): the wall time budget in seconds (0 = no limit).
+        fail_fast (bool): stop at the first line of output that differs from
+        the compare-to file.
+    """
+    start = time.monotonic()
+    runner = TestScript.ScriptRunner(target, os.path.dirname(test_path),
+                                     max_steps, time_limit, fail_fast)
+    try:
+        with open(test_path, "r") as test_file:
+            commands = TestScript.parse(test_file.read())
+        runner.run(commands)
+        mismatch = runner.compare()
+    except TestScript.ComparisonFailure as failure:
+        mismatch = failure.line
+    except Exception as error:
+        return TestResult(name, ERROR, type(error).__name__ + ": " + str(error),
+                          steps(), time.monotonic() - start)
+    if mismatch:
+        status, message = FAILED, "comparison failure at line " + str(mismatch)
+    else:
+        status, message = PASSED, ""
+    return TestResult(name, status, message, steps(), time.monotonic() - start)
+
+
+def run_test(name: str, test_path: str, max_cycles: int,
+             time_limit: float) -> TestResult:
+    """Runs a single test script on the CPU emulator. Executed in the
+    worker processes.
+    """
+    target = CPUTestTarget()
+    return run_script(name, test_path, target, target.cycles, max_cycles, time_limit)
+
+
+def run_tests(root: str, jobs: int, max_cycles: int, time_limit: float,
+              history: typing.Dict[str, int]) -> typing.List[TestResult]:
+    """Runs every test under root on a pool of worker processes."""
+    tests = schedule(discover_tests(root), root, history)
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(run_test, test_name(test_path, root), test_path,
+                               max_cycles, time_limit)
+                   for _, test_path in tests]
+        for future in concurrent.futures.as_completed(futures):
+            results.append(future.result())
+    return sorted(results, key=lambda result: result.name)
+
+
+def write_junit_report(results: typing.List[TestResult], report_path: str) -> None:
+    """Writes the results as a JUnit XML report."""
+    suite = ElementTree.Element("testsuite", {
+        "name": "hack",
+        "tests": str(len(results)),
+        "failures": str(sum(result.status == FAILED for result in results)),
+        "errors": str(sum(result.status == ERROR for result in results)),
+        "time": "%.3f" % sum(result.seconds for result in results)})
+    for result in results:
+        directory, _, filename = result.name.rpartition("/")
+        case = ElementTree.SubElement(suite, "testcase", {
+            "classname": directory.replace("/", ".") or "hack",
+            "name": filename,
+            "time": "%.3f" % result.seconds})
+        if result.status == FAILED:
+            ElementTree.SubElement(case, "failure", {"message": result.message})
+        elif result.status == ERROR:
+            ElementTree.SubElement(case, "error", {"message": result.message})
+        ElementTree.SubElement(case, "system-out").text = \
+            "cycles: " + str(result.cycles)
+    ElementTree.ElementTree(suite).write(report_path, encoding="utf-8",
+                                         xml_declaration=True)
+
+
+if "__main__" == __name__:
+    # Runs every assembled test under the given directory and writes a JUnit
+    # report. Tests are Xxx.tst scripts next to the assembler's Xxx.hack.
+    arg_parser = argparse.ArgumentParser(
+        description="Runs Hack test scripts on all cores.")
+    arg_parser.add_argument("root", help="directory to search for tests")
+    arg_parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    arg_parser.add_argument("--max-cycles", type=int, default=DEFAULT_MAX_CYCLES)
+    arg_parser.add_argument("--time-limit", type=float, default=DEFAULT_TIME_LIMIT,
+                            help="wall time per script in seconds, checked "
+                                 "every TestScript.RUN_CHUNK (1M) cycles, "
+                                 "so a script may overrun it by one chunk")
+    arg_parser.add_argument("--report", default="junit.xml")
+    arguments = arg_parser.parse_args()
+    root_path = os.path.abspath(arguments.root)
+    history_path = os.path.join(root_path, HISTORY_FILE)
+    test_history = load_history(history_path)
+    test_results = run_tests(root_path, arguments.jobs, arguments.max_cycles,
+                             arguments.time_limit, test_history)
+    save_history(history_path, test_history, test_results)
+    write_junit_report(test_results, arguments.report)
+    for test_result in test_results:
+        print(test_result.status.upper(), test_result.name, test_result.message)
+    if any(test_result.status != PASSED for test_result in test_results):
+        sys.exit(1)
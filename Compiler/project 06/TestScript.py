@@ -0,0 +1,351 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import os
+import time
+import typing
+
+SEPARATORS = [",", ";", "!"]
+BLOCK_OPEN = "{"
+BLOCK_CLOSE = "}"
+QUOTE = "\""
+REPEAT = "repeat"
+WHILE = "while"
+DEFAULT_FORMAT = "D1.6.1"
+WILDCARD = "*"
+CONDITIONS = {"=": lambda x, y: x == y, "<>": lambda x, y: x != y,
+              "<": lambda x, y: x < y, ">": lambda x, y: x > y,
+              "<=": lambda x, y: x <= y, ">=": lambda x, y: x >= y}
+# commands of the official simulators that do not affect the simulation
+IGNORED_COMMANDS = ["echo", "clear-echo", "breakpoint", "clear-breakpoints",
+                    "tick", "eval"]
+# the steps of a bulk run between two checks of the step and time budgets
+RUN_CHUNK = 1000000
+
+
+class ScriptError(Exception):
+    """Raised for malformed scripts and for scripts exceeding their limits."""
+
+
+class ComparisonFailure(ScriptError):
+    """Raised as soon as an output line differs from the compare-to file,
+    when the runner compares while the script runs.
+    """
+
+    def __init__(self, line: int) -> None:
+        super().__init__("comparison failure at line " + str(line))
+        self.line = line
+
+
+class ScriptCommand:
+    """A single script command. Blocks (repeat/while) keep their commands in
+    body; args holds the repeat count or the while condition.
+    """
+
+    def __init__(self, name: str, args: typing.List[str],
+                 body: typing.Optional[typing.List["ScriptCommand"]] = None) -> None:
+        self.name = name
+        self.args = args
+        self.body = body
+
+
+class OutputColumn:
+    """A variable of an output-list together with its print format, e.g.
+    RAM[0]%D2.6.2: decimal, 2 spaces to the left, 6 characters wide and 2
+    spaces to the right.
+    """
+
+    def __init__(self, spec: str) -> None:
+        name, _, fmt = spec.partition("%")
+        fmt = fmt or DEFAULT_FORMAT
+        self.name = name
+        self.base = fmt[0].upper()
+        pad_left, width, pad_right = fmt[1:].split(".")
+        self.pad_left = int(pad_left)
+        self.width = int(width)
+        self.pad_right = int(pad_right)
+
+    def header(self) -> str:
+        """Returns the column title, centered over the whole column."""
+        total = self.pad_left + self.width + self.pad_right
+        title = self.name[:total]
+        left = (total - len(title)) // 2
+        return " " * left + title + " " * (total - left - len(title))
+
+    def format(self, value: int) -> str:
+        """Returns the given 16-bit word printed in this column's format."""
+        value &= 0xFFFF
+        if self.base == "X":
+            text = format(value, "04X")
+        elif self.base == "B":
+            text = format(value, "016b")
+        else:
+            text = str(value - 0x10000 if value & 0x8000 else value)
+        text = text[-self.width:].rjust(self.width)
+        return " " * self.pad_left + text + " " * self.pad_right
+
+
+def tokenize(script: str) -> typing.List[str]:
+    """Splits a script into words, block braces, separators and quoted
+    strings, dropping // and /* */ comments.
+    """
+    tokens = []
+    i = 0
+    length = len(script)
+    while i < length:
+        char = script[i]
+        if script.startswith("//", i):
+            i = script.find("\n", i)
+            i = length if i == -1 else i
+        elif script.startswith("/*", i):
+            i = script.find("*/", i)
+            i = length if i == -1 else i + 2
+        elif char.isspace():
+            i += 1
+        elif char == QUOTE:
+            end = script.find(QUOTE, i + 1)
+            end = length if end == -1 else end
+            tokens.append(script[i:end + 1])
+            i = end + 1
+        elif char in SEPARATORS or char in [BLOCK_OPEN, BLOCK_CLOSE]:
+            tokens.append(char)
+            i += 1
+        else:
+            start = i
+            while i < length and not script[i].isspace() \
+                    and script[i] not in SEPARATORS \
+                    and script[i] not in [BLOCK_OPEN, BLOCK_CLOSE, QUOTE] \
+                    and not script.startswith("//", i):
+                i += 1
+            tokens.append(script[start:i])
+    return tokens
+
+
+def parse(script: str) -> typing.List[ScriptCommand]:
+    """Parses the text of a .tst script into a list of commands."""
+    tokens = tokenize(script)
+    commands, index = parse_block(tokens, 0)
+    if index != len(tokens):
+        raise ScriptError("unexpected '" + tokens[index] + "'")
+    return commands
+
+
+def parse_block(tokens: typing.List[str], index: int) \
+        -> typing.Tuple[typing.List[ScriptCommand], int]:
+    """Parses commands until the end of the tokens or a closing brace.
+
+    Returns:
+        the parsed commands and the index of the first unparsed token.
+    """
+    commands = []
+    words = []
+    while index < len(tokens) and tokens[index] != BLOCK_CLOSE:
+        token = tokens[index]
+        index += 1
+        if token in SEPARATORS:
+            if words:
+                commands.append(ScriptCommand(words[0], words[1:]))
+            words = []
+        elif token == BLOCK_OPEN:
+            if not words or words[0] not in [REPEAT, WHILE]:
+                raise ScriptError("a block must follow repeat or while")
+            body, index = parse_block(tokens, index)
+            if index == len(tokens):
+                raise ScriptError("missing '}'")
+            index += 1
+            commands.append(ScriptCommand(words[0], words[1:], body))
+            words = []
+        else:
+            words.append(token)
+    if words:
+        commands.append(ScriptCommand(words[0], words[1:]))
+    return commands, index
+
+
+def parse_value(text: str) -> int:
+    """Parses a script number: decimal, or %D/%X/%B prefixed."""
+    if text.startswith("%"):
+        base = {"D": 10, "X": 16, "B": 2}[text[1].upper()]
+        return int(text[2:], base) & 0xFFFF
+    return int(text) & 0xFFFF
+
+
+def compare_lines(output: typing.List[str], expected: typing.List[str]) -> int:
+    """Compares output lines to the lines of a .cmp file, where a "*" in the
+    compare file matches any character.
+
+    Returns:
+        int: the (1-based) number of the first mismatching line, 0 if none.
+    """
+    for number in range(max(len(output), len(expected))):
+        if number >= len(output) or number >= len(expected):
+            return number + 1
+        actual = output[number].rstrip()
+        wanted = expected[number].rstrip()
+        if len(actual) != len(wanted):
+            return number + 1
+        for actual_char, wanted_char in zip(actual, wanted):
+            if wanted_char != WILDCARD and actual_char != wanted_char:
+                return number + 1
+    return 0
+
+
+class ScriptRunner:
+    """
+    Executes a parsed test script against a simulation target. The target
+    provides:
+        load(path), get_value(name) -> int, set_value(name, value),
+        run(steps) -> int (the number of steps actually executed),
+        step_commands (the script commands that advance by one step).
+    A repeat block that contains nothing but step commands is handed to the
+    target as one bulk run() instead of being interpreted step by step.
+    """
+
+    def __init__(self, target, script_dir: str, max_steps: int = 0,
+                 time_limit: float = 0, fail_fast: bool = False) -> None:
+        """
+        Args:
+            target: the simulation target.
+            script_dir (str): relative file names are resolved from here.
+            max_steps (int): total step budget of the script (0 = no limit).
+            time_limit (float): wall time budget in seconds (0 = no limit).
+            It is checked after every step command and every RUN_CHUNK
+            steps of a bulk run, so a script can overrun it by one chunk
+            (about half a second of the CPU emulator).
+            fail_fast (bool): compare every output line to the compare-to
+            file as it is written, and stop the script at the first
+            mismatch with a ComparisonFailure.
+        """
+        self.target = target
+        self.script_dir = script_dir
+        self.max_steps = max_steps
+        self.time_limit = time_limit
+        self.deadline = 0
+        self.steps = 0
+        self.columns = []
+        self.output = []
+        self.output_path = ""
+        self.compare_path = ""
+        self.fail_fast = fail_fast
+        self.expected = None
+
+    def run(self, commands: typing.List[ScriptCommand]) -> None:
+        """Executes the commands, then writes the output file (if any)."""
+        if self.time_limit:
+            self.deadline = time.monotonic() + self.time_limit
+        try:
+            self.execute_block(commands)
+        finally:
+            if self.output_path:
+                with open(self.output_path, "w") as output_file:
+                    output_file.writelines(line + "\n" for line in self.output)
+
+    def compare(self) -> int:
+        """Compares the output to the compare-to file.
+
+        Returns:
+            int: the first mismatching line number, 0 if the output matches.
+        """
+        if not self.compare_path:
+            return 0
+        with open(self.compare_path, "r") as compare_file:
+            expected = compare_file.read().splitlines()
+        return compare_lines(self.output, expected)
+
+    def write_output(self, line: str) -> None:
+        """Adds a line to the output, comparing it right away if fail_fast
+        is set.
+        """
+        self.output.append(line)
+        if not self.fail_fast or not self.compare_path:
+            return
+        if self.expected is None:
+            with open(self.compare_path, "r") as compare_file:
+                self.expected = compare_file.read().splitlines()
+        number = len(self.output)
+        if compare_lines([line], self.expected[number - 1:number]):
+            raise ComparisonFailure(number)
+
+    def resolve(self, filename: str) -> str:
+        return os.path.join(self.script_dir, filename)
+
+    def execute_block(self, commands: typing.List[ScriptCommand]) -> None:
+        for command in commands:
+            self.execute(command)
+
+    def execute(self, command: ScriptCommand) -> None:
+        name = command.name
+        if name in self.target.step_commands:
+            self.advance(1)
+        elif name == REPEAT:
+            self.execute_repeat(command)
+        elif name == WHILE:
+            while self.evaluate(command.args):
+                self.execute_block(command.body)
+        elif name == "set":
+            self.target.set_value(command.args[0], parse_value(command.args[1]))
+        elif name == "output":
+            self.write_output("|" + "|".join(
+                column.format(self.target.get_value(column.name))
+                for column in self.columns) + "|")
+        elif name == "output-list":
+            self.columns = [OutputColumn(spec) for spec in command.args]
+            self.write_output("|" + "|".join(
+                column.header() for column in self.columns) + "|")
+        elif name == "output-file":
+            self.output_path = self.resolve(command.args[0])
+        elif name == "compare-to":
+            self.compare_path = self.resolve(command.args[0])
+        elif name == "load":
+            self.target.load(self.resolve(command.args[0]) if command.args
+                             else self.script_dir)
+        elif name not in IGNORED_COMMANDS:
+            raise ScriptError("unknown script command: " + name)
+
+    def execute_repeat(self, command: ScriptCommand) -> None:
+        count = int(command.args[0]) if command.args else -1
+        step_commands = self.target.step_commands
+        if all(inner.name in step_commands for inner in command.body):
+            steps = len(command.body)
+            if count < 0:
+                while self.advance(RUN_CHUNK) == RUN_CHUNK:
+                    pass
+            else:
+                self.advance(count * steps)
+            return
+        while count != 0:
+            self.execute_block(command.body)
+            count -= 1
+
+    def evaluate(self, condition: typing.List[str]) -> bool:
+        left, operator, right = condition
+        return CONDITIONS[operator](self.target.get_value(left), parse_value(right))
+
+    def advance(self, steps: int) -> int:
+        """Runs the target for the given number of steps, in chunks so that
+        the step and time budgets are enforced.
+
+        Returns:
+            int: the number of steps the target actually executed.
+        """
+        done = 0
+        while done < steps:
+            chunk = min(steps - done, RUN_CHUNK)
+            if self.max_steps:
+                chunk = min(chunk, self.max_steps - self.steps)
+                if chunk <= 0:
+                    raise ScriptError("cycle limit exceeded ("
+                                      + str(self.max_steps) + ")")
+            executed = self.target.run(chunk)
+            done += executed
+            self.steps += executed
+            if self.deadline and time.monotonic() > self.deadline:
+                raise ScriptError("time limit exceeded ("
+                                  + str(self.time_limit) + "s)")
+            if executed < chunk:
+                break
+        return done
@@ -0,0 +1,190 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import array
+import bisect
+import io
+import sys
+import typing
+import Main
+from Code import dest_table, jump_table, comp_table
+from CPUEmulator import CPUEmulator, to_signed, HALT_END, HALT_IDLE, \
+    HALT_BREAKPOINT, HALT_WATCHPOINT, HALT_ERROR, SIGN_BIT
+from Parser import Parser
+from SymbolTable import SymbolTable
+
+DEFAULT_CAPACITY = 4096
+DEFAULT_DUMP_ON = [HALT_END, HALT_IDLE, HALT_BREAKPOINT, HALT_WATCHPOINT,
+                   HALT_ERROR]
+NO_WRITE = -1
+
+# reversed assembler tables, for disassembling the traced instructions
+dest_names = {code: mnemonic for mnemonic, code in dest_table.items()}
+jump_names = {code: mnemonic for mnemonic, code in jump_table.items()}
+comp_names = {code: mnemonic for mnemonic, code in comp_table.items()
+              if "<" not in mnemonic and ">" not in mnemonic}
+shift_names = {code: mnemonic for mnemonic, code in comp_table.items()
+               if "<" in mnemonic or ">" in mnemonic}
+
+
+def load_symbol_map(input_file: typing.TextIO) \
+        -> typing.Tuple[typing.Dict[str, int], typing.Dict[str, int]]:
+    """Runs the assembler over an .asm file and splits its symbol table.
+
+    Args:
+        input_file (typing.TextIO): the assembly source of the program.
+
+    Returns:
+        the labels (ROM addresses, found by the first pass) and the
+        variables (RAM addresses: predefined symbols and allocated ones).
+    """
+    source = input_file.read()
+    label_table = SymbolTable()
+    Main.first_pass(Parser(io.StringIO(source)), label_table)
+    predefined = SymbolTable().table
+    labels = {symbol: address for symbol, address in label_table.table.items()
+              if symbol not in predefined}
+    symbol_table = Main.assemble_file(io.StringIO(source), io.StringIO())
+    variables = {symbol: address for symbol, address in symbol_table.table.items()
+                 if symbol not in labels}
+    return labels, variables
+
+
+class TraceRecorder:
+    """
+    Keeps the last N instructions executed by a CPUEmulator in a ring buffer:
+    the PC of each instruction, the A and D registers after it, and the RAM
+    write it made (if any). The buffer is allocated once, as flat arrays, so
+    recording a cycle only overwrites existing slots.
+
+    Attaching the recorder (emulator.set_recorder) is the only change needed
+    to start recording. The buffer is dumped when the emulator stops for one
+    of the dump_on reasons, or whenever dump() is called.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY,
+                 output: typing.Optional[typing.TextIO] = None,
+                 dump_on: typing.Optional[typing.List[str]] = None) -> None:
+        """
+        Args:
+            capacity (int): how many instructions to keep.
+            output (typing.TextIO): where dumps go (standard error if None).
+            dump_on (typing.List[str]): the halt reasons that dump the trace.
+        """
+        self.capacity = capacity
+        self.output = output
+        self.dump_on = DEFAULT_DUMP_ON if dump_on is None else dump_on
+        self.pcs = array.array("H", [0]) * capacity
+        self.a_values = array.array("H", [0]) * capacity
+        self.d_values = array.array("H", [0]) * capacity
+        self.write_addresses = array.array("l", [NO_WRITE]) * capacity
+        self.write_values = array.array("H", [0]) * capacity
+        self.next = 0
+        self.count = 0
+        self.labels = {}
+        self.variables = {}
+        self.label_addresses = []
+        self.label_names = []
+        self.label_at = {}
+        self.emulator = None
+
+    def attach(self, emulator: CPUEmulator) -> None:
+        """Starts recording the given emulator."""
+        self.emulator = emulator
+        emulator.set_recorder(self)
+
+    def load_symbols(self, labels: typing.Dict[str, int],
+                     variables: typing.Dict[str, int]) -> None:
+        """Sets the symbols used to decode the trace, see load_symbol_map."""
+        self.labels = labels
+        self.variables = {}
+        for symbol, address in variables.items():
+            self.variables.setdefault(address, symbol)
+        by_address = sorted((address, symbol) for symbol, address in labels.items())
+        self.label_addresses = [address for address, _ in by_address]
+        self.label_names = [symbol for _, symbol in by_address]
+        self.label_at = {}
+        for address, symbol in by_address:
+            self.label_at.setdefault(address, symbol)
+
+    def record(self, pc: int, a: int, d: int, address: int, value: int) -> None:
+        """Records one executed instruction."""
+        index = self.next
+        self.pcs[index] = pc
+        self.a_values[index] = a
+        self.d_values[index] = d
+        self.write_addresses[index] = address
+        self.write_values[index] = value
+        index += 1
+        self.next = 0 if index == self.capacity else index
+        self.count += 1
+
+    def entries(self) -> typing.List[typing.Tuple[int, int, int, int, int]]:
+        """Returns the recorded (pc, a, d, write address, written value)
+        tuples, oldest first.
+        """
+        kept = min(self.count, self.capacity)
+        first = (self.next - kept) % self.capacity
+        return [(self.pcs[index], self.a_values[index], self.d_values[index],
+                 self.write_addresses[index], self.write_values[index])
+                for index in ((first + offset) % self.capacity
+                              for offset in range(kept))]
+
+    def halted(self, emulator: CPUEmulator, reason: str) -> None:
+        """Called by the emulator whenever run() stops early."""
+        if reason in self.dump_on:
+            self.dump(self.output or sys.stderr, reason)
+
+    def dump(self, output: typing.TextIO, reason: str = "") -> None:
+        """Writes the recorded instructions, oldest first, decoded against
+        the symbols of the program.
+        """
+        entries = self.entries()
+        output.write("// trace: last " + str(len(entries)) + " of "
+                     + str(self.count) + " instructions"
+                     + (" (" + reason + ")" if reason else "") + "\n")
+        for pc, a, d, address, value in entries:
+            line = str(pc).rjust(5) + "  " + self.location(pc).ljust(28) \
+                + self.disassemble(pc).ljust(16) \
+                + "A=" + str(to_signed(a)).ljust(7) + "D=" + str(to_signed(d)).ljust(7)
+            if address != NO_WRITE:
+                line += self.variable(address) + "=" + str(to_signed(value))
+            output.write(line.rstrip() + "\n")
+
+    def location(self, pc: int) -> str:
+        """Returns pc as an offset from the closest label before it."""
+        index = bisect.bisect_right(self.label_addresses, pc) - 1
+        if index < 0:
+            return ""
+        offset = pc - self.label_addresses[index]
+        return self.label_names[index] + ("+" + str(offset) if offset else "")
+
+    def variable(self, address: int) -> str:
+        symbol = self.variables.get(address)
+        return "RAM[" + str(address) + "]" + ("(" + symbol + ")" if symbol else "")
+
+    def disassemble(self, pc: int) -> str:
+        """Returns the assembly of the instruction at pc."""
+        rom = self.emulator.rom if self.emulator is not None else []
+        if pc >= len(rom):
+            return ""
+        word = rom[pc]
+        if not word & SIGN_BIT:
+            # an @ followed by a jump loads a label, otherwise a variable
+            following = rom[pc + 1] if pc + 1 < len(rom) else 0
+            if following & SIGN_BIT and following & 7:
+                symbol = self.label_at.get(word)
+            else:
+                symbol = self.variables.get(word)
+            return "@" + (symbol or str(word))
+        bits = format(word, "016b")
+        names = shift_names if bits[:3] == Parser.SHIFT_INITIAL else comp_names
+        comp = names.get(bits[3:10], "?")
+        dest = dest_names[bits[10:13]]
+        jump = jump_names[bits[13:]]
+        return ("" if dest == Parser.NULL else dest + "=") + comp \
+            + ("" if jump == Parser.NULL else ";" + jump)
@@ -0,0 +1,48 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+
+# fragments collected before they are written to the output stream
+DEFAULT_CHUNK_FRAGMENTS = 4096
+
+
+class BufferedEmitter:
+    """
+    Collects the assembly fragments CodeWriter writes in a list and hands
+    them to the output stream in large chunks, joined into a single write()
+    call per chunk, instead of making a write() call per fragment. It has
+    the write() of a stream, so it can stand in for one. (writelines() would
+    still call write() for every fragment.)
+
+    write() is the append() of the list itself, which is cheaper than any
+    Python method, so the size of the chunk is checked by flush_if_full(),
+    once per VM command. Whatever was written is only in the output stream
+    after flush(), which must be called once the translation is done.
+    """
+
+    def __init__(self, output_stream: typing.TextIO,
+                 chunk_fragments: int = DEFAULT_CHUNK_FRAGMENTS) -> None:
+        """
+        Args:
+            output_stream (typing.TextIO): where the chunks are written.
+            chunk_fragments (int): the fragments to collect before writing.
+        """
+        self.output_stream = output_stream
+        self.chunk_fragments = chunk_fragments
+        self.fragments = []
+        self.write = self.fragments.append
+
+    def flush_if_full(self) -> None:
+        """Writes the collected fragments if there are enough of them."""
+        if len(self.fragments) >= self.chunk_fragments:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes the fragments collected so far to the output stream."""
+        self.output_stream.write("".join(self.fragments))
+        self.fragments.clear()
@@ -0,0 +1,202 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+from CodeWriter import CodeWriter, PUSH, ADD, CONSTANT, SEGMENT_POINTERS, \
+    MAX_CHAINED_INDEX
+
+# writes the top of the stack from D to memory
+SPILL_TOP = "//spill top of stack:\n@SP\nAM=M+1\nA=A-1\nM=D\n"
+# pops the top of the stack from memory to D
+FETCH_TOP = "@SP\nAM=M-1\nD=M\n"
+# the comp of binary commands, with y in D and x in M
+BINARY_COMPS = {"add": "D+M", "sub": "M-D", "and": "D&M", "or": "D|M"}
+UNARY_COMPS = {"neg": "-D", "not": "!D", "shiftleft": "D<<", "shiftright": "D>>"}
+
+
+class CachingCodeWriter(CodeWriter):
+    """
+    A CodeWriter that keeps the top of the stack in D between commands
+    whenever it can. While top_in_d is set, the stack in memory holds
+    everything but the top, and SP points to where the top would be.
+
+    Pushes, arithmetic, pops and if-goto work on D. The top is written to
+    memory (spilled) only before the commands that need the whole stack in
+    memory: labels and gotos (so that every path reaches a label the same
+    way), call, return, function, the comparisons and the superinstructions
+    that work on the stack in memory or find their address through D, and
+    at the end of every file, so that the code of a file does not depend on
+    the one before. A this or that entry that points to the top of the stack
+    itself does not see the value in D.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.top_in_d = False
+
+    def spill(self) -> None:
+        """Writes the top of the stack to memory, if it is in D."""
+        if self.top_in_d:
+            self.output_file.write(SPILL_TOP)
+            self.top_in_d = False
+
+    def top_to_d(self) -> None:
+        """Pops the top of the stack to D, from memory if it is not there."""
+        if self.top_in_d:
+            self.top_in_d = False
+        else:
+            self.output_file.write(FETCH_TOP)
+
+    def load_to_d(self, segment: str, index: int) -> str:
+        """Returns Assembly that puts an entry of a segment in D."""
+        if segment == CONSTANT:
+            return "@" + str(index) + "\nD=A\n"
+        return self.segment_address(segment, index) + "D=M\n"
+
+    def store_d(self, segment: str, index: int, keep: bool) -> str:
+        """Returns Assembly that stores D in an entry of a segment, and keeps
+        it in D if keep is set. After MAX_CHAINED_INDEX of local, argument,
+        this and that, the address is found without a second temporary: with
+        the value in R13 and value + address in D, A=D-A is the address and
+        M=D-A the value.
+        """
+        if segment in SEGMENT_POINTERS and index > MAX_CHAINED_INDEX:
+            return ("@R13\nM=D\n@" + SEGMENT_POINTERS[segment] + "\nD=D+M\n@" + str(index)
+                    + "\nD=D+A\n@R13\nA=M\nA=D-A\nM=D-A\n" + ("D=M\n" if keep else ""))
+        return self.segment_address(segment, index) + "M=D\n"
+
+    def write_push_pop(self, command: str, segment: str, index: int) -> None:
+        if command == PUSH:
+            self.spill()
+            self.output_file.write("//push " + segment + " " + str(index) + " to D:\n"
+                                   + self.load_to_d(segment, index))
+            self.top_in_d = True
+        else:
+            self.top_to_d()
+            self.output_file.write("//pop " + segment + " " + str(index) + " from D:\n"
+                                   + self.store_d(segment, index, False))
+
+    def binary(self, command: str) -> None:
+        """Replaces x and y with the result, in D."""
+        self.top_to_d()
+        self.output_file.write("//" + command + ":\n@SP\nAM=M-1\nD=" + BINARY_COMPS[command] + "\n")
+        self.top_in_d = True
+
+    def unary(self, command: str) -> None:
+        """Replaces the top of the stack with the result, in D."""
+        self.top_to_d()
+        self.output_file.write("//" + command + ":\nD=" + UNARY_COMPS[command] + "\n")
+        self.top_in_d = True
+
+    def add(self):
+        self.binary("add")
+
+    def sub(self):
+        self.binary("sub")
+
+    def and_(self):
+        self.binary("and")
+
+    def or_(self):
+        self.binary("or")
+
+    def neg(self):
+        self.unary("neg")
+
+    def not_(self):
+        self.unary("not")
+
+    def shift_left(self):
+        self.unary("shiftleft")
+
+    def shift_right(self):
+        self.unary("shiftright")
+
+    def eq(self):
+        self.spill()
+        super().eq()
+
+    def gt(self):
+        self.spill()
+        super().gt()
+
+    def lt(self):
+        self.spill()
+        super().lt()
+
+    def write_push_value(self, value: int) -> None:
+        self.spill()
+        if value in [-1, 0, 1]:
+            load = "D=" + str(value) + "\n"
+        elif value > 0:
+            load = "@" + str(value) + "\nD=A\n"
+        else:
+            load = "@" + str(~value) + "\nD=!A\n"
+        self.output_file.write("//push value " + str(value) + " to D:\n" + load)
+        self.top_in_d = True
+
+    def write_add_constant(self, command: str, value: int) -> None:
+        self.top_to_d()
+        self.output_file.write("//" + command + " constant:\n@" + str(value) + "\n"
+                               + ("D=D+A\n" if command == ADD else "D=D-A\n"))
+        self.top_in_d = True
+
+    def write_pop_push(self, segment: str, index: int) -> None:
+        self.top_to_d()
+        self.output_file.write("//pop and push back from D:\n"
+                               + self.store_d(segment, index, True))
+        self.top_in_d = True
+
+    def spill_for_address(self, segment: str, index: int) -> None:
+        """Spills the top of the stack if segment_address needs D for the
+        address of the entry.
+        """
+        if segment in SEGMENT_POINTERS and index > MAX_CHAINED_INDEX:
+            self.spill()
+
+    def write_increment(self, segment: str, index: int) -> None:
+        self.spill_for_address(segment, index)
+        super().write_increment(segment, index)
+
+    def write_decrement(self, segment: str, index: int) -> None:
+        self.spill_for_address(segment, index)
+        super().write_decrement(segment, index)
+
+    def write_array_store(self) -> None:
+        self.spill()
+        super().write_array_store()
+
+    def write_label(self, label: str) -> None:
+        self.spill()
+        super().write_label(label)
+
+    def write_goto(self, label: str) -> None:
+        self.spill()
+        super().write_goto(label)
+
+    def write_if(self, label: str) -> None:
+        self.top_to_d()
+        self.output_file.write("// if-goto:\n@" + self.create_decorated_label(label)
+                               + "\nD;JNE\n")
+
+    def write_function(self, function_name: str, n_vars: int) -> None:
+        self.spill()
+        super().write_function(function_name, n_vars)
+
+    def write_call(self, function_name: str, n_args: int) -> None:
+        self.spill()
+        super().write_call(function_name, n_args)
+
+    def write_return(self) -> None:
+        self.spill()
+        super().write_return()
+
+    def end_file(self) -> None:
+        self.spill()
+
+    def write_shared_routines(self) -> None:
+        self.spill()
+        super().write_shared_routines()
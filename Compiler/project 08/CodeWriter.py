@@ -5,7 +5,9 @@ was written by Aviv Yaish. It is an extension to the specifications given
 as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import io
 import typing
+from BufferedEmitter import BufferedEmitter
 
 TRUE = 0
 FALSE = -1
@@ -22,6 +24,8 @@ OR = "or"
 NOT = "not"
 SHIFT_LEFT = "shiftleft"
 SHIFT_RIGHT = "shiftright"
+CALL = "call"
+RETURN = "return"
 CONSTANT = "constant"
 LOCAL = "local"
 ARGUMENT = "argument"
@@ -31,26 +35,136 @@ POINTER = "pointer"
 STATIC = "static"
 TEMP = "temp"
 TEMP_REGISTER = "R5"
+SEGMENT_POINTERS = {LOCAL: "LCL", ARGUMENT: "ARG", THIS: "THIS", THAT: "THAT"}
+# entries of local, argument, this and that up to this index are reached with
+# A=M+1 and A=A+1 instead of adding the index in D. The ROM words (and cycles)
+# of their push and pop (see TemplateBenchmark):
+#   index       push  pop
+#   0             8     6
+#   1             8     6
+#   2             9     7
+#   3 and up     10     9
+# Before, every index took 16 and 15, going through R13. Pops of temp take 5.
+MAX_CHAINED_INDEX = 2
+POP_TO_D = "@SP\nAM=M-1\nD=M\n"
+# the fixed fragments of the stack helpers, written in one piece each
+DECREMENT_STACK = "@SP\nM=M-1\n"
+INCREMENT_STACK = "@SP\nM=M+1\n"
+POP_FROM_STACK = "//pop from stack:\n" + DECREMENT_STACK + "@SP\nA=M\nD=M\n"
+PUSH_TO_STACK = "//push to stack:\n@SP\nA=M\nM=D\n" + INCREMENT_STACK
+# the shared comparison routines, which are entered with the return address
+# in D, replace x and y on the stack with the result and jump back through
+# R15. gt and lt compare the signs first, so x - y cannot overflow.
+COMPARISON_ROUTINES = {
+    EQ: "($EQ)\n@R15\nM=D\n"
+        "@SP\nAM=M-1\nD=M\nA=A-1\nD=M-D\n"
+        "@$COMPARE_TRUE\nD;JEQ\n@$COMPARE_FALSE\n0;JMP\n",
+    GT: "($GT)\n@R15\nM=D\n"
+        "//put y in D, x < 0 <= y is false and y < 0 <= x is true:\n"
+        "@SP\nAM=M-1\nD=M\n@$GT_Y_IS_NEGATIVE\nD;JLT\n"
+        "@SP\nA=M-1\nD=M\n@$COMPARE_FALSE\nD;JLT\n@$GT_SUBTRACTION\n0;JMP\n"
+        "($GT_Y_IS_NEGATIVE)\n@SP\nA=M-1\nD=M\n@$COMPARE_TRUE\nD;JGE\n"
+        "//same signs, x - y:\n"
+        "($GT_SUBTRACTION)\n@SP\nA=M\nD=M\nA=A-1\nD=M-D\n"
+        "@$COMPARE_TRUE\nD;JGT\n@$COMPARE_FALSE\n0;JMP\n",
+    LT: "($LT)\n@R15\nM=D\n"
+        "//put y in D, x < 0 <= y is true and y < 0 <= x is false:\n"
+        "@SP\nAM=M-1\nD=M\n@$LT_Y_IS_NEGATIVE\nD;JLT\n"
+        "@SP\nA=M-1\nD=M\n@$COMPARE_TRUE\nD;JLT\n@$LT_SUBTRACTION\n0;JMP\n"
+        "($LT_Y_IS_NEGATIVE)\n@SP\nA=M-1\nD=M\n@$COMPARE_FALSE\nD;JGE\n"
+        "//same signs, x - y:\n"
+        "($LT_SUBTRACTION)\n@SP\nA=M\nD=M\nA=A-1\nD=M-D\n"
+        "@$COMPARE_TRUE\nD;JLT\n@$COMPARE_FALSE\n0;JMP\n"}
+COMPARISON_RESULTS = ("($COMPARE_TRUE)\n@SP\nA=M-1\nM=-1\n@R15\nA=M\n0;JMP\n"
+                      "($COMPARE_FALSE)\n@SP\nA=M-1\nM=0\n@R15\nA=M\n0;JMP\n")
+# the shared call routine is entered with the address of the function in
+# R13, n_args in R14 and the return address in D. The shared return routine
+# keeps the frame in R13 and the return address in R14.
+CALL_ROUTINE = ("($CALL)\n"
+                "//push return address, LCL, ARG, THIS and THAT:\n"
+                "@SP\nA=M\nM=D\n"
+                "@LCL\nD=M\n@SP\nAM=M+1\nM=D\n"
+                "@ARG\nD=M\n@SP\nAM=M+1\nM=D\n"
+                "@THIS\nD=M\n@SP\nAM=M+1\nM=D\n"
+                "@THAT\nD=M\n@SP\nAM=M+1\nM=D\n"
+                "//LCL=SP:\n"
+                "@SP\nMD=M+1\n@LCL\nM=D\n"
+                "//ARG=SP-5-n_args:\n"
+                "@5\nD=D-A\n@R14\nD=D-M\n@ARG\nM=D\n"
+                "//goto function:\n"
+                "@R13\nA=M\n0;JMP\n")
+RETURN_ROUTINE = ("($RETURN)\n"
+                  "//frame=LCL, return address=*(frame-5):\n"
+                  "@LCL\nD=M\n@R13\nM=D\n@5\nA=D-A\nD=M\n@R14\nM=D\n"
+                  "//*ARG=pop(), SP=ARG+1:\n"
+                  "@SP\nAM=M-1\nD=M\n@ARG\nA=M\nM=D\n@ARG\nD=M+1\n@SP\nM=D\n"
+                  "//restore THAT, THIS, ARG and LCL:\n"
+                  "@R13\nAM=M-1\nD=M\n@THAT\nM=D\n"
+                  "@R13\nAM=M-1\nD=M\n@THIS\nM=D\n"
+                  "@R13\nAM=M-1\nD=M\n@ARG\nM=D\n"
+                  "@R13\nAM=M-1\nD=M\n@LCL\nM=D\n"
+                  "//goto return address:\n"
+                  "@R14\nA=M\n0;JMP\n")
+# functions with at least this many locals zero them in a loop (8 ROM words)
+# rather than in straight-line code (2 * n_vars + 5 words). The loop takes
+# 6 * n_vars + 2 cycles instead of 2 * n_vars + 5, which is still fewer than
+# the 7 * n_vars of a push constant 0 per local (see TemplateBenchmark).
+LOCALS_LOOP_THRESHOLD = 8
+PUSH_CONSTANT_WORDS = 7
+# keeps the code before the shared routines from running into them
+SHARED_ROUTINES_GUARD = "($SHARED_ROUTINES)\n@$SHARED_ROUTINES\n0;JMP\n"
+COMMENT_CHAR = "/"
+LABEL_OPEN = "("
+
+
+def rom_words(asm: str) -> int:
+    """Returns the number of instructions in a piece of assembly code."""
+    words = 0
+    for line in asm.splitlines():
+        line = line.split(COMMENT_CHAR)[0].strip()
+        if line and not line.startswith(LABEL_OPEN):
+            words += 1
+    return words
 
 
 class CodeWriter:
     """Translates VM commands into Hack assembly code."""
 
-    def __init__(self, output_stream: typing.TextIO) -> None:
+    def __init__(self, output_stream: typing.TextIO, buffered: bool = True,
+                 shared_comparisons: bool = False, shared_calls: bool = False,
+                 locals_loop_threshold: int = LOCALS_LOOP_THRESHOLD) -> None:
         """Initializes the CodeWriter.
 
         Args:
             output_stream (typing.TextIO): output stream.
+            buffered (bool): collect the output in a BufferedEmitter, in which
+            case flush() must be called at the end, instead of writing every
+            fragment to output_stream right away.
+            shared_comparisons (bool): translate eq, gt and lt into jumps to
+            routines that are written once, by write_shared_routines().
+            shared_calls (bool): the same for call and return.
+            locals_loop_threshold (int): the number of locals from which
+            function zeroes them in a loop.
         """
         # Your code goes here!
         # Note that you can write to output_stream like so:
         # output_stream.write("Hello world! \n")
-        self.output_file = output_stream
+        self.output_stream = output_stream
+        self.output_file = BufferedEmitter(output_stream) if buffered else output_stream
         self.filename = ""
+        # scopes the labels the writer makes up to the file, so that files can
+        # be translated apart (in parallel, by Main) without collisions
+        self.label_prefix = ""
         self.current_function = "main"
         self.comp_num = 0  # to insure that we jump to the right label.
         self.function_counter = 0  # to insure that we jump to the right label.
         self.label_counter = 0
+        self.shared_comparisons = shared_comparisons
+        self.shared_calls = shared_calls
+        self.locals_loop_threshold = locals_loop_threshold
+        # the jumps to every shared routine, and the ROM words they take
+        self.shared_uses = {EQ: 0, GT: 0, LT: 0, CALL: 0, RETURN: 0}
+        self.shared_site_words = 0
 
     def set_file_name(self, filename: str) -> None:
         """Informs the code writer that the translation of a new VM file is
@@ -71,18 +185,40 @@ class CodeWriter:
         # For example, using code similar to:
         # input_filename, input_extension = os.path.splitext(os.path.basename(input_file.name))
         self.filename = filename
+        self.label_prefix = filename + "$"
+        self.current_function = self.label_prefix + "main"
+        self.comp_num = 0
+        self.function_counter = 0
+
+    def end_file(self) -> None:
+        """Informs the code writer that the translation of a VM file is done,
+        so that nothing of it is left in the state of the writer.
+        """
+        pass
+
+    def flush_if_full(self) -> None:
+        """Writes the buffered output once enough of it was collected. Called
+        after every VM command.
+        """
+        if self.output_file is not self.output_stream:
+            self.output_file.flush_if_full()
+
+    def flush(self) -> None:
+        """Writes the buffered output to the output stream."""
+        if self.output_file is not self.output_stream:
+            self.output_file.flush()
 
     def decrement_stack(self):
         """
         sp--
         """
-        self.output_file.write("@SP\nM=M-1\n")
+        self.output_file.write(DECREMENT_STACK)
 
     def increment_stack(self):
         """
         sp++
         """
-        self.output_file.write("@SP\nM=M+1\n")
+        self.output_file.write(INCREMENT_STACK)
 
     def write_arithmetic(self, command: str) -> None:
         """Writes assembly code that is the translation of the given
@@ -105,17 +241,13 @@ class CodeWriter:
         """
         Writes in Assembly the commands to get the last variable from the stack.
         """
-        self.output_file.write("//pop from stack:\n")
-        self.decrement_stack()
-        self.output_file.write("@SP\nA=M\nD=M\n")
+        self.output_file.write(POP_FROM_STACK)
 
     def push_to_stack(self):
         """
         Writes in Assembly the commands to push and arithmetic result to the abstract stack.
         """
-        self.output_file.write("//push to stack:\n")
-        self.output_file.write("@SP\nA=M\nM=D\n")
-        self.increment_stack()
+        self.output_file.write(PUSH_TO_STACK)
 
     def add(self):
         """
@@ -146,20 +278,41 @@ class CodeWriter:
                                "D=-D\n")
         self.push_to_stack()
 
+    def write_shared_site(self, command: str, asm: str) -> None:
+        """
+        Writes the code that jumps to a shared routine, and counts it.
+        """
+        self.output_file.write(asm)
+        self.shared_uses[command] += 1
+        self.shared_site_words += rom_words(asm)
+
+    def call_comparison(self, command: str) -> None:
+        """
+        Writes in Assembly a jump to the shared routine of eq, gt or lt.
+        """
+        return_label = "{}{}_RETURN{}".format(self.label_prefix, command.upper(), self.comp_num)
+        self.write_shared_site(command, "//" + command + " (shared):\n"
+                               "@" + return_label + "\nD=A\n@$" + command.upper()
+                               + "\n0;JMP\n(" + return_label + ")\n")
+        self.comp_num += 1
+
     def eq(self):
         """
         Writes in Assembly the equal func, checks if x==y.
         """
+        if self.shared_comparisons:
+            self.call_comparison(EQ)
+            return
         self.pop_from_stack()
         self.decrement_stack()
         self.output_file.write("//equal value:\n"
                                "@SP\nA=M\nD=M-D\n")
         self.output_file.write("//check if equal:\n"
-                               "@COMPARE{}".format(self.comp_num) +
-                               "\nD;JEQ\nD=0\n@END_COMPARE{}".format(self.comp_num) + "\n0;JMP\n")
+                               "@{}COMPARE{}".format(self.label_prefix, self.comp_num) +
+                               "\nD;JEQ\nD=0\n@{}END_COMPARE{}".format(self.label_prefix, self.comp_num) + "\n0;JMP\n")
         self.output_file.write("//equal labels:\n"
-                               "(COMPARE{})".format(self.comp_num) +
-                               "\nD=-1\n" + "(END_COMPARE{})".format(self.comp_num) + "\n")
+                               "({}COMPARE{})".format(self.label_prefix, self.comp_num) +
+                               "\nD=-1\n" + "({}END_COMPARE{})".format(self.label_prefix, self.comp_num) + "\n")
         self.comp_num += 1
         self.push_to_stack()
 
@@ -167,6 +320,9 @@ class CodeWriter:
         """
         Writes in Assembly the GT func, checks if x>y (the stack holds x before y).
         """
+        if self.shared_comparisons:
+            self.call_comparison(GT)
+            return
         self.pop_from_stack()
         self.output_file.write("//gt process - put y in R14:\n"
                                "@R14\nM=D\n")
@@ -174,23 +330,23 @@ class CodeWriter:
         self.output_file.write("//put x in R15:\n"
                                "@R15\nM=D")
         self.output_file.write("//check if X > 0 or X < 0\n"
-                               "@R15\nD=M\n" + "@X_IS_POSITIVE{}".format(self.comp_num) +
-                               "\nD;JGT\n" + "@X_IS_NEGATIVE{}".format(self.comp_num) + "\nD;JLT\n")
-
-        self.output_file.write("(X_IS_POSITIVE{})".format(self.comp_num) +
-                               "\n@R14\nD=M\n" + "@TRUE_CASE{}".format(self.comp_num) +
-                               "\nD;JLT\n" + "@SUBTRACTION{}".format(self.comp_num) + "\n0;JMP\n")
-        self.output_file.write("(X_IS_NEGATIVE{})".format(self.comp_num) +
-                               "\n@R14\nD=M\n" + "@FALSE_CASE{}".format(self.comp_num) +
-                               "\nD;JGT\n" + "@SUBTRACTION{}".format(self.comp_num) + "\n0;JMP\n")
-        self.output_file.write("(TRUE_CASE{})".format(self.comp_num) + "\nD=-1\n" + "@END{}".format(self.comp_num) +
+                               "@R15\nD=M\n" + "@{}X_IS_POSITIVE{}".format(self.label_prefix, self.comp_num) +
+                               "\nD;JGT\n" + "@{}X_IS_NEGATIVE{}".format(self.label_prefix, self.comp_num) + "\nD;JLT\n")
+
+        self.output_file.write("({}X_IS_POSITIVE{})".format(self.label_prefix, self.comp_num) +
+                               "\n@R14\nD=M\n" + "@{}TRUE_CASE{}".format(self.label_prefix, self.comp_num) +
+                               "\nD;JLT\n" + "@{}SUBTRACTION{}".format(self.label_prefix, self.comp_num) + "\n0;JMP\n")
+        self.output_file.write("({}X_IS_NEGATIVE{})".format(self.label_prefix, self.comp_num) +
+                               "\n@R14\nD=M\n" + "@{}FALSE_CASE{}".format(self.label_prefix, self.comp_num) +
+                               "\nD;JGT\n" + "@{}SUBTRACTION{}".format(self.label_prefix, self.comp_num) + "\n0;JMP\n")
+        self.output_file.write("({}TRUE_CASE{})".format(self.label_prefix, self.comp_num) + "\nD=-1\n" + "@{}END{}".format(self.label_prefix, self.comp_num) +
                                "\n0;JMP\n")
-        self.output_file.write("(FALSE_CASE{})".format(self.comp_num) + "\nD=0\n" + "@END{}".format(self.comp_num) +
+        self.output_file.write("({}FALSE_CASE{})".format(self.label_prefix, self.comp_num) + "\nD=0\n" + "@{}END{}".format(self.label_prefix, self.comp_num) +
                                "\n0;JMP\n")
-        self.output_file.write("//subtraction x-y:\n" + "(SUBTRACTION{})".format(self.comp_num) + "\n"
-                                            "@R15\nD=M\n@R14\nD=D-M\n" + "@TRUE_CASE{}".format(self.comp_num) +
-                               "\nD;JGT\n" + "@FALSE_CASE{}".format(self.comp_num) +
-                               "\n0;JMP\n" + "(END{})".format(self.comp_num) + "\n")
+        self.output_file.write("//subtraction x-y:\n" + "({}SUBTRACTION{})".format(self.label_prefix, self.comp_num) + "\n"
+                                            "@R15\nD=M\n@R14\nD=D-M\n" + "@{}TRUE_CASE{}".format(self.label_prefix, self.comp_num) +
+                               "\nD;JGT\n" + "@{}FALSE_CASE{}".format(self.label_prefix, self.comp_num) +
+                               "\n0;JMP\n" + "({}END{})".format(self.label_prefix, self.comp_num) + "\n")
         self.comp_num += 1
         self.push_to_stack()
 
@@ -198,6 +354,9 @@ class CodeWriter:
         """
         Writes in Assembly the GL func, checks if x<y (the stack holds x before y).
         """
+        if self.shared_comparisons:
+            self.call_comparison(LT)
+            return
         self.pop_from_stack()
         self.output_file.write("//lt process: put y in R14:\n"
                                "@R14\nM=D\n")
@@ -206,22 +365,22 @@ class CodeWriter:
         self.output_file.write("//put x in R15:\n"
                                "@R15\nM=D\n")
         self.output_file.write("//check if X < 0 or X > 0:\n"
-                               "@R15\nD=M\n" + "@X_IS_POSITIVE{}".format(self.comp_num) +
-                               "\nD;JGT\n" + "@X_IS_NEGATIVE{}".format(self.comp_num) + "\nD;JLT\n")
-        self.output_file.write("(X_IS_POSITIVE{})".format(self.comp_num) +
-                               "\n@R14\nD=M\n" + "@FALSE_CASE{}".format(self.comp_num) +
-                               "\nD;JLT\n" + "@SUBTRACTION{}".format(self.comp_num) + "\n0;JMP\n")
-        self.output_file.write("(X_IS_NEGATIVE{})".format(self.comp_num) +
-                               "\n@R14\nD=M\n" + "@TRUE_CASE{}".format(self.comp_num) +
-                               "\nD;JGT\n" + "@SUBTRACTION{}".format(self.comp_num) + "\n0;JMP\n")
-        self.output_file.write("(TRUE_CASE{})".format(self.comp_num) +
-                               "\nD=-1\n" + "@END{}".format(self.comp_num) + "\n0;JMP\n")
-        self.output_file.write("(FALSE_CASE{})".format(self.comp_num) + "\nD=0\n" +
-                               "@END{}".format(self.comp_num) + "\n0;JMP\n")
-        self.output_file.write("//subtraction x-y:\n" + "(SUBTRACTION{})".format(self.comp_num) + "\n"
-                                        "@R15\nD=M\n@R14\nD=D-M\n" + "@TRUE_CASE{}".format(self.comp_num) +
-                               "\nD;JLT\n" + "@FALSE_CASE{}".format(self.comp_num) +
-                               "\n0;JMP\n" + "(END{})".format(self.comp_num) + "\n")
+                               "@R15\nD=M\n" + "@{}X_IS_POSITIVE{}".format(self.label_prefix, self.comp_num) +
+                               "\nD;JGT\n" + "@{}X_IS_NEGATIVE{}".format(self.label_prefix, self.comp_num) + "\nD;JLT\n")
+        self.output_file.write("({}X_IS_POSITIVE{})".format(self.label_prefix, self.comp_num) +
+                               "\n@R14\nD=M\n" + "@{}FALSE_CASE{}".format(self.label_prefix, self.comp_num) +
+                               "\nD;JLT\n" + "@{}SUBTRACTION{}".format(self.label_prefix, self.comp_num) + "\n0;JMP\n")
+        self.output_file.write("({}X_IS_NEGATIVE{})".format(self.label_prefix, self.comp_num) +
+                               "\n@R14\nD=M\n" + "@{}TRUE_CASE{}".format(self.label_prefix, self.comp_num) +
+                               "\nD;JGT\n" + "@{}SUBTRACTION{}".format(self.label_prefix, self.comp_num) + "\n0;JMP\n")
+        self.output_file.write("({}TRUE_CASE{})".format(self.label_prefix, self.comp_num) +
+                               "\nD=-1\n" + "@{}END{}".format(self.label_prefix, self.comp_num) + "\n0;JMP\n")
+        self.output_file.write("({}FALSE_CASE{})".format(self.label_prefix, self.comp_num) + "\nD=0\n" +
+                               "@{}END{}".format(self.label_prefix, self.comp_num) + "\n0;JMP\n")
+        self.output_file.write("//subtraction x-y:\n" + "({}SUBTRACTION{})".format(self.label_prefix, self.comp_num) + "\n"
+                                        "@R15\nD=M\n@R14\nD=D-M\n" + "@{}TRUE_CASE{}".format(self.label_prefix, self.comp_num) +
+                               "\nD;JLT\n" + "@{}FALSE_CASE{}".format(self.label_prefix, self.comp_num) +
+                               "\n0;JMP\n" + "({}END{})".format(self.label_prefix, self.comp_num) + "\n")
         self.comp_num += 1
         self.push_to_stack()
 
@@ -267,6 +426,93 @@ class CodeWriter:
         self.output_file.write("@SP\nM=M-1\nA=M\nM=M>>\n@SP\nM=M+1\n")
 
 
+    def segment_address(self, segment: str, index: int) -> str:
+        """
+        Returns Assembly that puts the address of an entry of a segment in A.
+        D is only changed for local, argument, this and that after
+        MAX_CHAINED_INDEX.
+        """
+        if segment == STATIC:
+            return "@" + self.filename + "." + str(index) + "\n"
+        if segment == TEMP:
+            return "@R" + str(5 + index) + "\n"
+        if segment == POINTER:
+            return "@R" + str(3 + index) + "\n"
+        return self.pointed_address(SEGMENT_POINTERS[segment], index)
+
+    def pointed_address(self, pointer: str, index: int) -> str:
+        """
+        Returns Assembly that puts the address pointer + index in A: A=M for
+        index 0, A=M+1 and then A=A+1 up to MAX_CHAINED_INDEX, and through D
+        after it.
+        """
+        if index == 0:
+            return "@" + pointer + "\nA=M\n"
+        if index <= MAX_CHAINED_INDEX:
+            return "@" + pointer + "\nA=M+1\n" + "A=A+1\n" * (index - 1)
+        return "@" + pointer + "\nD=M\n@" + str(index) + "\nA=D+A\n"
+
+    def write_push_value(self, value: int) -> None:
+        """
+        Writes in Assembly a push of a signed 16-bit value, with a single @:
+        -1, 0 and 1 are constants of the ALU, and a negative value is the
+        not of a value push constant could load.
+        """
+        if value in [-1, 0, 1]:
+            load = "@SP\nA=M\nM=" + str(value) + "\n"
+        elif value > 0:
+            load = "@" + str(value) + "\nD=A\n@SP\nA=M\nM=D\n"
+        else:
+            load = "@" + str(~value) + "\nD=!A\n@SP\nA=M\nM=D\n"
+        self.output_file.write("//push value " + str(value) + ":\n" + load + INCREMENT_STACK)
+
+    def write_add_constant(self, command: str, value: int) -> None:
+        """
+        Writes in Assembly push constant value followed by add or sub, done
+        in place on the top of the stack.
+        """
+        self.output_file.write("//" + command + " constant:\n"
+                               "@" + str(value) + "\nD=A\n@SP\nA=M-1\n"
+                               + ("M=D+M\n" if command == ADD else "M=M-D\n"))
+
+    def write_increment(self, segment: str, index: int) -> None:
+        """
+        Writes in Assembly push x, push constant 1, add, pop x, done in place.
+        """
+        self.output_file.write("//increment:\n" + self.segment_address(segment, index)
+                               + "M=M+1\n")
+
+    def write_decrement(self, segment: str, index: int) -> None:
+        """
+        Writes in Assembly push x, push constant 1, sub, pop x, done in place.
+        """
+        self.output_file.write("//decrement:\n" + self.segment_address(segment, index)
+                               + "M=M-1\n")
+
+    def write_array_store(self) -> None:
+        """
+        Writes in Assembly pop temp 0, pop pointer 1, push temp 0, pop that 0:
+        stores the top of the stack at the address below it, leaving the
+        value in temp 0 and the address in THAT.
+        """
+        self.output_file.write("//array store:\n"
+                               "@SP\nAM=M-1\nD=M\n@R5\nM=D\n"
+                               "@SP\nAM=M-1\nD=M\n@R4\nM=D\n"
+                               "@R5\nD=M\n@R4\nA=M\nM=D\n")
+
+    def write_pop_push(self, segment: str, index: int) -> None:
+        """
+        Writes in Assembly pop x, push x: copies the top of the stack to x.
+        """
+        if segment in SEGMENT_POINTERS and index > MAX_CHAINED_INDEX:
+            self.output_file.write("//pop and push back:\n"
+                                   "@" + SEGMENT_POINTERS[segment] + "\nD=M\n@" + str(index)
+                                   + "\nD=D+A\n@R13\nM=D\n"
+                                   "@SP\nA=M-1\nD=M\n@R13\nA=M\nM=D\n")
+        else:
+            self.output_file.write("//pop and push back:\n@SP\nA=M-1\nD=M\n"
+                                   + self.segment_address(segment, index) + "M=D\n")
+
     def write_push_pop(self, command: str, segment: str, index: int) -> None:
         """Writes assembly code that is the translation of the given
         command, where command is either C_PUSH or C_POP.
@@ -326,28 +572,15 @@ class CodeWriter:
             self.pop_from_stack()
             self.output_file.write("@R4\nM=D\n")
 
-    def store_addr_in_R13(self, segment: str, index: int):
-        """
-        Helper function of "pop_command" and "push_command" function.
-         stores an address in R13 cell.
-        """
-        self.output_file.write("//find the exact address in segment:\n"
-                               "@" + segment + "\nD=M\n@" + str(index) + "\nA=D+A\n")
-        self.output_file.write("//store the address in R13:\n"
-                               "D=A\n@R13\nM=D\n")
-
     def push_constant(self, index: int):
         # *sp = index
-        self.output_file.write("//push constant: \n")
-        self.output_file.write("@" + str(index) + "\nD=A\n@SP\nA=M\nM=D\n")
-
-        # sp++
-        self.increment_stack()
+        self.output_file.write("//push constant: \n@" + str(index)
+                               + "\nD=A\n@SP\nA=M\nM=D\n" + INCREMENT_STACK)
 
     def pop_static(self, index: int, filename: str):
         self.pop_from_stack()  # D contains the poped value.
         self.output_file.write("//write to static memory:\n"
-                               "@" + filename + "." + str(index) + "\nM=D")
+                               "@" + filename + "." + str(index) + "\nM=D\n")
 
     def push_static(self, index: int, filename: str):
         self.output_file.write("//write to stack from static memory:\n"
@@ -359,24 +592,23 @@ class CodeWriter:
             self.output_file.write("//get temp address:\n"
                                    "@R" + str(5 + index) + "\nD=M\n")
         else:
-            self.store_addr_in_R13(segment, index)
             self.output_file.write("//get value from address:\n"
-                                   "@R13\nA=M\nD=M\n")
+                                   + self.pointed_address(segment, index) + "D=M\n")
         self.push_to_stack()
 
     def pop_command(self, segment, index):
         if segment == TEMP_REGISTER:
-            self.output_file.write("//get temp address:\n"
-                                   "@R" + str(5 + index) + "\n")
-            self.output_file.write("//store the address in R13:\n"
-                                   "D=A\n@R13\nM=D")
-
+            self.output_file.write("//write to temp:\n" + POP_TO_D
+                                   + "@R" + str(5 + index) + "\nM=D\n")
+        elif index <= MAX_CHAINED_INDEX:
+            self.output_file.write("//write to segment:\n" + POP_TO_D
+                                   + self.pointed_address(segment, index) + "M=D\n")
         else:
-            self.store_addr_in_R13(segment, index)
-
-        self.pop_from_stack()
-        self.output_file.write("//write to segment:\n"
-                               "@R13\nA=M\nM=D\n")
+            # with the address in D and the value in M, D=D+M is their sum,
+            # A=D-M the address and M=D-A the value
+            self.output_file.write("//write to segment:\n"
+                                   "@" + segment + "\nD=M\n@" + str(index) + "\nD=D+A\n"
+                                   + "@SP\nAM=M-1\nD=D+M\nA=D-M\nM=D-A\n")
 
     def create_decorated_label(self, label: str) -> str:
         return self.current_function + "$" + label + str(self.label_counter)
@@ -444,18 +676,26 @@ class CodeWriter:
         self.current_function = function_name
         self.output_file.write("//write function: \n")
         self.output_file.write("(" + function_name + ")\n")
-
-        while n_vars > 0:
-            self.push_constant(0)
-            n_vars -= 1
-
+        if n_vars == 0:
+            return
+        if n_vars >= self.locals_loop_threshold:
+            loop_label = function_name + "$ZERO_LOCALS"
+            asm = ("@" + str(n_vars) + "\nD=A\n(" + loop_label + ")\n"
+                   "@SP\nAM=M+1\nA=A-1\nM=0\n@" + loop_label + "\nD=D-1;JGT\n")
+        else:
+            asm = "@SP\nA=M\n" + "M=0\nA=A+1\n" * n_vars + "D=A\n@SP\nM=D\n"
+        # the words it takes, against a push constant 0 per local
+        self.output_file.write("//zero {} locals: {} ROM words instead of {}\n".format(
+            n_vars, rom_words(asm), n_vars * PUSH_CONSTANT_WORDS))
+        self.output_file.write(asm)
 
 
-    def generate_ret_addr(self, function_name: str, func_num: int) -> str:
+    def generate_ret_addr(self, func_num: int) -> str:
         """
-        Creates the symbol "Xxx.foo$ret.i" for the function "write_call".
+        Creates the symbol "Xxx.foo$ret.i" for the function "write_call", in
+        the function that calls.
         """
-        return function_name + "$ret." + str(func_num)
+        return self.current_function + "$ret." + str(func_num)
 
     def write_call(self, function_name: str, n_args: int) -> None:
         """Writes assembly code that affects the call command.
@@ -487,8 +727,19 @@ class CodeWriter:
         # (return_address)      // injects the return address label into the code
 
 
+        generated_name = self.generate_ret_addr(self.function_counter)
+        if self.shared_calls:
+            self.function_counter += 1
+            # n_args of 0 and 1 are constants of the ALU
+            set_n_args = "@R14\nM={}\n".format(n_args) if n_args in [0, 1] \
+                else "@{}\nD=A\n@R14\nM=D\n".format(n_args)
+            self.write_shared_site(CALL, "//call " + function_name + " (shared):\n"
+                                   "@" + function_name + "\nD=A\n@R13\nM=D\n" + set_n_args
+                                   + "@" + generated_name + "\nD=A\n@$CALL\n0;JMP\n"
+                                   "(" + generated_name + ")\n")
+            return
+
         # push return address
-        generated_name = self.generate_ret_addr(function_name, self.function_counter)
         self.output_file.write("@" + generated_name + "\nD=A\n")
         self.push_to_stack()
 
@@ -539,6 +790,9 @@ class CodeWriter:
         # ARG = *(frame-3)              // restores ARG for the caller
         # LCL = *(frame-4)              // restores LCL for the caller
         # goto return_address           // go to the return address
+        if self.shared_calls:
+            self.write_shared_site(RETURN, "//return (shared):\n@$RETURN\n0;JMP\n")
+            return
 
         # frame = LCL
         self.output_file.write("@LCL\nD=M\n")
@@ -565,6 +819,45 @@ class CodeWriter:
         self.output_file.write("// goto return address:"
                                "\n@return_address\nA=M\n0;JMP\n")
 
+    def write_shared_routines(self) -> None:
+        """Writes the shared routines the translated code jumps to, once per
+        program, after the code of the last file (only those that were used). A comment in front of them
+        tells the ROM words they saved.
+        """
+        used = [command for command, uses in self.shared_uses.items() if uses]
+        if not used:
+            return
+        routines = SHARED_ROUTINES_GUARD + "".join(
+            COMPARISON_ROUTINES[command] for command in used if command in COMPARISON_ROUTINES)
+        if any(command in COMPARISON_ROUTINES for command in used):
+            routines += COMPARISON_RESULTS
+        if CALL in used:
+            routines += CALL_ROUTINE
+        if RETURN in used:
+            routines += RETURN_ROUTINE
+        inline_words = sum(self.shared_uses[command] * inline_rom_words(command)
+                           for command in used)
+        shared_words = rom_words(routines) + self.shared_site_words
+        self.output_file.write("//shared routines, " + ", ".join(
+            "{} {}".format(self.shared_uses[command], command) for command in used)
+            + ": {} ROM words instead of {}, {} saved\n".format(
+                shared_words, inline_words, inline_words - shared_words))
+        self.output_file.write(routines)
+
     def initialize_file(self):
         self.output_file.write("@256\nD=A\n@SP\nM=D\n")
 
+
+def inline_rom_words(command: str) -> int:
+    """Returns the ROM words of the inline translation of eq, gt, lt, call
+    or return (which do not depend on the arguments of the command).
+    """
+    scratch = io.StringIO()
+    code_writer = CodeWriter(scratch, False)
+    if command == CALL:
+        code_writer.write_call("Xxx.foo", 0)
+    elif command == RETURN:
+        code_writer.write_return()
+    else:
+        getattr(code_writer, command)()
+    return rom_words(scratch.getvalue())
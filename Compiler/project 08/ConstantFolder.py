@@ -0,0 +1,146 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from Parser import VMCommand, ARITHMETIC_COMMAND, NO_ARG2
+from VMEmulator import VMError, WORD_MASK
+from JackOS import JackOS, to_signed
+
+PUSH = "C_PUSH"
+POP = "C_POP"
+GOTO = "C_GOTO"
+IF_GOTO = "C_IF"
+CALL = "C_CALL"
+CONSTANT = "constant"
+# pushes a 16-bit value, negative ones too (arg2: the signed value), which
+# CodeWriter.write_push_value loads with a single @ each
+PUSH_VALUE = "C_PUSH_VALUE"
+# the operations on signed values, whose results are cut to 16 bits
+UNARY_OPERATIONS = {"neg": lambda x: -x,
+                    "not": lambda x: ~x,
+                    "shiftleft": lambda x: x << 1,
+                    "shiftright": lambda x: x >> 1}
+BINARY_OPERATIONS = {"add": lambda x, y: x + y,
+                     "sub": lambda x, y: x - y,
+                     "and": lambda x, y: x & y,
+                     "or": lambda x, y: x | y,
+                     "eq": lambda x, y: -(x == y),
+                     "gt": lambda x, y: -(x > y),
+                     "lt": lambda x, y: -(x < y)}
+# the OS functions that only compute a value from their arguments, evaluated
+# with the native versions of JackOS
+PURE_FUNCTIONS = ["Math.abs", "Math.multiply", "Math.divide", "Math.min",
+                  "Math.max", "Math.sqrt"]
+# the segments whose constant values are propagated to the pushes that read
+# them: the temp and static entries cannot be reached through local,
+# argument or pointer, and writes through this and that forget them all
+PROPAGATED_SEGMENTS = ["temp", "static"]
+ALIASING_SEGMENTS = ["this", "that"]
+# the commands that end a straight run of code, after which nothing is known
+BLOCK_ENDS = ["C_LABEL", "C_GOTO", "C_FUNCTION", "C_CALL", "C_RETURN"]
+
+
+def constant_value(command: VMCommand) -> typing.Optional[int]:
+    """Returns the signed value a command pushes, if it is a constant."""
+    if command.opcode == PUSH and command.arg1 == CONSTANT:
+        return command.arg2
+    if command.opcode == PUSH_VALUE:
+        return command.arg2
+    return None
+
+
+def push_command(value: int, line: int) -> VMCommand:
+    """Returns a push of a signed value: push constant if it can be one."""
+    value = to_signed(value & WORD_MASK)
+    if value >= 0:
+        return VMCommand(PUSH, CONSTANT, value, line)
+    return VMCommand(PUSH_VALUE, "", value, line)
+
+
+class ConstantFolder:
+    """
+    Evaluates VM commands whose operands are all constants at translation
+    time, with the 16-bit semantics of the Hack platform:
+    - arithmetic, logical and comparison commands, neg, not and the shifts;
+    - calls of the pure Math functions of the OS (not divisions by zero or
+      square roots of negative numbers, which are errors at run time);
+    - if-goto of a constant, which becomes a goto or nothing.
+    Constants popped to temp and static are propagated to the pushes that
+    read them back, until the end of the straight run of code.
+
+    Results are pushed by a single command: push constant, or PUSH_VALUE for
+    the negative ones.
+    """
+
+    def __init__(self) -> None:
+        self.natives = JackOS().natives(["Math"])
+        self.hits = {"arithmetic": 0, "calls": 0, "branches": 0, "propagated": 0}
+
+    def fold(self, commands: typing.List[VMCommand]) -> typing.List[VMCommand]:
+        """Returns the commands with the constant ones folded."""
+        folded = []
+        known = {}
+        for command in commands:
+            opcode = command.opcode
+            if opcode == ARITHMETIC_COMMAND:
+                operation = command.arg1
+                if operation in BINARY_OPERATIONS and self.ends_with_constants(folded, 2):
+                    y = constant_value(folded.pop())
+                    x = constant_value(folded.pop())
+                    folded.append(push_command(BINARY_OPERATIONS[operation](x, y), command.line))
+                    self.hits["arithmetic"] += 1
+                    continue
+                if operation in UNARY_OPERATIONS and self.ends_with_constants(folded, 1):
+                    x = constant_value(folded.pop())
+                    folded.append(push_command(UNARY_OPERATIONS[operation](x), command.line))
+                    self.hits["arithmetic"] += 1
+                    continue
+            elif opcode == CALL and command.arg1 in PURE_FUNCTIONS and command.arg2 > 0 \
+                    and self.ends_with_constants(folded, command.arg2):
+                arguments = [constant_value(argument) & WORD_MASK
+                             for argument in folded[-command.arg2:]]
+                try:
+                    result = self.natives[command.arg1](None, *arguments)
+                except VMError:
+                    pass
+                else:
+                    del folded[-command.arg2:]
+                    folded.append(push_command(result, command.line))
+                    self.hits["calls"] += 1
+                    continue
+            elif opcode == IF_GOTO and self.ends_with_constants(folded, 1):
+                if constant_value(folded.pop()):
+                    folded.append(VMCommand(GOTO, command.arg1, NO_ARG2, command.line))
+                    known.clear()
+                self.hits["branches"] += 1
+                continue
+            elif opcode == PUSH and (command.arg1, command.arg2) in known:
+                folded.append(push_command(known[(command.arg1, command.arg2)], command.line))
+                self.hits["propagated"] += 1
+                continue
+            elif opcode == POP:
+                if command.arg1 in PROPAGATED_SEGMENTS:
+                    value = constant_value(folded[-1]) if folded else None
+                    if value is None:
+                        known.pop((command.arg1, command.arg2), None)
+                    else:
+                        known[(command.arg1, command.arg2)] = value
+                elif command.arg1 in ALIASING_SEGMENTS:
+                    known.clear()
+            if opcode in BLOCK_ENDS:
+                known.clear()
+            folded.append(command)
+        return folded
+
+    def ends_with_constants(self, commands: typing.List[VMCommand], count: int) -> bool:
+        return len(commands) >= count and all(
+            constant_value(command) is not None for command in commands[-count:])
+
+    def write_report(self, output: typing.TextIO) -> None:
+        """Writes the hits of every kind of folding."""
+        for name, hits in self.hits.items():
+            output.write(name.ljust(14) + str(hits).rjust(8) + "\n")
@@ -0,0 +1,105 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from Parser import VMCommand
+
+FUNCTION = "C_FUNCTION"
+CALL = "C_CALL"
+# the function the bootstrap calls, from which the program is reached
+ENTRY_FUNCTION = "Sys.init"
+
+
+def split_functions(commands: typing.List[VMCommand]) \
+        -> typing.List[typing.Tuple[typing.Optional[str], typing.List[VMCommand]]]:
+    """Splits the commands of a file into the code before its first function
+    (named None), if any, and the body of every function, from its function
+    command to the next one.
+    """
+    functions = []
+    name, start = None, 0
+    for index, command in enumerate(commands):
+        if command.opcode == FUNCTION:
+            if index > start:
+                functions.append((name, commands[start:index]))
+            name, start = command.arg1, index
+    if len(commands) > start:
+        functions.append((name, commands[start:]))
+    return functions
+
+
+class DeadFunctionEliminator:
+    """
+    Drops the functions no call can reach from the entry function, usually
+    OS routines the program never uses.
+
+    analyze() builds the call graph of the whole program from its call
+    commands and finds the functions reachable from ENTRY_FUNCTION and from
+    code outside of any function. eliminate() then drops the bodies of the
+    others from the commands of every file. There are no indirect calls in
+    the VM language, so the graph holds every call that can be made. A
+    program without the entry function (a test of a few functions, without
+    a bootstrap that reaches them) is kept whole.
+    """
+
+    def __init__(self, reachable: typing.Optional[typing.Set[str]] = None) -> None:
+        """
+        Args:
+            reachable (typing.Optional[typing.Set[str]]): the functions to
+            keep, if they are known (in a worker process, from the analysis
+            of the main one), or None to keep everything until analyze().
+        """
+        self.reachable = reachable
+        # the bodies of the dropped functions, by name
+        self.removed = {}
+
+    def analyze(self, programs: typing.Iterable[typing.List[VMCommand]]) -> None:
+        """Finds the reachable functions of a program, given the commands of
+        each of its files.
+        """
+        callees = {}
+        bodies = {}
+        roots = []
+        for commands in programs:
+            for name, body in split_functions(commands):
+                calls = {command.arg1 for command in body if command.opcode == CALL}
+                if name is None:
+                    roots += calls
+                else:
+                    callees[name] = calls
+                    bodies[name] = body
+        if ENTRY_FUNCTION not in bodies:
+            self.reachable = None
+            return
+        reachable = set()
+        pending = [ENTRY_FUNCTION] + roots
+        while pending:
+            name = pending.pop()
+            if name in reachable:
+                continue
+            reachable.add(name)
+            pending += callees.get(name, [])
+        self.reachable = reachable
+        self.removed = {name: body for name, body in bodies.items() if name not in reachable}
+
+    def eliminate(self, commands: typing.List[VMCommand]) -> typing.List[VMCommand]:
+        """Returns the commands of a file without the unreachable functions."""
+        if self.reachable is None:
+            return commands
+        return [command for name, body in split_functions(commands)
+                if name is None or name in self.reachable for command in body]
+
+    def write_report(self, output: typing.TextIO,
+                     rom_words: typing.Callable[[typing.List[VMCommand]], int]) -> None:
+        """Writes the removed functions, the largest first, with the ROM words
+        each took (as rom_words counts them) and their total.
+        """
+        words = {name: rom_words(body) for name, body in self.removed.items()}
+        for name, function_words in sorted(words.items(), key=lambda item: (-item[1], item[0])):
+            output.write(name.ljust(30) + str(function_words).rjust(8) + "\n")
+        output.write("removed {} functions, {} ROM words saved\n".format(
+            len(words), sum(words.values())))
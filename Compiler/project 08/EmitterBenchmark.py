@@ -0,0 +1,174 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import io
+import os
+import sys
+import tempfile
+import time
+import typing
+import Main
+from BufferedEmitter import BufferedEmitter
+from CodeWriter import CodeWriter
+
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "benchmarks", "EmitterBenchmark.txt")
+SIZES = [10000, 100000, 300000]
+REPETITIONS = 3
+# the commands of the generated programs, in the proportions the Jack
+# compiler roughly emits them
+COMMAND_MIX = ["push local 0", "push argument 1", "push constant 17",
+               "add", "pop local 1", "push this 2", "pop that 0", "push temp 0",
+               "sub", "lt", "not", "if-goto LOOP", "label LOOP", "goto LOOP",
+               "push constant 3", "call Bench.f 1", "push static 1", "pop temp 1",
+               "eq", "neg"]
+
+
+class CountingStream:
+    """A write-only stream that counts the calls made to it."""
+
+    def __init__(self, output_stream: typing.TextIO) -> None:
+        self.output_stream = output_stream
+        self.calls = 0
+
+    def write(self, text: str) -> None:
+        self.calls += 1
+        self.output_stream.write(text)
+
+    def writelines(self, lines: typing.Iterable[str]) -> None:
+        self.calls += 1
+        self.output_stream.writelines(lines)
+
+
+def write_program(path: str, n_commands: int) -> None:
+    """Writes a VM program of n_commands commands in one function."""
+    with open(path, "w") as vm_file:
+        vm_file.write("function Bench.f 2\n")
+        for index in range(n_commands):
+            vm_file.write(COMMAND_MIX[index % len(COMMAND_MIX)] + "\n")
+        vm_file.write("return\n")
+
+
+def translate(vm_path: str, output_file: typing.TextIO, buffered: bool) -> None:
+    code_writer = CodeWriter(output_file, buffered)
+    code_writer.set_file_name("Bench")
+    Main.code_writer = code_writer
+    with open(vm_path, "r") as vm_file:
+        Main.translate_file(vm_file, output_file, False)
+    code_writer.flush()
+
+
+def record_fragments(vm_path: str) -> typing.List[typing.List[str]]:
+    """Returns the fragments CodeWriter writes for every command."""
+    recorder = BufferedEmitter(None)
+    code_writer = CodeWriter(recorder, False)
+    code_writer.set_file_name("Bench")
+    Main.code_writer = code_writer
+    commands = []
+    with open(vm_path, "r") as vm_file:
+        for line in vm_file:
+            Main.translate_file(io.StringIO(line), recorder, False)
+            commands.append(recorder.fragments[:])
+            recorder.fragments.clear()
+    return commands
+
+
+def measure_emission(commands: typing.List[typing.List[str]], asm_path: str,
+                     buffered: bool) -> float:
+    """Writes recorded fragments to a file, the way CodeWriter writes them
+    with or without the buffered emitter, without translating anything.
+
+    Returns:
+        the best time of REPETITIONS runs, in seconds.
+    """
+    best = float("inf")
+    for _ in range(REPETITIONS):
+        with open(asm_path, "w") as asm_file:
+            start = time.perf_counter()
+            if buffered:
+                emitter = BufferedEmitter(asm_file)
+                write = emitter.write
+                for fragments in commands:
+                    for fragment in fragments:
+                        write(fragment)
+                    emitter.flush_if_full()
+                emitter.flush()
+            else:
+                write = asm_file.write
+                for fragments in commands:
+                    for fragment in fragments:
+                        write(fragment)
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def measure(vm_path: str, asm_path: str, buffered: bool) -> typing.Tuple[float, int]:
+    """Translates a program into a file the given way.
+
+    Returns:
+        the best time of REPETITIONS runs, in seconds, and the number of
+        calls made to the output file.
+    """
+    best = float("inf")
+    for _ in range(REPETITIONS):
+        with open(asm_path, "w") as asm_file:
+            start = time.perf_counter()
+            translate(vm_path, asm_file, buffered)
+            best = min(best, time.perf_counter() - start)
+    with open(os.devnull, "w") as null_file:
+        counter = CountingStream(null_file)
+        translate(vm_path, counter, buffered)
+    return best, counter.calls
+
+
+def run_benchmark(output_file: typing.TextIO) -> None:
+    """Translates generated programs of every size with and without the
+    buffered emitter, checks that both produce the same assembly and writes
+    a table of the times: of the whole translation, and of writing the
+    fragments of the translation alone.
+    """
+    output_file.write("commands".rjust(10) + "mode".rjust(12) + "writes".rjust(12)
+                      + "translation".rjust(13) + "speedup".rjust(9)
+                      + "emission".rjust(10) + "speedup".rjust(9) + "\n")
+    output_file.write("-" * 75 + "\n")
+    with tempfile.TemporaryDirectory() as directory:
+        vm_path = os.path.join(directory, "Bench.vm")
+        for size in SIZES:
+            write_program(vm_path, size)
+            results = {}
+            emission = {}
+            commands = record_fragments(vm_path)
+            for buffered in [False, True]:
+                asm_path = os.path.join(directory, "Bench{}.asm".format(int(buffered)))
+                emission[buffered] = measure_emission(commands, asm_path, buffered)
+                results[buffered] = measure(vm_path, asm_path, buffered)
+            with open(os.path.join(directory, "Bench0.asm"), "r") as direct_file, \
+                    open(os.path.join(directory, "Bench1.asm"), "r") as buffered_file:
+                if direct_file.read() != buffered_file.read():
+                    raise RuntimeError("the buffered output differs")
+            for buffered, mode in [(False, "direct"), (True, "buffered")]:
+                seconds, calls = results[buffered]
+                output_file.write(str(size).rjust(10) + mode.rjust(12)
+                                  + str(calls).rjust(12) + "{:.3f}".format(seconds).rjust(13)
+                                  + "{:.2f}x".format(results[False][0] / seconds).rjust(9)
+                                  + "{:.3f}".format(emission[buffered]).rjust(10)
+                                  + "{:.2f}x".format(emission[False] / emission[buffered]).rjust(9)
+                                  + "\n")
+
+
+if "__main__" == __name__:
+    # Compares the translation time of large generated programs with and
+    # without the buffered emitter and writes the table to the given path
+    # (benchmarks/EmitterBenchmark.txt by default).
+    if len(sys.argv) > 2:
+        sys.exit("Invalid usage, please use: EmitterBenchmark [output path]")
+    output_path = sys.argv[1] if len(sys.argv) == 2 else DEFAULT_OUTPUT
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w") as table_file:
+        run_benchmark(table_file)
+    with open(output_path, "r") as table_file:
+        print(table_file.read(), end="")
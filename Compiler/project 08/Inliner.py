@@ -0,0 +1,256 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from Parser import VMCommand, ARITHMETIC_COMMAND, NO_ARG2
+from DeadFunctions import split_functions
+
+PUSH = "C_PUSH"
+POP = "C_POP"
+FUNCTION = "C_FUNCTION"
+CALL = "C_CALL"
+RETURN = "C_RETURN"
+BRANCH_COMMANDS = ["C_LABEL", "C_GOTO", "C_IF"]
+ARGUMENT = "argument"
+LOCAL = "local"
+TEMP = "temp"
+POINTER = "pointer"
+STATIC = "static"
+CONSTANT = "constant"
+TEMP_SIZE = 8
+UNARY_COMMANDS = ["neg", "not", "shiftleft", "shiftright"]
+# the commands of the largest body that is inlined, without function and
+# return, and the ROM words an inlined call may add to the call it replaces
+MAX_INLINE_COMMANDS = 16
+INLINE_GROWTH_WORDS = 64
+
+
+def stack_effect(command: VMCommand) -> int:
+    """Returns how many entries a command adds to the stack (or removes)."""
+    if command.opcode == PUSH:
+        return 1
+    if command.opcode == POP:
+        return -1
+    if command.opcode == CALL:
+        return 1 - command.arg2
+    if command.opcode == ARITHMETIC_COMMAND:
+        return 0 if command.arg1 in UNARY_COMMANDS else -1
+    return 0
+
+
+class InlineCandidate:
+    """A function that was considered for inlining, and what was decided."""
+
+    def __init__(self, name: str, filename: str, n_vars: int,
+                 body: typing.List[VMCommand]) -> None:
+        """
+        Args:
+            name (str): the name of the function.
+            filename (str): the file it is in, whose static segment it uses.
+            n_vars (int): the number of its local variables.
+            body (typing.List[VMCommand]): its commands, without the function
+            command and the return at the end.
+        """
+        self.name = name
+        self.filename = filename
+        self.n_vars = n_vars
+        self.body = body
+        self.n_args = 1 + max([command.arg2 for command in body
+                               if command.arg1 == ARGUMENT], default=-1)
+        self.uses_static = any(command.arg1 == STATIC for command in body)
+        self.saved_pointers = sorted({command.arg2 for command in body
+                                      if command.opcode == POP and command.arg1 == POINTER})
+        used_temps = {command.arg2 for command in body if command.arg1 == TEMP}
+        self.free_temps = [index for index in range(TEMP_SIZE) if index not in used_temps]
+        self.sites = 0
+        # the ROM words an inlined call adds, and the instructions it saves
+        self.growth = 0
+        self.benefit = 0
+        # why it is not inlined, or None if it is
+        self.reason = None
+
+
+class Inliner:
+    """
+    Replaces the calls of small functions with their bodies, which saves the
+    frame that call builds and return tears down: about 90 instructions per
+    call, for getters, setters and wrappers of a few commands.
+
+    A function is inlined if it is straight code (no labels or branches)
+    with a single return at the end, that never reaches below the stack it
+    starts with and leaves exactly the value it returns; if it can not call
+    itself, directly or not; if it does not touch its arguments or locals
+    after a call it makes (which may change the temp segment); and if the
+    cost model allows it: at most MAX_INLINE_COMMANDS commands, that add at
+    most max_growth ROM words to each call they replace, and run faster than
+    the call. The code of a call, of a straight function and of its return
+    runs every instruction once, so the instructions saved are the ROM words
+    of call, function, body and return less those of the inlined body.
+
+    An inlined call pops the arguments to temp entries the body does not
+    use, and the body reads them and its locals from there. This is safe
+    because a caller can not rely on the temp segment across a call. If the
+    body sets pointer 0 or 1, the pointer is saved on the stack under the
+    body and restored after it, the way return restores THIS and THAT. A
+    body that uses its static segment is only inlined into its own file.
+    """
+
+    def __init__(self, rom_words: typing.Optional[typing.Callable[[typing.List[VMCommand]], int]] = None,
+                 max_growth: int = INLINE_GROWTH_WORDS,
+                 inlined: typing.Optional[typing.Dict[str, InlineCandidate]] = None) -> None:
+        """
+        Args:
+            rom_words (typing.Callable[[typing.List[VMCommand]], int]):
+            returns the ROM words of translated commands, for the cost model.
+            max_growth (int): the ROM words an inlined call may add.
+            inlined (typing.Optional[typing.Dict[str, InlineCandidate]]): the
+            functions to inline, if they are known (in a worker process, from
+            the analysis of the main one), or None until analyze().
+        """
+        self.rom_words = rom_words
+        self.max_growth = max_growth
+        self.candidates = {}
+        self.inlined = inlined if inlined is not None else {}
+        # the calls replaced, by function
+        self.hits = {name: 0 for name in self.inlined}
+
+    def analyze(self, programs: typing.Dict[str, typing.List[VMCommand]]) -> None:
+        """Decides which functions to inline, given the commands of every
+        file of a program, by the name of the file.
+        """
+        callees = {}
+        for filename, commands in programs.items():
+            for name, body in split_functions(commands):
+                if name is None:
+                    continue
+                callees[name] = {command.arg1 for command in body if command.opcode == CALL}
+                if len(body) >= 2 and body[-1].opcode == RETURN:
+                    self.candidates[name] = InlineCandidate(name, filename, body[0].arg2, body[1:-1])
+                else:
+                    self.candidates[name] = InlineCandidate(name, filename, body[0].arg2, body[1:])
+                    self.candidates[name].reason = "no single return"
+        for commands in programs.values():
+            for command in commands:
+                if command.opcode == CALL and command.arg1 in self.candidates:
+                    self.candidates[command.arg1].sites += 1
+        for name, candidate in self.candidates.items():
+            if candidate.sites and candidate.reason is None:
+                candidate.reason = self.rejection(candidate, callees)
+            if candidate.sites and candidate.reason is None:
+                self.inlined[name] = candidate
+        self.hits = {name: 0 for name in self.inlined}
+
+    def rejection(self, candidate: InlineCandidate,
+                  callees: typing.Dict[str, typing.Set[str]]) -> typing.Optional[str]:
+        """Returns why a function can not be inlined, or None if it can."""
+        body = candidate.body
+        if any(command.opcode in BRANCH_COMMANDS for command in body):
+            return "branches"
+        if any(command.opcode == RETURN for command in body):
+            return "no single return"
+        if len(body) > MAX_INLINE_COMMANDS:
+            return "too large"
+        if self.is_recursive(candidate.name, callees):
+            return "recursive"
+        depth = 0
+        for command in body:
+            depth += stack_effect(command)
+            if depth < 0:
+                return "pops its caller's stack"
+        if depth != 1:
+            return "leaves {} values".format(depth)
+        calls = [index for index, command in enumerate(body) if command.opcode == CALL]
+        if calls and any(command.arg1 in [ARGUMENT, LOCAL] for command in body[calls[0]:]):
+            return "frame used after a call"
+        if candidate.n_args + candidate.n_vars > len(candidate.free_temps) \
+                or not candidate.free_temps:
+            return "not enough temp"
+        call_words = self.rom_words([VMCommand(CALL, candidate.name, candidate.n_args, 0)])
+        function_words = self.rom_words(
+            [VMCommand(FUNCTION, candidate.name, candidate.n_vars, 0)] + body
+            + [VMCommand(RETURN, "", NO_ARG2, 0)])
+        expansion_words = self.rom_words(self.expand(candidate, candidate.n_args, 0))
+        candidate.growth = expansion_words - call_words
+        candidate.benefit = call_words + function_words - expansion_words
+        if candidate.benefit <= 0:
+            return "slower"
+        if candidate.growth > self.max_growth:
+            return "grows {} words".format(candidate.growth)
+        return None
+
+    def is_recursive(self, name: str, callees: typing.Dict[str, typing.Set[str]]) -> bool:
+        """Returns whether a function can call itself, directly or not."""
+        visited = set()
+        pending = list(callees.get(name, []))
+        while pending:
+            callee = pending.pop()
+            if callee == name:
+                return True
+            if callee not in visited:
+                visited.add(callee)
+                pending += callees.get(callee, [])
+        return False
+
+    def expand(self, candidate: InlineCandidate, n_args: int, line: int) -> typing.List[VMCommand]:
+        """Returns the commands that replace a call of a function with n_args
+        arguments.
+        """
+        slots = candidate.free_temps
+        expansion = [VMCommand(POP, TEMP, slots[index], line) for index in reversed(range(n_args))]
+        expansion += [VMCommand(PUSH, POINTER, pointer, line) for pointer in candidate.saved_pointers]
+        for index in range(candidate.n_vars):
+            expansion += [VMCommand(PUSH, CONSTANT, 0, line),
+                          VMCommand(POP, TEMP, slots[n_args + index], line)]
+        for command in candidate.body:
+            if command.arg1 == ARGUMENT:
+                command = VMCommand(command.opcode, TEMP, slots[command.arg2], line)
+            elif command.arg1 == LOCAL:
+                command = VMCommand(command.opcode, TEMP, slots[n_args + command.arg2], line)
+            expansion.append(command)
+        if candidate.saved_pointers:
+            # the value of the body is over the saved pointers
+            expansion.append(VMCommand(POP, TEMP, slots[0], line))
+            expansion += [VMCommand(POP, POINTER, pointer, line)
+                          for pointer in reversed(candidate.saved_pointers)]
+            expansion.append(VMCommand(PUSH, TEMP, slots[0], line))
+        return expansion
+
+    def inline(self, commands: typing.List[VMCommand], filename: str) -> typing.List[VMCommand]:
+        """Returns the commands of a file with the calls of the inlined
+        functions replaced by their bodies.
+        """
+        if not self.inlined:
+            return commands
+        inlined = []
+        for command in commands:
+            candidate = self.inlined.get(command.arg1) if command.opcode == CALL else None
+            if candidate is None or command.arg2 < candidate.n_args \
+                    or command.arg2 + candidate.n_vars > len(candidate.free_temps) \
+                    or (candidate.uses_static and candidate.filename != filename):
+                inlined.append(command)
+                continue
+            inlined += self.expand(candidate, command.arg2, command.line)
+            self.hits[candidate.name] += 1
+        return inlined
+
+    def write_report(self, output: typing.TextIO) -> None:
+        """Writes every called function that was considered, with its call
+        sites, size, the words an inlined call adds, the instructions it saves
+        and the decision, and the calls inlined.
+        """
+        output.write("function".ljust(30) + "sites".rjust(6) + "size".rjust(6)
+                     + "growth".rjust(8) + "benefit".rjust(9) + "  decision\n")
+        for name, candidate in sorted(self.candidates.items()):
+            if not candidate.sites:
+                continue
+            decision = "inlined {}".format(self.hits[name]) if name in self.inlined \
+                else candidate.reason
+            output.write(name.ljust(30) + str(candidate.sites).rjust(6)
+                         + str(len(candidate.body)).rjust(6) + str(candidate.growth).rjust(8)
+                         + str(candidate.benefit).rjust(9) + "  " + decision + "\n")
+        output.write("inlined {} calls of {} functions\n".format(
+            sum(self.hits.values()), len(self.inlined)))
@@ -0,0 +1,340 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import os
+import sys
+import time
+import typing
+from VMEmulator import VMEmulator, VMError, WORD_MASK, SIGN_BIT
+
+HEAP_BASE = 2048
+HEAP_END = 16384
+NULL = 0
+# the rows and columns of characters Output has on the screen
+ROWS = 23
+COLUMNS = 64
+NEW_LINE = 128
+BACKSPACE = 129
+DOUBLE_QUOTE = 34
+# the error codes of the Jack OS, reported as Sys.error would
+NON_POSITIVE_ARRAY_SIZE = 2
+DIVIDE_BY_ZERO = 3
+NEGATIVE_SQUARE_ROOT = 4
+NON_POSITIVE_ALLOCATION = 5
+HEAP_OVERFLOW = 6
+NEGATIVE_STRING_LENGTH = 14
+CHAR_AT_OUT_OF_BOUNDS = 15
+SET_CHAR_AT_OUT_OF_BOUNDS = 16
+STRING_FULL = 17
+STRING_EMPTY = 18
+INSUFFICIENT_STRING_CAPACITY = 19
+# the fields of a String object
+STRING_CHARS = 0
+STRING_LENGTH = 1
+STRING_MAX_LENGTH = 2
+STRING_SIZE = 3
+CLASSES = ["Math", "Memory", "Array", "String", "Output"]
+
+
+def to_signed(word: int) -> int:
+    return word - 0x10000 if word & SIGN_BIT else word
+
+
+def error(code: int) -> VMError:
+    return VMError("Sys.error " + str(code))
+
+
+class JackOS:
+    """
+    Native Python versions of the Jack OS classes that compiled programs
+    call the most: Math (every "*" and "/" is a call), Memory and Array,
+    String (every string constant is a String.new and an appendChar per
+    character) and Output. Pass natives() to a VMEmulator to bind them.
+
+    Classes are replaced as a whole, since they share internal layouts:
+    the heap is a first-fit free list in RAM[2048..16383] whose blocks keep
+    their length in the word before them, and a String is a 3-word object
+    (chars array, length, max length). Everything lives in the RAM of the
+    emulator, so the programs see the same memory they would with the .vm
+    versions of these classes, except for the heap addresses the allocator
+    picks. Output keeps its text in a grid of characters (see screen_text)
+    instead of drawing the font into the screen memory map.
+    """
+
+    def __init__(self) -> None:
+        self.free_list = None
+        self.text = [[" "] * COLUMNS for _ in range(ROWS)]
+        self.row = 0
+        self.column = 0
+
+    def natives(self, classes: typing.List[str] = CLASSES) \
+            -> typing.Dict[str, typing.Callable[..., int]]:
+        """Returns the native functions of the given classes, by the VM
+        names of the functions they replace.
+        """
+        functions = {
+            "Math.init": self.math_init, "Math.abs": self.abs,
+            "Math.multiply": self.multiply, "Math.divide": self.divide,
+            "Math.min": self.min, "Math.max": self.max, "Math.sqrt": self.sqrt,
+            "Memory.init": self.memory_init, "Memory.peek": self.peek,
+            "Memory.poke": self.poke, "Memory.alloc": self.alloc,
+            "Memory.deAlloc": self.de_alloc,
+            "Array.new": self.array_new, "Array.dispose": self.de_alloc,
+            "String.new": self.string_new, "String.dispose": self.string_dispose,
+            "String.length": self.string_length, "String.charAt": self.char_at,
+            "String.setCharAt": self.set_char_at,
+            "String.appendChar": self.append_char,
+            "String.eraseLastChar": self.erase_last_char,
+            "String.intValue": self.int_value, "String.setInt": self.set_int,
+            "String.newLine": self.new_line, "String.backSpace": self.back_space,
+            "String.doubleQuote": self.double_quote,
+            "Output.init": self.output_init, "Output.moveCursor": self.move_cursor,
+            "Output.printChar": self.print_char,
+            "Output.printString": self.print_string,
+            "Output.printInt": self.print_int, "Output.println": self.println,
+            "Output.backSpace": self.output_back_space}
+        return {name: function for name, function in functions.items()
+                if name.split(".")[0] in classes}
+
+    # Math
+
+    def math_init(self, ram) -> int:
+        return 0
+
+    def abs(self, ram, x: int) -> int:
+        return abs(to_signed(x))
+
+    def multiply(self, ram, x: int, y: int) -> int:
+        return x * y
+
+    def divide(self, ram, x: int, y: int) -> int:
+        x, y = to_signed(x), to_signed(y)
+        if y == 0:
+            raise error(DIVIDE_BY_ZERO)
+        quotient = abs(x) // abs(y)
+        return -quotient if (x < 0) != (y < 0) else quotient
+
+    def min(self, ram, x: int, y: int) -> int:
+        return min(to_signed(x), to_signed(y))
+
+    def max(self, ram, x: int, y: int) -> int:
+        return max(to_signed(x), to_signed(y))
+
+    def sqrt(self, ram, x: int) -> int:
+        x = to_signed(x)
+        if x < 0:
+            raise error(NEGATIVE_SQUARE_ROOT)
+        root = int(x ** 0.5)
+        while root * root > x:
+            root -= 1
+        while (root + 1) * (root + 1) <= x:
+            root += 1
+        return root
+
+    # Memory and Array
+
+    def memory_init(self, ram) -> int:
+        """Makes the whole heap a single free segment."""
+        self.free_list = HEAP_BASE
+        ram[HEAP_BASE] = HEAP_END - HEAP_BASE - 1
+        ram[HEAP_BASE + 1] = NULL
+        return 0
+
+    def peek(self, ram, address: int) -> int:
+        return ram[address]
+
+    def poke(self, ram, address: int, value: int) -> int:
+        ram[address] = value
+        return 0
+
+    def alloc(self, ram, size: int) -> int:
+        """Finds the first free segment that fits a block of size words and
+        takes the block from its end, or the whole segment if it is too small
+        to split.
+        """
+        size = to_signed(size)
+        if size <= 0:
+            raise error(NON_POSITIVE_ALLOCATION)
+        if self.free_list is None:
+            self.memory_init(ram)
+        previous, segment = NULL, self.free_list
+        while segment != NULL:
+            length = ram[segment]
+            if length >= size + 2:
+                ram[segment] = length - size - 1
+                block = segment + 1 + ram[segment]
+                ram[block] = size
+                return block + 1
+            if length >= size:
+                if previous == NULL:
+                    self.free_list = ram[segment + 1]
+                else:
+                    ram[previous + 1] = ram[segment + 1]
+                return segment + 1
+            previous, segment = segment, ram[segment + 1]
+        raise error(HEAP_OVERFLOW)
+
+    def array_new(self, ram, size: int) -> int:
+        if to_signed(size) <= 0:
+            raise error(NON_POSITIVE_ARRAY_SIZE)
+        return self.alloc(ram, size)
+
+    def de_alloc(self, ram, block: int) -> int:
+        """Puts a block back at the head of the free list."""
+        ram[block] = self.free_list if self.free_list is not None else NULL
+        self.free_list = block - 1
+        return 0
+
+    # String
+
+    def string_new(self, ram, max_length: int) -> int:
+        max_length = to_signed(max_length)
+        if max_length < 0:
+            raise error(NEGATIVE_STRING_LENGTH)
+        string = self.alloc(ram, STRING_SIZE)
+        ram[string + STRING_CHARS] = self.alloc(ram, max(max_length, 1))
+        ram[string + STRING_LENGTH] = 0
+        ram[string + STRING_MAX_LENGTH] = max_length
+        return string
+
+    def string_dispose(self, ram, string: int) -> int:
+        self.de_alloc(ram, ram[string + STRING_CHARS])
+        return self.de_alloc(ram, string)
+
+    def string_length(self, ram, string: int) -> int:
+        return ram[string + STRING_LENGTH]
+
+    def char_at(self, ram, string: int, index: int) -> int:
+        if to_signed(index) < 0 or index >= ram[string + STRING_LENGTH]:
+            raise error(CHAR_AT_OUT_OF_BOUNDS)
+        return ram[ram[string + STRING_CHARS] + index]
+
+    def set_char_at(self, ram, string: int, index: int, char: int) -> int:
+        if to_signed(index) < 0 or index >= ram[string + STRING_LENGTH]:
+            raise error(SET_CHAR_AT_OUT_OF_BOUNDS)
+        ram[ram[string + STRING_CHARS] + index] = char
+        return 0
+
+    def append_char(self, ram, string: int, char: int) -> int:
+        length = ram[string + STRING_LENGTH]
+        if length >= ram[string + STRING_MAX_LENGTH]:
+            raise error(STRING_FULL)
+        ram[ram[string + STRING_CHARS] + length] = char
+        ram[string + STRING_LENGTH] = length + 1
+        return string
+
+    def erase_last_char(self, ram, string: int) -> int:
+        if ram[string + STRING_LENGTH] == 0:
+            raise error(STRING_EMPTY)
+        ram[string + STRING_LENGTH] -= 1
+        return 0
+
+    def string_value(self, ram, string: int) -> str:
+        chars = ram[string + STRING_CHARS]
+        return "".join(chr(ram[chars + index])
+                       for index in range(ram[string + STRING_LENGTH]))
+
+    def int_value(self, ram, string: int) -> int:
+        value = self.string_value(ram, string)
+        sign = -1 if value.startswith("-") else 1
+        number = 0
+        for char in value[1:] if sign < 0 else value:
+            if not "0" <= char <= "9":
+                break
+            number = number * 10 + ord(char) - ord("0")
+        return (sign * number) & WORD_MASK
+
+    def set_int(self, ram, string: int, number: int) -> int:
+        digits = str(to_signed(number))
+        if len(digits) > ram[string + STRING_MAX_LENGTH]:
+            raise error(INSUFFICIENT_STRING_CAPACITY)
+        chars = ram[string + STRING_CHARS]
+        for index, char in enumerate(digits):
+            ram[chars + index] = ord(char)
+        ram[string + STRING_LENGTH] = len(digits)
+        return 0
+
+    def new_line(self, ram) -> int:
+        return NEW_LINE
+
+    def back_space(self, ram) -> int:
+        return BACKSPACE
+
+    def double_quote(self, ram) -> int:
+        return DOUBLE_QUOTE
+
+    # Output
+
+    def output_init(self, ram) -> int:
+        self.text = [[" "] * COLUMNS for _ in range(ROWS)]
+        self.row = 0
+        self.column = 0
+        return 0
+
+    def move_cursor(self, ram, row: int, column: int) -> int:
+        self.row = to_signed(row) % ROWS
+        self.column = to_signed(column) % COLUMNS
+        return 0
+
+    def print_char(self, ram, char: int) -> int:
+        if char == NEW_LINE:
+            return self.println(ram)
+        if char == BACKSPACE:
+            return self.output_back_space(ram)
+        self.text[self.row][self.column] = chr(char) if 32 <= char < 127 else " "
+        self.column += 1
+        if self.column == COLUMNS:
+            self.println(ram)
+        return 0
+
+    def print_string(self, ram, string: int) -> int:
+        for char in self.string_value(ram, string):
+            self.print_char(ram, ord(char))
+        return 0
+
+    def print_int(self, ram, number: int) -> int:
+        for char in str(to_signed(number)):
+            self.print_char(ram, ord(char))
+        return 0
+
+    def println(self, ram) -> int:
+        self.column = 0
+        self.row = (self.row + 1) % ROWS
+        return 0
+
+    def output_back_space(self, ram) -> int:
+        if self.column > 0:
+            self.column -= 1
+        elif self.row > 0:
+            self.row -= 1
+            self.column = COLUMNS - 1
+        self.text[self.row][self.column] = " "
+        return 0
+
+    def screen_text(self) -> str:
+        """Returns what Output printed, as lines of text."""
+        return "\n".join("".join(line).rstrip() for line in self.text).rstrip("\n")
+
+
+if "__main__" == __name__:
+    # Runs a VM program with the native OS classes and prints what it wrote
+    # with Output, e.g.: JackOS Pong 10000000
+    if len(sys.argv) not in [2, 3]:
+        sys.exit("Invalid usage, please use: JackOS <input path> [max steps]")
+    jack_os = JackOS()
+    emulator = VMEmulator(jack_os.natives())
+    try:
+        emulator.load(os.path.abspath(sys.argv[1]))
+        emulator.start()
+        start = time.perf_counter()
+        halt_reason = emulator.run(int(sys.argv[2]) if len(sys.argv) == 3 else 10 ** 7)
+    except VMError as vm_error:
+        sys.exit(str(vm_error))
+    seconds = time.perf_counter() - start
+    print(jack_os.screen_text())
+    print("stopped:", halt_reason, "after", emulator.steps, "commands in",
+          "%.3f" % seconds, "seconds")
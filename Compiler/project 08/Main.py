@@ -5,11 +5,23 @@ was written by Aviv Yaish. It is an extension to the specifications given
 as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
 Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
+import argparse
+import concurrent.futures
+import functools
+import io
+import itertools
 import os
 import sys
 import typing
-from Parser import Parser
-from CodeWriter import CodeWriter
+from Parser import Parser, VMCommand
+from CodeWriter import CodeWriter, LOCALS_LOOP_THRESHOLD, rom_words
+from CachingCodeWriter import CachingCodeWriter
+from Peephole import PeepholeOptimizer, ADD_CONSTANT, INCREMENT, DECREMENT, \
+    ARRAY_STORE, POP_PUSH
+from ConstantFolder import ConstantFolder, PUSH_VALUE
+from DeadFunctions import DeadFunctionEliminator
+from VMEmulator import vm_files
+from Inliner import Inliner, InlineCandidate, INLINE_GROWTH_WORDS
 
 ARITHMETIC_COMMANDS = ["add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not"]
 ARITHMETIC_COMMAND = "C_ARITHMETIC"
@@ -26,12 +38,39 @@ LT = "lt"
 AND = "and"
 OR = "or"
 NOT = "not"
+SHIFT_LEFT = "shiftleft"
+SHIFT_RIGHT = "shiftright"
 LABEL = "label"
 GOTO = "goto"
 IF_GOTO = "if-goto"
 MATHEMATICAL_OPERATION = ["add", "sub", "neg"]
 COMPARE_OPERATION = ["eq", "gt", "lt"]
 LOGICAL_OPERATION = ["and", "or", "not"]
+# evaluates constant commands, if not None
+folder: typing.Optional[ConstantFolder] = None
+# replaces windows of commands with superinstructions, if not None
+optimizer: typing.Optional[PeepholeOptimizer] = None
+# drops the functions the program cannot reach, if not None
+eliminator: typing.Optional[DeadFunctionEliminator] = None
+# replaces the calls of small functions with their bodies, if not None
+inliner: typing.Optional[Inliner] = None
+
+
+class FileTranslation:
+    """The assembly of a file translated by a worker process, with what its
+    writer and optimizers counted, to be merged into those of the main
+    process.
+    """
+
+    def __init__(self, asm: str, shared_uses: typing.Dict[str, int], shared_site_words: int,
+                 fold_hits: typing.Dict[str, int], peephole_hits: typing.Dict[str, int],
+                 inline_hits: typing.Dict[str, int]) -> None:
+        self.asm = asm
+        self.shared_uses = shared_uses
+        self.shared_site_words = shared_site_words
+        self.fold_hits = fold_hits
+        self.peephole_hits = peephole_hits
+        self.inline_hits = inline_hits
 
 
 def translate_file(input_file: typing.TextIO, output_file: typing.TextIO, bootstrap: bool) -> None:
@@ -44,78 +83,149 @@ def translate_file(input_file: typing.TextIO, output_file: typing.TextIO, bootst
     # initialize objects
     parser = Parser(input_file)
     if bootstrap:
-        code_writer.initialize_file()
-        code_writer.write_call("Sys.init", 0)
+        write_bootstrap(code_writer)
 
     # translation
-    parser.advance()
-    while parser.has_more_commands():
-        command_type = parser.command_type()
-        if command_type == ARITHMETIC_COMMAND:
-            handle_arithmetic_command(code_writer, parser)
-        # memory access commands (push/pop)
-        elif command_type in MEMORY_ACCESS_COMMANDS:
-            handle_memory_access_command(code_writer, parser)
-        # branch command (label/goto/if-goto)
-        elif command_type in LABEL_COMMANDS:
-            handle_branch_command(code_writer, parser)
-        # function command (function/call/return)
-        elif command_type in FUNCTION_COMMANDS:
-            handle_function_command(code_writer, parser)
-        parser.advance()
-    last_instruction_type = parser.command_type()
-    if last_instruction_type == ARITHMETIC_COMMAND:
-        handle_arithmetic_command(code_writer, parser)
-    # memory access commands (push/pop)
-    elif last_instruction_type in MEMORY_ACCESS_COMMANDS:
-        handle_memory_access_command(code_writer, parser)
-    elif last_instruction_type in LABEL_COMMANDS:
-        handle_branch_command(code_writer, parser)
-    elif last_instruction_type in FUNCTION_COMMANDS:
-        handle_function_command(code_writer, parser)
-
-
-def execute_function(code_writer: CodeWriter, command: str, function_name: str, n_args: int) -> None:
-    if command == "C_CALL":
-        code_writer.write_call(function_name, n_args)
-    # command is function
-    else:
-        code_writer.write_function(function_name, n_args)
+    commands = parser.commands
+    if inliner is not None:
+        commands = inliner.inline(commands, code_writer.filename)
+    if eliminator is not None:
+        commands = eliminator.eliminate(commands)
+    if folder is not None:
+        commands = folder.fold(commands)
+    if optimizer is not None:
+        commands = optimizer.optimize(commands)
+    dispatch_table = build_dispatch_table(code_writer)
+    for command in commands:
+        dispatch_table[command.opcode](command)
+        code_writer.flush_if_full()
 
 
-def handle_function_command(code_writer: CodeWriter, parser: Parser) -> None:
-    command = parser.command_type()
-    if command == "C_RETURN":
-        code_writer.write_return()
-    else:
-        function_name = parser.arg1()
-        n_args = parser.arg2()
-        execute_function(code_writer, command, function_name, n_args)
+def write_bootstrap(code_writer: CodeWriter) -> None:
+    """Writes the code that sets SP and calls Sys.init, once per program."""
+    code_writer.initialize_file()
+    code_writer.write_call("Sys.init", 0)
+
 
+def parse_path(input_path: str) -> typing.List[VMCommand]:
+    """Returns the commands of the .vm file at input_path."""
+    with open(input_path, 'r') as input_file:
+        return Parser(input_file).commands
 
-def handle_memory_access_command(code_writer: CodeWriter, parser: Parser) -> None:
-    command = parser.command_type()
-    segment = parser.arg1()
-    index = parser.arg2()
-    code_writer.write_push_pop(command, segment, index)
 
+def translated_rom_words(commands: typing.List[VMCommand], writer_class: typing.Type[CodeWriter],
+                         writer_options: typing.Dict[str, typing.Any]) -> int:
+    """Returns the ROM words commands take when they are translated the way
+    translate_file would, with optimizers of their own so that their hits
+    are not counted.
+    """
+    if folder is not None:
+        commands = ConstantFolder().fold(commands)
+    if optimizer is not None:
+        commands = PeepholeOptimizer().optimize(commands)
+    asm = io.StringIO()
+    scratch_writer = writer_class(asm, buffered=False, **writer_options)
+    dispatch_table = build_dispatch_table(scratch_writer)
+    for command in commands:
+        dispatch_table[command.opcode](command)
+    scratch_writer.end_file()
+    return rom_words(asm.getvalue())
 
-def handle_arithmetic_command(code_writer: CodeWriter, parser: Parser) -> None:
-    command = parser.arg1()
-    switch_command = {ADD: code_writer.add, SUB: code_writer.sub, NEG: code_writer.neg, EQ: code_writer.eq,
-                      GT: code_writer.gt, LT: code_writer.lt, AND: code_writer.and_, OR: code_writer.or_,
-                      NOT: code_writer.not_}
-    command_to_execute = switch_command[command]
-    command_to_execute()
 
+def translate_path(input_path: str) -> None:
+    """Translates the .vm file at input_path with code_writer, as a unit of
+    its own: the labels of the writer are scoped to the file, and nothing of
+    it is left in the writer at the end.
+    """
+    with open(input_path, 'r') as input_file:
+        input_filename, input_extension = os.path.splitext(os.path.basename(input_file.name))
+        code_writer.set_file_name(input_filename)
+        translate_file(input_file, code_writer.output_stream, False)
+    code_writer.end_file()
 
-def handle_branch_command(code_writer: CodeWriter, parser: Parser) -> None:
-    command = parser.command_type()
-    switch_command = {"C_LABEL": code_writer.write_label, "C_GOTO": code_writer.write_goto,
-                      "C_IF": code_writer.write_if}
-    label = parser.arg1()
-    command_to_execute = switch_command[command]
-    command_to_execute(label)
+
+def translate_in_worker(input_path: str, writer_class: typing.Type[CodeWriter],
+                        writer_options: typing.Dict[str, typing.Any], fold: bool,
+                        peephole: bool, reachable: typing.Optional[typing.Set[str]],
+                        inlined: typing.Optional[typing.Dict[str, InlineCandidate]]) -> FileTranslation:
+    """Translates a .vm file in a worker process, with a writer and
+    optimizers of its own. Only the reachable functions are translated, if
+    they are not None, and the calls of the inlined ones are inlined.
+    """
+    global code_writer, folder, optimizer, eliminator, inliner
+    asm = io.StringIO()
+    code_writer = writer_class(asm, **writer_options)
+    folder = ConstantFolder() if fold else None
+    optimizer = PeepholeOptimizer() if peephole else None
+    eliminator = DeadFunctionEliminator(reachable) if reachable is not None else None
+    inliner = Inliner(inlined=inlined) if inlined is not None else None
+    translate_path(input_path)
+    code_writer.flush()
+    return FileTranslation(asm.getvalue(), code_writer.shared_uses,
+                           code_writer.shared_site_words,
+                           folder.hits if folder is not None else {},
+                           optimizer.hits if optimizer is not None else {},
+                           inliner.hits if inliner is not None else {})
+
+
+def translate_files(input_paths: typing.List[str], jobs: int,
+                    writer_options: typing.Dict[str, typing.Any]) -> None:
+    """Translates the .vm files with code_writer, after the bootstrap, in the
+    order of input_paths. With more than one job, the files are translated
+    on a pool of worker processes, and their assembly is written in the same
+    order, so the output does not depend on the number of jobs.
+    """
+    if jobs <= 1:
+        for input_path in input_paths:
+            translate_path(input_path)
+        return
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        translations = pool.map(translate_in_worker, input_paths,
+                                itertools.repeat(type(code_writer)),
+                                itertools.repeat(writer_options),
+                                itertools.repeat(folder is not None),
+                                itertools.repeat(optimizer is not None),
+                                itertools.repeat(eliminator.reachable if eliminator is not None else None),
+                                itertools.repeat(inliner.inlined if inliner is not None else None))
+        for translation in translations:
+            code_writer.output_file.write(translation.asm)
+            code_writer.flush_if_full()
+            for command, uses in translation.shared_uses.items():
+                code_writer.shared_uses[command] += uses
+            code_writer.shared_site_words += translation.shared_site_words
+            for name, hits in translation.fold_hits.items():
+                folder.hits[name] += hits
+            for name, hits in translation.peephole_hits.items():
+                optimizer.hits[name] += hits
+            for name, hits in translation.inline_hits.items():
+                inliner.hits[name] += hits
+
+
+def build_dispatch_table(code_writer: CodeWriter) -> typing.Dict[str, typing.Callable[[VMCommand], None]]:
+    """Returns the function that translates each type of command, built once
+    per file instead of once per command.
+    """
+    arithmetic_commands = {ADD: code_writer.add, SUB: code_writer.sub, NEG: code_writer.neg, EQ: code_writer.eq,
+                           GT: code_writer.gt, LT: code_writer.lt, AND: code_writer.and_, OR: code_writer.or_,
+                           NOT: code_writer.not_, SHIFT_LEFT: code_writer.shift_left,
+                           SHIFT_RIGHT: code_writer.shift_right}
+    write_push_pop = code_writer.write_push_pop
+    return {
+        ARITHMETIC_COMMAND: lambda command: arithmetic_commands[command.arg1](),
+        "C_PUSH": lambda command: write_push_pop("C_PUSH", command.arg1, command.arg2),
+        "C_POP": lambda command: write_push_pop("C_POP", command.arg1, command.arg2),
+        "C_LABEL": lambda command: code_writer.write_label(command.arg1),
+        "C_GOTO": lambda command: code_writer.write_goto(command.arg1),
+        "C_IF": lambda command: code_writer.write_if(command.arg1),
+        "C_FUNCTION": lambda command: code_writer.write_function(command.arg1, command.arg2),
+        "C_CALL": lambda command: code_writer.write_call(command.arg1, command.arg2),
+        "C_RETURN": lambda command: code_writer.write_return(),
+        ADD_CONSTANT: lambda command: code_writer.write_add_constant(command.arg1, command.arg2),
+        INCREMENT: lambda command: code_writer.write_increment(command.arg1, command.arg2),
+        DECREMENT: lambda command: code_writer.write_decrement(command.arg1, command.arg2),
+        ARRAY_STORE: lambda command: code_writer.write_array_store(),
+        POP_PUSH: lambda command: code_writer.write_pop_push(command.arg1, command.arg2),
+        PUSH_VALUE: lambda command: code_writer.write_push_value(command.arg2)}
 
 
 if "__main__" == __name__:
@@ -124,30 +234,86 @@ if "__main__" == __name__:
     # Both are closed automatically when the code finishes running.
     # If the output file does not exist, it is created automatically in the
     # correct path, using the correct filename.
-    if not len(sys.argv) == 2:
-        sys.exit("Invalid usage, please use: VMtranslator <input path>")
-    argument_path = os.path.abspath(sys.argv[1])
+    arg_parser = argparse.ArgumentParser(
+        description="Translates VM code into Hack assembly.",
+        usage="VMtranslator <input path> [options]")
+    arg_parser.add_argument("input_path", help="a .vm file or a directory of them")
+    arg_parser.add_argument("--shared-comparisons", action="store_true",
+                            help="jump to one shared routine for each of eq, gt "
+                                 "and lt instead of inlining them")
+    arg_parser.add_argument("--shared-calls", action="store_true",
+                            help="jump to one shared routine for call and one "
+                                 "for return instead of inlining them")
+    arg_parser.add_argument("--locals-loop-threshold", type=int,
+                            default=LOCALS_LOOP_THRESHOLD,
+                            help="zero the locals of functions with at least this "
+                                 "many in a loop (default: %(default)s)")
+    arg_parser.add_argument("--fold", action="store_true",
+                            help="evaluate constant expressions at translation "
+                                 "time, and print how many were folded")
+    arg_parser.add_argument("--peephole", action="store_true",
+                            help="replace common windows of commands with "
+                                 "superinstructions, and print the hits of every rule")
+    arg_parser.add_argument("--cache-top", action="store_true",
+                            help="keep the top of the stack in D between commands")
+    arg_parser.add_argument("--jobs", type=int, default=1,
+                            help="translate the files on this many worker "
+                                 "processes (default: %(default)s)")
+    arg_parser.add_argument("--eliminate-dead", action="store_true",
+                            help="drop the functions Sys.init cannot reach, and "
+                                 "print them with the ROM words they took")
+    arg_parser.add_argument("--inline", action="store_true",
+                            help="replace the calls of small functions with their "
+                                 "bodies, and print what was decided for each")
+    arg_parser.add_argument("--inline-growth", type=int, default=INLINE_GROWTH_WORDS,
+                            help="the ROM words an inlined call may add to the "
+                                 "call it replaces (default: %(default)s)")
+    arguments = arg_parser.parse_args()
+    argument_path = os.path.abspath(arguments.input_path)
+    files_to_translate = vm_files(argument_path)
     if os.path.isdir(argument_path):
-        files_to_translate = [
-            os.path.join(argument_path, filename)
-            for filename in os.listdir(argument_path)]
         output_path = os.path.join(argument_path, os.path.basename(
             argument_path))
     else:
-        files_to_translate = [argument_path]
         output_path, extension = os.path.splitext(argument_path)
     output_path += ".asm"
-    bootstrap = True
+    if arguments.fold:
+        folder = ConstantFolder()
+    if arguments.peephole:
+        optimizer = PeepholeOptimizer()
+    writer_class = CachingCodeWriter if arguments.cache_top else CodeWriter
+    options = {"shared_comparisons": arguments.shared_comparisons,
+               "shared_calls": arguments.shared_calls,
+               "locals_loop_threshold": arguments.locals_loop_threshold}
+    measure_rom_words = functools.partial(
+        translated_rom_words, writer_class=writer_class, writer_options=options)
+    # the whole program, for the optimizations that need to see all of it
+    programs = {}
+    if arguments.inline or arguments.eliminate_dead:
+        programs = {os.path.splitext(os.path.basename(input_path))[0]: parse_path(input_path)
+                    for input_path in files_to_translate}
+    if arguments.inline:
+        inliner = Inliner(measure_rom_words, arguments.inline_growth)
+        inliner.analyze(programs)
+        # what translate_file will see, without counting the hits yet
+        preview = Inliner(inlined=inliner.inlined)
+        programs = {filename: preview.inline(commands, filename)
+                    for filename, commands in programs.items()}
+    if arguments.eliminate_dead:
+        eliminator = DeadFunctionEliminator()
+        eliminator.analyze(programs.values())
 
     with open(output_path, 'w') as output_file:
-        code_writer = CodeWriter(output_file)  # new
-        for input_path in files_to_translate:
-            filename, extension = os.path.splitext(input_path)
-
-            if extension.lower() != ".vm":
-                continue
-            with open(input_path, 'r') as input_file:
-                input_filename, input_extension = os.path.splitext(os.path.basename(input_file.name))  # new
-                code_writer.set_file_name(input_filename)  # new
-                translate_file(input_file, output_file, bootstrap)
-            bootstrap = False
+        code_writer = writer_class(output_file, **options)
+        write_bootstrap(code_writer)
+        translate_files(files_to_translate, arguments.jobs, options)
+        code_writer.write_shared_routines()
+        code_writer.flush()
+    if folder is not None:
+        folder.write_report(sys.stdout)
+    if optimizer is not None:
+        optimizer.write_report(sys.stdout)
+    if inliner is not None:
+        inliner.write_report(sys.stdout)
+    if eliminator is not None:
+        eliminator.write_report(sys.stdout, measure_rom_words)
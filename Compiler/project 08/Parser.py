@@ -7,6 +7,42 @@ Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
 """
 import typing
 
+ARITHMETIC_COMMAND = "C_ARITHMETIC"
+# the command type of every command word, except the arithmetic commands
+COMMAND_TYPES = {"push": "C_PUSH", "pop": "C_POP", "label": "C_LABEL",
+                 "goto": "C_GOTO", "if-goto": "C_IF", "function": "C_FUNCTION",
+                 "return": "C_RETURN", "call": "C_CALL"}
+COMMENT_CHAR = "/"
+NO_ARG2 = 0
+
+
+class VMCommand:
+    """A parsed VM command: its type ("C_PUSH", "C_ARITHMETIC", ...), its
+    arguments and the line of the file it came from. For arithmetic commands
+    arg1 is the command itself (add, sub, etc.).
+    """
+    __slots__ = ("opcode", "arg1", "arg2", "line")
+
+    def __init__(self, opcode: str, arg1: str, arg2: int, line: int) -> None:
+        self.opcode = opcode
+        self.arg1 = arg1
+        self.arg2 = arg2
+        self.line = line
+
+
+def tokenize(line: str, line_number: int) -> typing.Optional[VMCommand]:
+    """Splits a line into a VMCommand, or returns None for a line with no
+    command. Comments start at the first "/".
+    """
+    words = line.split(COMMENT_CHAR, 1)[0].split()
+    if not words:
+        return None
+    opcode = COMMAND_TYPES.get(words[0], ARITHMETIC_COMMAND)
+    if opcode == ARITHMETIC_COMMAND:
+        return VMCommand(opcode, words[0], NO_ARG2, line_number)
+    return VMCommand(opcode, words[1] if len(words) > 1 else "",
+                     int(words[2]) if len(words) > 2 else NO_ARG2, line_number)
+
 
 class Parser:
     """
@@ -45,47 +81,20 @@ class Parser:
       - function <function-name> <n-vars>
       - return
     """
-    INITIAL_INDEX = -1
-    NO_JUMP = -1
-    END_OF_COMP = ";"
-    END_OF_DEST = "="
-    COMMAND_BEGIN_INDEX = 1
-    A_COMMAND_SYMBOL = '@'
-    L_COMMAND_SYMBOL = '('
-    NEXT_LINE = 1
-    END_OF_FILE = -1
-    EMPTY_LINE = ""
-    SYMBOL_INDEX = 0
-    JUMP_COMMAND_LENGTH = 3
-    COMMENT_CHAR = "/"
-    NULL = "null"
-    SHIFT_INITIAL = "101"
-    C_INITIAL = "111"
-    ARITHMETIC_COMMANDS = ["add", "sub", "neg", "eq", "gt", "lt", "and", "or", "not"]
-    ARITHMETIC_COMMAND = "C_ARITHMETIC"
-    MEMORY_ACCESS_COMMANDS = ["push", "pop"]
-    LABEL_COMMANDS = ["label", "goto", "if-goto"]
-    FUNCTION_COMMANDS = ["function", "return", "call"]
-    ANOTHER_COMMAND = ""
-    COMMAND_OPEN = "C_"
-    IF_GOTO_COMMAND = "if-goto"
-    IF_GOTO_TYPE = "IF"
 
     def __init__(self, input_file: typing.TextIO) -> None:
-        """Gets ready to parse the input file.
+        """Gets ready to parse the input file. Every line is tokenized once,
+        into the list of commands.
 
         Args:
             input_file (typing.TextIO): input file.
         """
-        # Your code goes here!
-        # A good place to start is to read all the lines of the input:
-        # input_lines = input_file.read().splitlines()
-        self.input_lines = input_file.read().splitlines()
-        for i in range(len(self.input_lines)):
-            self.input_lines[i] = self.delete_comment(self.input_lines[i])
-        self.current_line = Parser.INITIAL_INDEX
-        self.current_command = Parser.INITIAL_INDEX
-        self.num_of_labels = 0
+        self.commands = []
+        for line_number, line in enumerate(input_file.read().splitlines(), 1):
+            command = tokenize(line, line_number)
+            if command is not None:
+                self.commands.append(command)
+        self.current_command = -1
 
     def has_more_commands(self) -> bool:
         """Are there more commands in the input?
@@ -93,19 +102,14 @@ class Parser:
         Returns:
             bool: True if there are more commands, False otherwise.
         """
-        if self.current_line < len(self.input_lines):
-            if self.next_available_line() != Parser.END_OF_FILE:
-                return True
-        return False
+        return self.current_command + 1 < len(self.commands)
 
     def advance(self) -> None:
         """Reads the next command from the input and makes it the current
         command. Should be called only if has_more_commands() is true. Initially
         there is no current command.
         """
-        if self.has_more_commands():
-            self.current_line = self.next_available_line()
-            self.current_command += 1
+        self.current_command += 1
 
     def command_type(self) -> str:
         """
@@ -116,61 +120,7 @@ class Parser:
             "C_PUSH", "C_POP", "C_LABEL", "C_GOTO", "C_IF", "C_FUNCTION",
             "C_RETURN", "C_CALL".
         """
-        command_type_str = self.extract_command()
-        memory_access_command = self.is_memory_access_command(command_type_str)
-        label_command = self.is_label_command(command_type_str)
-        function_command = self.is_function_command(command_type_str)
-        if memory_access_command != self.ANOTHER_COMMAND:
-            return self.COMMAND_OPEN + memory_access_command
-        elif label_command != self.ANOTHER_COMMAND:
-            return self.COMMAND_OPEN + label_command
-        elif function_command != self.ANOTHER_COMMAND:
-            return self.COMMAND_OPEN + function_command
-        return self.ARITHMETIC_COMMAND
-
-    def extract_command(self) -> str:
-        current_command = self.input_lines[self.current_line]
-        command_type_first_index = self.first_index_ignore_spaces(current_command)
-        command_type_last_index = self.find_command_last_index(command_type_first_index)
-        return current_command[command_type_first_index: command_type_last_index]
-
-    def find_command_last_index(self, command_type_first_index: int) -> int:
-        current_command = self.input_lines[self.current_line]
-        last_index = command_type_first_index
-        for i in range(command_type_first_index, len(current_command)):
-            if current_command[i] == ' ':
-                break
-            last_index += 1
-
-        return last_index #+ 1
-
-    def first_index_ignore_spaces(self, line) -> int:
-        index = 0
-        while line[index] == ' ':
-            index += 1
-        return index
-
-    def is_arithmetic_command(self, current_command: str) -> str:
-        if current_command in self.ARITHMETIC_COMMANDS:
-            return current_command.upper()
-        return self.ANOTHER_COMMAND
-
-    def is_memory_access_command(self, current_command: str) -> str:
-        if current_command in self.MEMORY_ACCESS_COMMANDS:
-            return current_command.upper()
-        return self.ANOTHER_COMMAND
-
-    def is_label_command(self, current_command: str) -> str:
-        if current_command == self.IF_GOTO_COMMAND:
-            return self.IF_GOTO_TYPE
-        if current_command in self.LABEL_COMMANDS:
-            return current_command.upper()
-        return self.ANOTHER_COMMAND
-
-    def is_function_command(self, current_command: str) -> str:
-        if current_command in self.FUNCTION_COMMANDS:
-            return current_command.upper()
-        return self.ANOTHER_COMMAND
+        return self.commands[self.current_command].opcode
 
     def arg1(self) -> str:
         """
@@ -179,22 +129,7 @@ class Parser:
             "C_ARITHMETIC", the command itself (add, sub, etc.) is returned.
             Should not be called if the current command is "C_RETURN".
         """
-        if self.command_type() == self.ARITHMETIC_COMMAND:
-            return self.extract_command()
-        arg1_first_index = self.get_arg1_first_index()
-        arg1_last_index = self.get_arg1_last_index(arg1_first_index)
-        return (self.input_lines[self.current_line])[arg1_first_index: arg1_last_index]
-
-    def get_arg1_first_index(self) -> int:
-        current_line = self.input_lines[self.current_line]
-        first_word_first_index = self.first_index_ignore_spaces(current_line)
-        first_word_last_index = self.find_command_last_index(first_word_first_index)
-        current_line_ignore_command = current_line[first_word_last_index:]
-        arg1_first_index = self.first_index_ignore_spaces(current_line_ignore_command)
-        return arg1_first_index + first_word_last_index
-
-    def get_arg1_last_index(self, arg1_first_index) -> int:
-        return self.find_command_last_index(arg1_first_index)
+        return self.commands[self.current_command].arg1
 
     def arg2(self) -> int:
         """
@@ -203,68 +138,4 @@ class Parser:
             called only if the current command is "C_PUSH", "C_POP",
             "C_FUNCTION" or "C_CALL".
         """
-        current_command = (self.input_lines[self.current_line]).replace(" ", "")
-        constant_str = self.get_constant_str(current_command)
-        return int(constant_str)
-
-    def get_constant_str(self, current_command: str) -> str:
-        str_of_constant = ""
-        constant_index = self.find_constant_first_index_at_str(current_command)
-        for i in range(constant_index,(len(current_command))):
-            if self.is_number(current_command[i]):
-                str_of_constant += current_command[i]
-            elif i > 0 and not self.is_number(current_command[i]): #add this, may cause a bug
-                str_of_constant = ""
-
-            #if current_command[constant_index]
-        return str_of_constant
-
-    def is_number(self, char_to_check) -> bool:
-        return '0' <= char_to_check <= '9'
-
-    def find_constant_first_index_at_str(self, current_command: str) -> int:
-        constant_first_index = 0
-        while not (self.is_number(current_command[constant_first_index])):
-            constant_first_index += 1
-        return constant_first_index
-
-    def find_comment(self, line):
-        """*/
-        Finds the index of the "/" char in a command, which represents a comment.
-        */"""
-        counter = 0
-        for i in range(len(line)):
-            if line[i] == Parser.COMMENT_CHAR:
-                return counter
-            counter += 1
-        return counter
-
-    def delete_comment(self, line):
-        """*/
-        Returns a command (line) without comments.
-        */"""
-        comment_index = self.find_comment(line)
-        if len(line) != comment_index:
-            line = line[0:comment_index]
-        line = line.replace("\t", "")
-        return line
-
-    def is_description(self, line) -> bool:
-        """"return true if the current line is a description"""
-        # clean line from spaces
-        if line[0] == Parser.COMMENT_CHAR and line[1] == Parser.COMMENT_CHAR:
-            return True
-        return False
-
-    def next_available_line(self) -> int:
-        """returns the index of the next available line, else -1"""
-        if (self.current_line == len(self.input_lines)):
-            current_line = (self.input_lines[self.current_line]).replace(" ", "")
-            if current_line != Parser.EMPTY_LINE and not (self.is_description(current_line)):
-                return self.current_line
-        for i in range(self.current_line + 1, len(self.input_lines)):  # זה גורם שלא קוראים את השורה האחרונה בקובץ
-            # clean line from spaces
-            current_line = (self.input_lines[i]).replace(" ", "")
-            if current_line != Parser.EMPTY_LINE and not (self.is_description(current_line)):
-                return i
-        return Parser.END_OF_FILE
+        return self.commands[self.current_command].arg2
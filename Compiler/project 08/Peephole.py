@@ -0,0 +1,121 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import typing
+from Parser import VMCommand, ARITHMETIC_COMMAND, NO_ARG2
+
+PUSH = "C_PUSH"
+POP = "C_POP"
+CONSTANT = "constant"
+# the superinstructions, which CodeWriter translates with templates of their
+# own (write_add_constant, write_increment, etc.)
+ADD_CONSTANT = "C_ADD_CONSTANT"  # arg1: add or sub, arg2: the constant
+INCREMENT = "C_INCREMENT"        # arg1: segment, arg2: index
+DECREMENT = "C_DECREMENT"        # arg1: segment, arg2: index
+ARRAY_STORE = "C_ARRAY_STORE"    # pop temp 0, pop pointer 1, push temp 0, pop that 0
+POP_PUSH = "C_POP_PUSH"          # pop and push back the same entry of a segment
+ARRAY_STORE_WINDOW = [(POP, "temp", 0), (POP, "pointer", 1),
+                      (PUSH, "temp", 0), (POP, "that", 0)]
+
+
+def is_command(command: VMCommand, opcode: str, arg1: str, arg2: int) -> bool:
+    return command.opcode == opcode and command.arg1 == arg1 and command.arg2 == arg2
+
+
+def match_increment(commands: typing.List[VMCommand], index: int) -> typing.Optional[VMCommand]:
+    """push x / push constant 1 / add or sub / pop x, e.g. let i = i + 1."""
+    push, one, operation, pop = commands[index:index + 4]
+    if push.opcode == PUSH and push.arg1 != CONSTANT \
+            and is_command(one, PUSH, CONSTANT, 1) \
+            and operation.opcode == ARITHMETIC_COMMAND and operation.arg1 in ["add", "sub"] \
+            and is_command(pop, POP, push.arg1, push.arg2):
+        opcode = INCREMENT if operation.arg1 == "add" else DECREMENT
+        return VMCommand(opcode, push.arg1, push.arg2, push.line)
+    return None
+
+
+def match_array_store(commands: typing.List[VMCommand], index: int) -> typing.Optional[VMCommand]:
+    """The end of let a[i] = x: pop temp 0 / pop pointer 1 / push temp 0 /
+    pop that 0.
+    """
+    window = commands[index:index + 4]
+    if all(is_command(command, *pattern)
+           for command, pattern in zip(window, ARRAY_STORE_WINDOW)):
+        return VMCommand(ARRAY_STORE, "", NO_ARG2, window[0].line)
+    return None
+
+
+def match_add_constant(commands: typing.List[VMCommand], index: int) -> typing.Optional[VMCommand]:
+    """push constant c / add or sub."""
+    push, operation = commands[index:index + 2]
+    if push.opcode == PUSH and push.arg1 == CONSTANT \
+            and operation.opcode == ARITHMETIC_COMMAND and operation.arg1 in ["add", "sub"]:
+        return VMCommand(ADD_CONSTANT, operation.arg1, push.arg2, push.line)
+    return None
+
+
+def match_pop_push(commands: typing.List[VMCommand], index: int) -> typing.Optional[VMCommand]:
+    """pop x / push x, which stores the top of the stack and keeps it."""
+    pop, push = commands[index:index + 2]
+    if pop.opcode == POP and is_command(push, PUSH, pop.arg1, pop.arg2):
+        return VMCommand(POP_PUSH, pop.arg1, pop.arg2, pop.line)
+    return None
+
+
+# the rules, by the opcode of the first command of their window, the longest
+# windows first: (name, window length, matcher)
+RULES = {
+    PUSH: [("increment", 4, match_increment),
+           ("add constant", 2, match_add_constant)],
+    POP: [("array store", 4, match_array_store),
+          ("pop push", 2, match_pop_push)],
+}
+
+
+class PeepholeOptimizer:
+    """
+    Replaces short windows of VM commands with superinstructions, which
+    CodeWriter translates with hand-tuned templates, and counts the hits of
+    every rule.
+
+    A window never holds a label, function or call command, so there is no
+    way to jump into the middle of it, and a superinstruction leaves the
+    stack, the segments and the temp and pointer entries the way the
+    commands it replaces would.
+    """
+
+    def __init__(self) -> None:
+        self.hits = {name: 0 for rules in RULES.values() for name, _, _ in rules}
+
+    def optimize(self, commands: typing.List[VMCommand]) -> typing.List[VMCommand]:
+        """Returns the commands with every window a rule matched replaced by
+        its superinstruction. Windows are matched left to right, and do not
+        overlap.
+        """
+        optimized = []
+        index = 0
+        n_commands = len(commands)
+        while index < n_commands:
+            command = commands[index]
+            for name, length, match in RULES.get(command.opcode, []):
+                if index + length > n_commands:
+                    continue
+                superinstruction = match(commands, index)
+                if superinstruction is not None:
+                    self.hits[name] += 1
+                    optimized.append(superinstruction)
+                    index += length
+                    break
+            else:
+                optimized.append(command)
+                index += 1
+        return optimized
+
+    def write_report(self, output: typing.TextIO) -> None:
+        """Writes the hits of every rule, the most frequent first."""
+        for name, hits in sorted(self.hits.items(), key=lambda item: -item[1]):
+            output.write(name.ljust(14) + str(hits).rjust(8) + "\n")
@@ -0,0 +1,248 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import typing
+import Main
+from CodeWriter import CodeWriter
+
+# the assembler and the CPU emulator live in project 06
+PROJECT_06 = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          os.pardir, "project 06")
+sys.path.append(PROJECT_06)
+from CPUEmulator import CPUEmulator, HALT_BREAKPOINT  # noqa: E402
+
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "benchmarks", "TemplateBenchmark.txt")
+START_MARKER = "$START"
+END_MARKER = "$END"
+START_LABEL = "BENCH_START"
+END_LABEL = "BENCH_END"
+HALT_LABEL = "BENCH_HALT"
+MAX_CYCLES = 100000
+# segment bases of the micro-programs, far enough apart not to overlap
+SEGMENT_BASES = {"LCL": 300, "ARG": 400, "THIS": 3000, "THAT": 3010}
+COMMENT_CHAR = "/"
+LABEL_OPEN = "("
+
+
+class BenchmarkCase:
+    """A VM micro-program that measures the code of one VM command.
+
+    The measured commands are put between a "$START" and an "$END" line.
+    The cycles are counted from the first measured instruction until the
+    program counter reaches the exit label, which is the end of the measured
+    code unless control leaves it (e.g. "call" exits at the callee).
+    """
+
+    def __init__(self, name: str, source: str, exit_label: str = END_LABEL,
+                 options: typing.Optional[typing.Dict[str, typing.Any]] = None) -> None:
+        """
+        Args:
+            options: keyword arguments of the CodeWriter of the case.
+        """
+        self.name = name
+        self.source = source
+        self.exit_label = exit_label
+        self.options = options or {}
+
+
+class BenchmarkResult:
+    """The ROM words and cycles of the measured code of a case."""
+
+    def __init__(self, name: str, instructions: int, cycles: int) -> None:
+        self.name = name
+        self.instructions = instructions
+        self.cycles = cycles
+
+
+def binary_case(command: str, x: int, y: int, name: str = "") -> BenchmarkCase:
+    return BenchmarkCase(name or command,
+                         "push constant {}\n{}push constant {}\n{}"
+                         "$START\n{}\n$END\n".format(
+                             abs(x), "neg\n" if x < 0 else "",
+                             abs(y), "neg\n" if y < 0 else "", command))
+
+
+def push_pop_cases() -> typing.List[BenchmarkCase]:
+    cases = [BenchmarkCase("push constant", "$START\npush constant 7\n$END\n")]
+    # local, argument, this and that by index, up to where the index is added
+    pointed = [(segment, index) for segment in ["local", "argument", "this", "that"]
+               for index in [0, 1, 2, 3, 10]]
+    for segment, index in pointed + [("pointer", 0), ("pointer", 1),
+                                     ("static", 2), ("temp", 2)]:
+        cases.append(BenchmarkCase(
+            "push {} {}".format(segment, index),
+            "$START\npush {} {}\n$END\n".format(segment, index)))
+        cases.append(BenchmarkCase(
+            "pop {} {}".format(segment, index),
+            "push constant 7\n$START\npop {} {}\n$END\n".format(segment, index)))
+    return cases
+
+
+def all_cases() -> typing.List[BenchmarkCase]:
+    """Returns a case for every command CodeWriter can be asked to emit,
+    with one case per branch of the commands that branch.
+    """
+    cases = [binary_case(command, 7, 5) for command in
+             ["add", "sub", "eq", "and", "or"]]
+    cases.append(binary_case("eq", 7, 7, "eq (x = y)"))
+    for command in ["gt", "lt"]:
+        cases += [binary_case(command, 7, 5, command + " (x > y > 0)"),
+                  binary_case(command, 5, 7, command + " (y > x > 0)"),
+                  binary_case(command, 7, 7, command + " (x = y > 0)"),
+                  binary_case(command, -7, 5, command + " (x < 0 < y)"),
+                  binary_case(command, 7, -5, command + " (y < 0 < x)")]
+    cases += [BenchmarkCase(command, "push constant 7\n$START\n{}\n$END\n".format(command))
+              for command in ["neg", "not", "shiftleft", "shiftright"]]
+    cases += push_pop_cases()
+    cases += [BenchmarkCase("label", "$START\nlabel LOOP\n$END\n"),
+              BenchmarkCase("goto", "$START\ngoto LOOP\n$END\nlabel LOOP\n",
+                            "Bench$main$LOOP0"),
+              BenchmarkCase("if-goto (taken)",
+                            "push constant 1\nneg\n$START\nif-goto LOOP\n$END\nlabel LOOP\n",
+                            "Bench$main$LOOP0"),
+              BenchmarkCase("if-goto (not taken)",
+                            "push constant 0\n$START\nif-goto LOOP\n$END\nlabel LOOP\n")]
+    for n_args in [0, 1, 3]:
+        cases.append(BenchmarkCase(
+            "call (n_args = {})".format(n_args),
+            "push constant 7\n" * n_args
+            + "$START\ncall Bench.f {}\n$END\nfunction Bench.f 0\n".format(n_args),
+            "Bench.f"))
+    # both ways of zeroing the locals, which LOCALS_LOOP_THRESHOLD chooses between
+    for n_vars in [0, 1, 2, 3, 5, 8, 10, 20]:
+        for name, threshold in [("straight", n_vars + 1), ("loop", 1)]:
+            cases.append(BenchmarkCase(
+                "function (n_vars = {}, {})".format(n_vars, name),
+                "$START\nfunction Bench.f {}\n$END\n".format(n_vars),
+                options={"locals_loop_threshold": threshold}))
+    cases.append(BenchmarkCase(
+        "return",
+        "push constant 7\ncall Bench.f 1\nlabel DONE\ngoto DONE\n"
+        "function Bench.f 0\npush constant 3\n"
+        "$START\nreturn\n$END\n",
+        "Bench$main$ret.0"))
+    return cases
+
+
+def translate(source: str, code_writer: CodeWriter, output_file: typing.TextIO) -> None:
+    """Translates VM source with the translator of Main, using code_writer."""
+    if not source.strip():
+        return
+    Main.code_writer = code_writer
+    Main.translate_file(io.StringIO(source), output_file, False)
+
+
+def write_program(case: BenchmarkCase, output_file: typing.TextIO) -> None:
+    """Writes the assembly of a case: segment setup, the commands before
+    $START, the measured commands between the start and end labels, an
+    idle loop at the end label, the commands after $END and another idle
+    loop, so that a label at the very end still has an instruction.
+    """
+    code_writer = CodeWriter(output_file, **case.options)
+    code_writer.set_file_name("Bench")
+    code_writer.initialize_file()
+    # written through the buffer of the code writer, to keep the order
+    emit = code_writer.output_file.write
+    for segment, base in SEGMENT_BASES.items():
+        emit("@{}\nD=A\n@{}\nM=D\n".format(base, segment))
+    before, _, rest = case.source.partition(START_MARKER + "\n")
+    measured, _, after = rest.partition(END_MARKER + "\n")
+    translate(before, code_writer, output_file)
+    # some templates do not end their last line, so labels start a new one
+    emit("\n(" + START_LABEL + ")\n")
+    translate(measured, code_writer, output_file)
+    emit("\n(" + END_LABEL + ")\n@" + END_LABEL + "\n0;JMP\n")
+    translate(after, code_writer, output_file)
+    emit("\n(" + HALT_LABEL + ")\n@" + HALT_LABEL + "\n0;JMP\n")
+    code_writer.flush()
+
+
+def label_addresses(asm: str) -> typing.Dict[str, int]:
+    """Returns the ROM address of every label of an assembly program, the
+    same way the first pass of the assembler finds them.
+    """
+    labels = {}
+    address = 0
+    for line in asm.splitlines():
+        line = line.split(COMMENT_CHAR)[0].replace(" ", "").replace("\t", "")
+        if line.startswith(LABEL_OPEN):
+            labels[line[1:-1]] = address
+        elif line:
+            address += 1
+    return labels
+
+
+def assemble(asm: str) -> typing.List[int]:
+    """Assembles a program with the assembler of project 06."""
+    with tempfile.TemporaryDirectory() as directory:
+        asm_path = os.path.join(directory, "Bench.asm")
+        with open(asm_path, "w") as asm_file:
+            asm_file.write(asm)
+        subprocess.run([sys.executable, "Main.py", asm_path], cwd=PROJECT_06,
+                       check=True)
+        with open(os.path.join(directory, "Bench.hack"), "r") as hack_file:
+            return [int(line, 2) for line in hack_file.read().split()]
+
+
+def run_case(case: BenchmarkCase) -> BenchmarkResult:
+    """Translates, assembles and runs a case.
+
+    Returns:
+        BenchmarkResult: the ROM words between the start and end labels, and
+        the cycles from the start label until the exit label is reached.
+    """
+    output = io.StringIO()
+    write_program(case, output)
+    asm = output.getvalue()
+    labels = label_addresses(asm)
+    start = labels[START_LABEL]
+    exit_address = labels[case.exit_label]
+    emulator = CPUEmulator()
+    emulator.load_program(assemble(asm))
+    emulator.add_breakpoint(start)
+    emulator.add_breakpoint(exit_address)
+    if emulator.run(MAX_CYCLES) != HALT_BREAKPOINT or emulator.pc != start:
+        raise RuntimeError(case.name + ": did not reach " + START_LABEL)
+    cycles = 0
+    if exit_address != start:
+        before = emulator.cycles
+        if emulator.run(MAX_CYCLES) != HALT_BREAKPOINT \
+                or emulator.pc != exit_address:
+            raise RuntimeError(case.name + ": did not reach " + case.exit_label)
+        cycles = emulator.cycles - before
+    return BenchmarkResult(case.name, labels[END_LABEL] - start, cycles)
+
+
+def write_table(results: typing.List[BenchmarkResult], output_file: typing.TextIO) -> None:
+    """Writes the results as a plain text table."""
+    name_width = max(len(result.name) for result in results) + 2
+    output_file.write("VM command".ljust(name_width) + "ROM words".rjust(10)
+                      + "cycles".rjust(10) + "\n")
+    output_file.write("-" * (name_width + 20) + "\n")
+    for result in results:
+        output_file.write(result.name.ljust(name_width)
+                          + str(result.instructions).rjust(10)
+                          + str(result.cycles).rjust(10) + "\n")
+
+
+if "__main__" == __name__:
+    # Measures the code CodeWriter emits for every VM command and writes the
+    # table to the given path (benchmarks/TemplateBenchmark.txt by default).
+    if len(sys.argv) > 2:
+        sys.exit("Invalid usage, please use: TemplateBenchmark [output path]")
+    output_path = sys.argv[1] if len(sys.argv) == 2 else DEFAULT_OUTPUT
+    benchmark_results = [run_case(benchmark_case) for benchmark_case in all_cases()]
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w") as table_file:
+        write_table(benchmark_results, table_file)
+    write_table(benchmark_results, sys.stdout)
@@ -0,0 +1,612 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import hashlib
+import importlib.util
+import os
+import re
+import sys
+import time
+import typing
+from VMEmulator import VMEmulator, VMError, vm_files, PUSH_CONSTANT, \
+    PUSH_SEGMENT, POP_SEGMENT, PUSH_ADDRESS, POP_ADDRESS, ADD, SUB, IF_GOTO, \
+    GOTO, CALL, CALL_NATIVE, FUNCTION, RETURN, EQ, GT, LT, AND, OR, NOT, NEG, \
+    SHIFT_LEFT, SHIFT_RIGHT, WORD_MASK, SIGN_BIT, ADDRESS_MASK, TRUE, FALSE, \
+    SP, LCL, ARG, THIS, THAT, FRAME_SIZE, RETURN_VARIABLES, HALT_STEPS, \
+    HALT_END, HALT_IDLE
+
+# bump when the generated code changes, so that cached modules are rebuilt
+COMPILER_VERSION = 1
+CACHE_DIRECTORY = "__vmcache__"
+INDENT = "    "
+# longer expressions are stored in a local instead of being nested further
+MAX_EXPRESSION_LENGTH = 120
+# functions with at most this many local variables clear them one by one
+UNROLLED_LOCALS = 8
+# the locals that hold the cached segment pointers of a function
+POINTER_LOCALS = {LCL: "lcl", ARG: "arg"}
+ATOM = re.compile(r"^(\w+|\d+)$")
+BINARY_EXPRESSIONS = {
+    ADD: "(({} + {}) & " + str(WORD_MASK) + ")",
+    SUB: "(({} - {}) & " + str(WORD_MASK) + ")",
+    AND: "({} & {})",
+    OR: "({} | {})"}
+COMPARISONS = {EQ: "{} == {}",
+               GT: "{} ^ " + str(SIGN_BIT) + " > {} ^ " + str(SIGN_BIT),
+               LT: "{} ^ " + str(SIGN_BIT) + " < {} ^ " + str(SIGN_BIT)}
+MODULE_HEADER = '''"""Compiled by VMCompiler from {files}, do not edit."""
+
+
+class Stop(Exception):
+    """Raised with (reason, SP) when the program stops without returning."""
+
+
+ticks = 0
+natives = []
+'''
+
+
+class Unstructured(Exception):
+    """Control flow that does not nest into while loops and if statements."""
+
+
+class FunctionCompiler:
+    """
+    Compiles the commands of one VM function (or of the commands before the
+    first function) into the source of one Python function, which takes
+    the RAM and SP and returns SP after the function returns.
+
+    The operand stack is kept at compile time where possible: a push only
+    records the Python expression of the pushed value (a constant, or a
+    local holding a value read from RAM when it was pushed) and operators
+    combine these expressions, so "push local 0, push constant 1, add, pop
+    local 0" is a single assignment. Values are only stored on the RAM stack
+    before calls and at the edges of loops and branches, which is when the
+    stack of the translated code is visible to another piece of code.
+
+    Control flow is rebuilt as while loops (a label with a backward goto or
+    if-goto to it), if/else statements (a forward if-goto, with an else part
+    if the skipped code ends with a forward goto) and break/continue. This
+    covers the code the Jack compiler generates. Anything else makes the
+    whole function fall back to a loop over its basic blocks.
+    """
+
+    def __init__(self, program: VMEmulator, start: int, end: int) -> None:
+        """
+        Args:
+            program (VMEmulator): the parsed and linked program.
+            start (int): the index of the first command of the function.
+            end (int): the index after its last command.
+        """
+        self.program = program
+        self.start = start
+        self.end = end
+        self.lines = []
+        self.stack = []
+        self.conditions = {}
+        self.temps = 0
+        self.indent = 1
+        self.join = start
+        self.back_edges = {}
+        for index in range(start, end):
+            target = program.arg1s[index]
+            if program.ops[index] in [GOTO, IF_GOTO] and start <= target < index:
+                self.back_edges.setdefault(target, []).append(index)
+
+    def compile(self) -> typing.List[str]:
+        """Returns the lines of the body of the function."""
+        body = self.start
+        self.line("global ticks")
+        if self.program.ops[body] == FUNCTION:
+            self.entry()
+            body += 1
+        else:
+            self.line("lcl = ram[" + str(LCL) + "]")
+            self.line("arg = ram[" + str(ARG) + "]")
+        self.tick()
+        prologue = len(self.lines)
+        try:
+            self.structure(body, self.end, None)
+            self.fall_through()
+        except Unstructured:
+            del self.lines[prologue:]
+            self.stack = []
+            self.conditions = {}
+            self.temps = 0
+            self.indent = 1
+            self.blocks(body)
+        return self.lines
+
+    # emitting
+
+    def line(self, text: str) -> None:
+        self.lines.append(INDENT * self.indent + text)
+
+    def tick(self) -> None:
+        """Emits the check of the budget, at every call and loop iteration."""
+        self.line("ticks -= 1")
+        self.line("if ticks < 0:")
+        self.line(INDENT + "raise Stop({!r}, sp)".format(HALT_STEPS))
+
+    def temp(self, expression: str) -> str:
+        """Stores an expression in a new local and returns its name."""
+        name = "t" + str(self.temps)
+        self.temps += 1
+        self.line(name + " = " + expression)
+        return name
+
+    def atom(self, expression: str) -> str:
+        """Returns an expression that can be used twice without recomputing."""
+        return expression if ATOM.match(expression) else self.temp(expression)
+
+    def push(self, expression: str) -> None:
+        if len(expression) > MAX_EXPRESSION_LENGTH:
+            expression = self.temp(expression)
+        self.stack.append(expression)
+
+    def pop(self) -> str:
+        """Returns the expression of the top value, reading it from the RAM
+        stack if it was stored there.
+        """
+        if self.stack:
+            return self.stack.pop()
+        self.line("sp -= 1")
+        return self.temp("ram[sp]")
+
+    def flush(self) -> None:
+        """Stores the values of the compile time stack on the RAM stack."""
+        for offset, expression in enumerate(self.stack):
+            self.line("ram[sp{}] = {}".format(" + " + str(offset) if offset else "",
+                                              expression))
+        if self.stack:
+            self.line("sp += " + str(len(self.stack)))
+        self.stack = []
+
+    def when_true(self, value: str) -> str:
+        """Returns a Python condition that holds if a value is not 0."""
+        if value in self.conditions:
+            condition, negated = self.conditions[value]
+            return "not (" + condition + ")" if negated else condition
+        return value
+
+    def when_false(self, value: str) -> str:
+        """Returns a Python condition that holds if a value is 0."""
+        if value in self.conditions:
+            condition, negated = self.conditions[value]
+            return condition if negated else "not (" + condition + ")"
+        return "not " + value
+
+    def block(self, header: str) -> int:
+        """Opens an indented block and returns where its body starts."""
+        self.line(header)
+        self.indent += 1
+        return len(self.lines)
+
+    def close(self, body: int) -> None:
+        """Closes the block opened by block()."""
+        self.flush()
+        if len(self.lines) == body:
+            self.line("pass")
+        self.indent -= 1
+
+    # commands
+
+    def address(self, pointer: int, index: int) -> str:
+        """Returns the address of a local, argument, this or that entry."""
+        if pointer in POINTER_LOCALS:
+            base = POINTER_LOCALS[pointer]
+            return base + " + " + str(index) if index else base
+        base = "ram[" + str(pointer) + "]"
+        return "(" + base + (" + " + str(index) if index else "") \
+            + ") & " + str(ADDRESS_MASK)
+
+    def entry(self) -> None:
+        """Emits the "function" command: caches LCL and ARG, which do not
+        change until the function returns, and clears the local variables.
+        """
+        n_vars = self.program.arg2s[self.start]
+        self.line("lcl = ram[" + str(LCL) + "]")
+        self.line("arg = ram[" + str(ARG) + "]")
+        if n_vars <= UNROLLED_LOCALS:
+            for offset in range(n_vars):
+                self.line("ram[sp{}] = 0".format(" + " + str(offset) if offset else ""))
+        else:
+            self.line("for address in range(sp, sp + " + str(n_vars) + "):")
+            self.line(INDENT + "ram[address] = 0")
+        if n_vars:
+            self.line("sp += " + str(n_vars))
+
+    def command(self, index: int) -> None:
+        """Emits a command that does not jump."""
+        op = self.program.ops[index]
+        arg1 = self.program.arg1s[index]
+        arg2 = self.program.arg2s[index]
+        if op == PUSH_CONSTANT:
+            self.push(str(arg1))
+        elif op == PUSH_SEGMENT:
+            self.push(self.temp("ram[" + self.address(arg1, arg2) + "]"))
+        elif op == POP_SEGMENT:
+            value = self.pop()
+            self.line("ram[" + self.address(arg1, arg2) + "] = " + value)
+        elif op == PUSH_ADDRESS:
+            self.push(self.temp("ram[" + str(arg1) + "]"))
+        elif op == POP_ADDRESS:
+            value = self.pop()
+            self.line("ram[" + str(arg1) + "] = " + value)
+        elif op in BINARY_EXPRESSIONS:
+            y, x = self.pop(), self.pop()
+            self.push(BINARY_EXPRESSIONS[op].format(x, y))
+        elif op in COMPARISONS:
+            y, x = self.pop(), self.pop()
+            condition = COMPARISONS[op].format(x, y)
+            value = "({} if {} else {})".format(TRUE, condition, FALSE)
+            self.conditions[value] = (condition, False)
+            self.push(value)
+        elif op == NOT:
+            x = self.pop()
+            value = "(" + x + " ^ " + str(WORD_MASK) + ")"
+            if x in self.conditions:
+                condition, negated = self.conditions[x]
+                self.conditions[value] = (condition, not negated)
+            self.push(value)
+        elif op == NEG:
+            self.push("(-" + self.pop() + " & " + str(WORD_MASK) + ")")
+        elif op == SHIFT_LEFT:
+            self.push("((" + self.pop() + " << 1) & " + str(WORD_MASK) + ")")
+        elif op == SHIFT_RIGHT:
+            x = self.atom(self.pop())
+            self.push("((" + x + " >> 1) | (" + x + " & " + str(SIGN_BIT) + "))")
+        elif op == CALL:
+            self.call(index, arg1, arg2)
+        elif op == CALL_NATIVE:
+            arguments = [self.pop() for _ in range(arg2)][::-1]
+            self.push(self.temp("natives[{}](ram{}) & {}".format(
+                arg1, "".join(", " + argument for argument in arguments),
+                WORD_MASK)))
+        elif op == RETURN:
+            self.return_()
+        else:
+            raise VMError(self.program.location(index) + ": cannot compile "
+                          "this command here")
+
+    def call(self, index: int, callee: int, n_args: int) -> None:
+        """Builds the frame of the translated code and calls the Python
+        function of the callee, which leaves the return value on the stack.
+        """
+        self.flush()
+        self.line("ram[sp] = " + str(index + 1))
+        self.line("ram[sp + 1] = lcl")
+        self.line("ram[sp + 2] = arg")
+        self.line("ram[sp + 3] = ram[" + str(THIS) + "]")
+        self.line("ram[sp + 4] = ram[" + str(THAT) + "]")
+        self.line("ram[" + str(ARG) + "] = sp" + (" - " + str(n_args) if n_args else ""))
+        self.line("sp += " + str(FRAME_SIZE))
+        self.line("ram[" + str(LCL) + "] = sp")
+        self.line("sp = f_{}(ram, sp)".format(callee))
+
+    def return_(self) -> None:
+        value = self.pop()
+        frame_address, return_address_address = \
+            (self.program.statics[variable] for variable in RETURN_VARIABLES)
+        self.line("ram[" + str(frame_address) + "] = lcl")
+        self.line("ram[" + str(return_address_address) + "] = ram[lcl - 5]")
+        self.line("ram[arg] = " + value)
+        for pointer in [THAT, THIS, ARG, LCL]:
+            self.line("ram[{}] = ram[lcl - {}]".format(pointer, FRAME_SIZE - pointer))
+        self.line("return arg + 1")
+        self.stack = []
+
+    def fall_through(self) -> None:
+        """Emits what happens when control reaches the end of the function:
+        the next function runs (as a tail call, so its return is the return
+        of this one) or the program ends.
+        """
+        self.flush()
+        if self.end in self.program.function_at:
+            self.line("return f_{}(ram, sp)".format(self.end))
+        else:
+            self.line("raise Stop({!r}, sp)".format(HALT_END))
+
+    # control flow
+
+    def loop_end(self, head: int, end: int) -> typing.Optional[int]:
+        """Returns the last backward jump to head before end, if any."""
+        closers = [index for index in self.back_edges.get(head, []) if index < end]
+        return max(closers) if closers else None
+
+    def structure(self, start: int, end: int,
+                  loop: typing.Optional[typing.Tuple[int, int]]) -> None:
+        """Emits the commands in [start, end) as nested Python statements.
+
+        Args:
+            start (int): the first command.
+            end (int): the command after the last one, which is where
+            control goes when it leaves the commands.
+            loop: (head, exit) of the innermost enclosing loop, where
+            "continue" and "break" go.
+
+        Raises:
+            Unstructured: if a jump does not fit the nesting.
+        """
+        ops, arg1s = self.program.ops, self.program.arg1s
+        index = start
+        while index < end:
+            closer = None
+            if not (loop and index == loop[0] == start):
+                closer = self.loop_end(index, end)
+            if closer is not None:
+                self.flush()
+                body = self.block("while True:")
+                self.tick()
+                self.structure(index, closer, (index, closer + 1))
+                if ops[closer] == IF_GOTO:
+                    value = self.pop()
+                    self.flush()
+                    self.line("if " + self.when_false(value) + ":")
+                    self.line(INDENT + "break")
+                self.close(body)
+                index = closer + 1
+                continue
+            op, target = ops[index], arg1s[index]
+            if op == GOTO:
+                self.flush()
+                if target == index:
+                    self.line("raise Stop({!r}, sp)".format(HALT_IDLE))
+                elif loop and target == loop[0]:
+                    self.line("continue")
+                elif loop and target == loop[1]:
+                    self.line("break")
+                elif target != end or index + 1 != end:
+                    # a goto at the very end of the commands goes where
+                    # falling off them goes anyway
+                    raise Unstructured()
+            elif op == IF_GOTO:
+                value = self.pop()
+                self.flush()
+                if loop and target in loop:
+                    self.line("if " + self.when_true(value) + ":")
+                    self.line(INDENT + ("continue" if target == loop[0] else "break"))
+                elif index < target <= end:
+                    self.branch(index, target, end, value, loop)
+                    index = self.join
+                    continue
+                else:
+                    raise Unstructured()
+            else:
+                self.command(index)
+            index += 1
+
+    def branch(self, index: int, target: int, end: int, value: str,
+               loop: typing.Optional[typing.Tuple[int, int]]) -> None:
+        """Emits the if statement of a forward if-goto, and sets self.join to
+        where both of its parts continue.
+        """
+        ops, arg1s = self.program.ops, self.program.arg1s
+        otherwise = None
+        if target - 1 > index and ops[target - 1] == GOTO \
+                and target < arg1s[target - 1] <= end:
+            otherwise = arg1s[target - 1]
+        body = self.block("if " + self.when_false(value) + ":")
+        self.structure(index + 1, target - 1 if otherwise else target, loop)
+        self.close(body)
+        if otherwise:
+            body = self.block("else:")
+            self.structure(target, otherwise, loop)
+            self.close(body)
+        self.join = otherwise or target
+
+    def blocks(self, start: int) -> None:
+        """Emits the function as a loop that runs one basic block per
+        iteration, for control flow structure() cannot nest.
+        """
+        ops, arg1s = self.program.ops, self.program.arg1s
+        leaders = {start}
+        for index in range(start, self.end):
+            if ops[index] in [GOTO, IF_GOTO]:
+                leaders.update([arg1s[index], index + 1])
+        leaders = sorted(leader for leader in leaders if start <= leader < self.end)
+        self.line("block = " + str(start))
+        self.block("while True:")
+        self.tick()
+        for position, leader in enumerate(leaders):
+            last = leaders[position + 1] if position + 1 < len(leaders) else self.end
+            self.block(("if" if not position else "elif")
+                       + " block == " + str(leader) + ":")
+            for index in range(leader, last):
+                op, target = ops[index], arg1s[index]
+                if op == GOTO:
+                    self.flush()
+                    if target == index:
+                        self.line("raise Stop({!r}, sp)".format(HALT_IDLE))
+                    else:
+                        self.line("block = " + str(target))
+                elif op == IF_GOTO:
+                    value = self.pop()
+                    self.flush()
+                    self.line("if " + self.when_true(value) + ":")
+                    self.line(INDENT + "block = " + str(target))
+                    self.line("else:")
+                    self.indent += 1
+                    self.go_to(index + 1)
+                    self.indent -= 1
+                else:
+                    self.command(index)
+            if ops[last - 1] not in [GOTO, IF_GOTO, RETURN]:
+                self.flush()
+                self.go_to(last)
+            self.indent -= 1
+        self.indent -= 1
+
+    def go_to(self, index: int) -> None:
+        """Emits the jump of blocks() to the block at index."""
+        if index == self.end:
+            self.fall_through()
+        else:
+            self.line("block = " + str(index))
+
+
+class VMCompiler:
+    """
+    Compiles a VM program ahead of time into a Python module with one
+    function per VM function (see FunctionCompiler), which runs several
+    times faster than interpreting it with VMEmulator.
+
+    The compiled code has the same effect on the RAM as the translated
+    code, with the same exceptions as VMEmulator (return addresses are
+    command indexes and R13-R15 are not used) and one more: the words above
+    SP are not written unless the translated code would read them back, so
+    their (dead) values can differ. Calls are Python calls, so a program
+    that changes the return address of a frame, or pops more than it
+    pushed, is not supported.
+
+    Modules are cached by a hash of the .vm files, in a __vmcache__
+    directory next to them, and reused until the files change.
+    """
+
+    def __init__(self, program: VMEmulator) -> None:
+        """
+        Args:
+            program (VMEmulator): the parsed and linked program to compile.
+        """
+        self.program = program
+
+    def functions(self) -> typing.List[typing.Tuple[int, int]]:
+        """Returns the (start, end) commands of every function, and of the
+        commands before the first function if there are any.
+        """
+        halt = len(self.program.ops) - 1
+        starts = sorted(set(self.program.function_at) | {0})
+        if starts[0] == halt:
+            return []
+        return [(start, starts[position + 1] if position + 1 < len(starts) else halt)
+                for position, start in enumerate(starts)]
+
+    def compile(self, files: typing.List[str]) -> str:
+        """Returns the source of the module of the program."""
+        lines = [MODULE_HEADER.format(files=", ".join(
+            os.path.basename(path) for path in files))]
+        for start, end in self.functions():
+            name = self.program.function_at.get(start, "commands before the "
+                                                "first function")
+            lines.append("\ndef f_{}(ram, sp):".format(start))
+            lines.append(INDENT + '"""' + name + '"""')
+            lines += FunctionCompiler(self.program, start, end).compile()
+            lines.append("")
+        lines.append("\nENTRIES = {" + ", ".join(
+            "{}: f_{}".format(start, start) for start, _ in self.functions()) + "}")
+        return "\n".join(lines) + "\n"
+
+
+def source_hash(files: typing.List[str], natives: typing.List[str]) -> str:
+    """Returns the cache key of a program: a hash of the compiler version,
+    the names and contents of its files and the names of the natives bound.
+    """
+    digest = hashlib.sha256(str(COMPILER_VERSION).encode())
+    for path in files:
+        digest.update(os.path.basename(path).encode() + b"\0")
+        with open(path, "rb") as input_file:
+            digest.update(input_file.read() + b"\0")
+    for name in sorted(natives):
+        digest.update(name.encode() + b"\0")
+    return digest.hexdigest()
+
+
+class CompiledProgram:
+    """
+    A VM program compiled by VMCompiler, with the RAM and bootstrap of a
+    VMEmulator. A run cannot be resumed once it stopped, since the calls in
+    progress are Python calls.
+    """
+
+    def __init__(self, natives: typing.Optional[
+            typing.Dict[str, typing.Callable[..., int]]] = None) -> None:
+        """
+        Args:
+            natives: native functions by VM function name, as in VMEmulator.
+        """
+        self.emulator = VMEmulator(natives)
+        self.ram = self.emulator.ram
+        self.module = None
+        self.module_path = ""
+        self.cached = False
+
+    def load(self, path: str, cache_directory: typing.Optional[str] = None) -> None:
+        """Loads a .vm file or a directory, compiling it unless its module is
+        in the cache.
+
+        Args:
+            path (str): a .vm file or a directory of .vm files.
+            cache_directory: where modules are cached, by default the
+            __vmcache__ directory next to the .vm files.
+        """
+        files = vm_files(path)
+        self.emulator.load_files(files)
+        if cache_directory is None:
+            cache_directory = os.path.join(
+                path if os.path.isdir(path) else os.path.dirname(path), CACHE_DIRECTORY)
+        key = source_hash(files, list(self.emulator.natives))
+        self.module_path = os.path.join(cache_directory, "vm_" + key[:32] + ".py")
+        self.cached = os.path.isfile(self.module_path)
+        if not self.cached:
+            os.makedirs(cache_directory, exist_ok=True)
+            source = VMCompiler(self.emulator).compile(files)
+            with open(self.module_path, "w") as module_file:
+                module_file.write(source)
+        spec = importlib.util.spec_from_file_location(
+            os.path.splitext(os.path.basename(self.module_path))[0], self.module_path)
+        self.module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.module)
+        self.module.natives = self.emulator.native_functions
+
+    def start(self) -> None:
+        """Sets up the RAM the way VMEmulator.start() does."""
+        self.emulator.start()
+
+    def run(self, max_ticks: int) -> str:
+        """Runs the program from where start() (or the RAM set up by hand and
+        VMEmulator.reset()) left it.
+
+        Args:
+            max_ticks (int): the budget, in calls and loop iterations.
+
+        Returns:
+            str: HALT_END if the program returned or ran off its end,
+            HALT_STEPS if the budget was spent and HALT_IDLE if it reached a
+            "goto" to itself. SP is in RAM[0] either way.
+        """
+        entry = self.module.ENTRIES.get(self.emulator.pc)
+        if entry is None:
+            raise VMError("cannot start at " + self.emulator.location(self.emulator.pc))
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+        self.module.ticks = max_ticks
+        try:
+            self.ram[SP] = entry(self.ram, self.ram[SP])
+            return HALT_END
+        except self.module.Stop as stop:
+            reason, self.ram[SP] = stop.args
+            return reason
+
+
+if "__main__" == __name__:
+    # Compiles and runs a VM program (a .vm file, or a directory with
+    # Sys.init) and reports how long it took, e.g.: VMCompiler Pong 1000000
+    if len(sys.argv) not in [2, 3]:
+        sys.exit("Invalid usage, please use: VMCompiler <input path> [max ticks]")
+    program = CompiledProgram()
+    start = time.perf_counter()
+    try:
+        program.load(os.path.abspath(sys.argv[1]))
+    except VMError as error:
+        sys.exit(str(error))
+    print("module:", program.module_path, "(cached)" if program.cached else "",
+          "%.3f" % (time.perf_counter() - start), "seconds")
+    program.start()
+    start = time.perf_counter()
+    halt_reason = program.run(int(sys.argv[2]) if len(sys.argv) == 3 else 10 ** 7)
+    print("stopped:", halt_reason, "in", "%.3f" % (time.perf_counter() - start),
+          "seconds")
+    print("SP:", program.ram[SP])
@@ -0,0 +1,622 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import array
+import bisect
+import os
+import sys
+import time
+import typing
+
+WORD_MASK = 0xFFFF
+SIGN_BIT = 0x8000
+ADDRESS_MASK = 0x7FFF
+RAM_SIZE = 32768
+TRUE = WORD_MASK
+FALSE = 0
+
+# the memory layout CodeWriter assumes
+SP = 0
+LCL = 1
+ARG = 2
+THIS = 3
+THAT = 4
+TEMP_BASE = 5
+STATIC_BASE = 16
+STACK_BASE = 256
+FRAME_SIZE = 5
+SEGMENT_POINTERS = {"local": LCL, "argument": ARG, "this": THIS, "that": THAT}
+FIXED_SEGMENTS = {"pointer": THIS, "temp": TEMP_BASE}
+# the symbolic variables write_return uses, which the assembler allocates
+# among the statics in order of first appearance
+RETURN_VARIABLES = ["frame", "return_address"]
+BOOTSTRAP_FUNCTION = "Sys.init"
+VM_EXTENSION = ".vm"
+COMMENT = "//"
+
+# opcodes, in the order run() tests them
+PUSH_CONSTANT = 0
+PUSH_SEGMENT = 1      # arg1: the address of the segment pointer, arg2: index
+POP_SEGMENT = 2
+PUSH_ADDRESS = 3      # arg1: a fixed address (static, temp and pointer)
+POP_ADDRESS = 4
+ADD = 5
+SUB = 6
+IF_GOTO = 7           # arg1: the index of the target command
+GOTO = 8
+CALL = 9              # arg1: the index of the callee, arg2: number of args
+CALL_NATIVE = 10      # arg1: the index of the native function, arg2: as call
+FUNCTION = 11         # arg1: the deepest its stack gets, arg2: number of local variables
+RETURN = 12
+EQ = 13
+GT = 14
+LT = 15
+AND = 16
+OR = 17
+NOT = 18
+NEG = 19
+SHIFT_LEFT = 20
+SHIFT_RIGHT = 21
+HALT = 22
+# call and return while a profiler is attached, handled off the fast path
+OBSERVED_CALL = 23
+OBSERVED_RETURN = 24
+OBSERVED_OPCODES = {CALL: OBSERVED_CALL, RETURN: OBSERVED_RETURN}
+# calls to and returns from the functions a watcher watches, also off the
+# fast path
+WATCHED_CALL = 25
+WATCHED_RETURN = 26
+WATCHED_NATIVE = 27
+PLAIN_OPCODES = {OBSERVED_CALL: CALL, OBSERVED_RETURN: RETURN,
+                 WATCHED_CALL: CALL, WATCHED_RETURN: RETURN,
+                 WATCHED_NATIVE: CALL_NATIVE}
+# how much the opcodes that do not depend on their arguments change SP
+STACK_EFFECTS = {PUSH_CONSTANT: 1, PUSH_SEGMENT: 1, POP_SEGMENT: -1,
+                 PUSH_ADDRESS: 1, POP_ADDRESS: -1, ADD: -1, SUB: -1,
+                 IF_GOTO: -1, EQ: -1, GT: -1, LT: -1, AND: -1, OR: -1}
+ARITHMETIC_OPCODES = {"add": ADD, "sub": SUB, "neg": NEG, "eq": EQ, "gt": GT,
+                      "lt": LT, "and": AND, "or": OR, "not": NOT,
+                      "shiftleft": SHIFT_LEFT, "shiftright": SHIFT_RIGHT}
+
+# reasons run() stops for
+HALT_STEPS = "steps"
+HALT_END = "end"
+HALT_IDLE = "idle"
+
+
+class VMError(Exception):
+    """A VM program that cannot be parsed, linked or run."""
+
+
+def vm_files(path: str) -> typing.List[str]:
+    """Returns the .vm files of a path, in the order the translator (Main)
+    reads them: sorted by name for a directory. The static variables are
+    allocated in this order, so everything that runs a program must use it.
+    """
+    if not os.path.isdir(path):
+        return [path]
+    return [os.path.join(path, filename) for filename in sorted(os.listdir(path))
+            if os.path.splitext(filename)[1].lower() == VM_EXTENSION]
+
+
+class VMEmulator:
+    """
+    Executes VM code directly. The .vm files are parsed once into three
+    parallel integer arrays (opcode, arg1, arg2), with labels and function
+    names resolved to command indexes, so running a command is a few array
+    reads and one branch of an if chain.
+
+    The RAM is an array of 32K unsigned words with the layout CodeWriter
+    assumes: SP, LCL, ARG, THIS and THAT in RAM[0..4], temp in RAM[5..12],
+    statics from RAM[16] (at the addresses the assembler would give them)
+    and the stack from RAM[256]. call and return build and remove the same
+    5-word frames as the translated code, except that return addresses are
+    command indexes rather than ROM addresses (also in the return_address
+    variable of return). The R13-R15 scratch registers of the translated
+    code are not used.
+
+    While running, SP is kept in a local variable and stored back to RAM[0]
+    when run() returns.
+
+    Functions can be replaced by native Python functions (see JackOS): a
+    call to one of them pops its arguments, passes them to the native
+    function as unsigned words, together with the RAM, and pushes the
+    word it returns, all in a single command and without a frame.
+
+    Attaching a profiler (see VMProfiler) costs nothing on the other
+    commands: it replaces the call and return opcodes by OBSERVED_CALL and
+    OBSERVED_RETURN, which tell the profiler before they execute. A watcher
+    (see VMTelemetry) works the same way, for the calls to and returns from
+    a few functions only.
+
+    The highest SP the program reached is kept in sp_peak, without a check
+    per push: load finds the deepest the operand stack of every function
+    gets over its locals, on any path through its jumps (see stack_depth),
+    and a "function" command raises sp_peak to its SP plus that depth. The
+    stack of a callee is counted by its own "function" command. Since every
+    path counts, sp_peak may be above what a run actually reached (a branch
+    that was not taken), but never below it.
+    """
+
+    def __init__(self, natives: typing.Optional[
+            typing.Dict[str, typing.Callable[..., int]]] = None) -> None:
+        """
+        Args:
+            natives: native functions by VM function name. Calls to these
+            names are bound to them, whether or not the loaded files define
+            the function.
+        """
+        self.natives = natives or {}
+        self.native_functions = []
+        self.native_names = []
+        self.ops = array.array("i")
+        self.arg1s = array.array("i")
+        self.arg2s = array.array("i")
+        self.sources = []
+        self.functions = {}
+        self.function_at = {}
+        self.statics = {}
+        self.current_function = ""
+        self.ram = array.array("H", [0]) * RAM_SIZE
+        self.pc = 0
+        self.steps = 0
+        self.sp_peak = 0
+        self.profiler = None
+        self.watcher = None
+        self.watched = set()
+        self.watched_returns = {}
+
+    def load(self, path: str) -> None:
+        """Loads a .vm file, or all the .vm files of a directory."""
+        self.load_files(vm_files(path))
+
+    def load_files(self, paths: typing.List[str]) -> None:
+        """Parses and links the given .vm files as one program.
+
+        Raises:
+            VMError: if a command is malformed, or a label or function is
+            used but never defined.
+        """
+        for code in [self.ops, self.arg1s, self.arg2s]:
+            del code[:]
+        self.sources = []
+        self.functions = {}
+        self.function_at = {}
+        self.statics = {}
+        self.current_function = ""
+        self.native_functions = []
+        self.native_names = []
+        labels = {}
+        jumps = []
+        for path in paths:
+            with open(path, "r") as input_file:
+                self.parse(input_file, os.path.splitext(os.path.basename(path))[0],
+                           labels, jumps)
+        self.emit(HALT, 0, 0, ("", 0))
+        for index, target in jumps:
+            if self.ops[index] == CALL and target[1] in self.natives:
+                self.ops[index] = CALL_NATIVE
+                self.arg1s[index] = len(self.native_functions)
+                self.native_functions.append(self.natives[target[1]])
+                self.native_names.append(target[1])
+                continue
+            if target not in labels:
+                raise VMError(self.location(index) + ": unknown label or "
+                              "function " + "$".join(target).lstrip("$"))
+            self.arg1s[index] = labels[target]
+        for index in self.function_at:
+            self.arg1s[index] = self.stack_depth(index)
+        self.relink()
+        self.reset()
+
+    def stack_depth(self, start: int) -> int:
+        """Returns the deepest the operand stack gets over the SP the code at
+        a command index starts with, following every path through its jumps
+        until a return, the end or the next function. A call counts as the
+        value it leaves (its callee's stack is the callee's own). A loop that
+        pushes more than it pops is cut at ADDRESS_MASK.
+        """
+        ops, arg1s, arg2s = self.ops, self.arg1s, self.arg2s
+        depths = {}
+        deepest = 0
+        pending = [(start, 0)]
+        while pending:
+            index, depth = pending.pop()
+            while depths.get(index, -1) < depth:
+                depths[index] = depth
+                op = PLAIN_OPCODES.get(ops[index], ops[index])
+                if op in [RETURN, HALT] or (op == FUNCTION and index != start):
+                    break
+                if op in [CALL, CALL_NATIVE]:
+                    depth += 1 - arg2s[index]
+                else:
+                    depth += STACK_EFFECTS.get(op, 0)
+                if depth > deepest:
+                    deepest = depth
+                    if deepest > ADDRESS_MASK:
+                        return ADDRESS_MASK
+                if op == GOTO:
+                    index = arg1s[index]
+                    continue
+                if op == IF_GOTO:
+                    pending.append((arg1s[index], depth))
+                index += 1
+        return deepest
+
+    def emit(self, op: int, arg1: int, arg2: int,
+             source: typing.Tuple[str, int]) -> None:
+        self.ops.append(op)
+        self.arg1s.append(arg1)
+        self.arg2s.append(arg2)
+        self.sources.append(source)
+
+    def location(self, index: int) -> str:
+        """Returns "file.vm:line" of the command at an index."""
+        filename, line = self.sources[index]
+        return filename + VM_EXTENSION + ":" + str(line)
+
+    def function_of(self, index: int) -> str:
+        """Returns the name of the function a command index belongs to, or
+        "" for commands before the first function.
+        """
+        entries = sorted(self.function_at)
+        position = bisect.bisect_right(entries, index) - 1
+        return self.function_at[entries[position]] if position >= 0 else ""
+
+    def static_address(self, symbol: str) -> int:
+        """Allocates a variable the way the assembler does: from 16, in
+        order of first appearance.
+        """
+        if symbol not in self.statics:
+            self.statics[symbol] = STATIC_BASE + len(self.statics)
+        return self.statics[symbol]
+
+    def parse(self, input_file: typing.TextIO, filename: str,
+              labels: typing.Dict[typing.Tuple[str, str], int],
+              jumps: typing.List[typing.Tuple[int, typing.Tuple[str, str]]]) -> None:
+        """Parses one .vm file, appending its commands to the program.
+
+        Args:
+            input_file (typing.TextIO): the file to parse.
+            filename (str): its name without extension, for static symbols.
+            labels: collects the index of every label, keyed by (function,
+            label), and of every function, keyed by ("", function).
+            jumps: collects (command index, label key) pairs to resolve once
+            every file was parsed.
+        """
+        for line_number, line in enumerate(input_file, 1):
+            words = line.split(COMMENT, 1)[0].split()
+            if not words:
+                continue
+            source = (filename, line_number)
+            index = len(self.ops)
+            try:
+                command = words[0]
+                if command in ARITHMETIC_OPCODES and len(words) == 1:
+                    self.emit(ARITHMETIC_OPCODES[command], 0, 0, source)
+                elif command in ["push", "pop"]:
+                    self.parse_push_pop(command, words[1], int(words[2]),
+                                        filename, source)
+                elif command == "label":
+                    labels[(self.current_function, words[1])] = index
+                elif command in ["goto", "if-goto"]:
+                    self.emit(GOTO if command == "goto" else IF_GOTO, 0, 0, source)
+                    jumps.append((index, (self.current_function, words[1])))
+                elif command == "function":
+                    self.current_function = words[1]
+                    labels[("", words[1])] = index
+                    self.functions[words[1]] = index
+                    self.function_at[index] = words[1]
+                    self.emit(FUNCTION, 0, int(words[2]), source)
+                elif command == "call":
+                    self.emit(CALL, 0, int(words[2]), source)
+                    jumps.append((index, ("", words[1])))
+                elif command == "return":
+                    for variable in RETURN_VARIABLES:
+                        self.static_address(variable)
+                    self.emit(RETURN, 0, 0, source)
+                else:
+                    raise VMError("unknown command: " + line.strip())
+            except (IndexError, ValueError, KeyError):
+                raise VMError(filename + VM_EXTENSION + ":" + str(line_number)
+                              + ": malformed command: " + line.strip())
+
+    def parse_push_pop(self, command: str, segment: str, index: int,
+                       filename: str, source: typing.Tuple[str, int]) -> None:
+        if segment == "constant":
+            if command == "pop":
+                raise ValueError("cannot pop to constant")
+            self.emit(PUSH_CONSTANT, index & WORD_MASK, 0, source)
+        elif segment in SEGMENT_POINTERS:
+            self.emit(PUSH_SEGMENT if command == "push" else POP_SEGMENT,
+                      SEGMENT_POINTERS[segment], index, source)
+        else:
+            if segment == "static":
+                address = self.static_address(filename + "." + str(index))
+            else:
+                address = FIXED_SEGMENTS[segment] + index
+            self.emit(PUSH_ADDRESS if command == "push" else POP_ADDRESS,
+                      address, 0, source)
+
+    def reset(self) -> None:
+        """Starts over at Sys.init if there is one, otherwise at the first
+        command, the way the VM emulator of the course does. The RAM is kept,
+        so the stack and segments can be set up first.
+        """
+        self.pc = self.functions.get(BOOTSTRAP_FUNCTION, 0)
+        self.steps = 0
+        self.sp_peak = self.ram[SP]
+        if self.pc not in self.function_at:
+            self.sp_peak += self.stack_depth(self.pc)
+
+    def bootstrap(self) -> None:
+        """Runs the bootstrap code of the translator: SP = 256 and
+        "call Sys.init 0", whose return ends the program.
+        """
+        if BOOTSTRAP_FUNCTION not in self.functions:
+            raise VMError("no " + BOOTSTRAP_FUNCTION + " function")
+        ram = self.ram
+        sp = STACK_BASE
+        ram[sp] = len(self.ops) - 1
+        for offset in range(1, FRAME_SIZE):
+            ram[sp + offset] = ram[offset]
+        ram[ARG] = sp
+        sp += FRAME_SIZE
+        ram[LCL] = sp
+        ram[SP] = sp
+        self.pc = self.functions[BOOTSTRAP_FUNCTION]
+        self.steps = 0
+        self.sp_peak = sp
+
+    def start(self) -> None:
+        """Starts the program the way its translation would start: with the
+        bootstrap code if there is a Sys.init, otherwise at the first command
+        with SP = 256.
+        """
+        if BOOTSTRAP_FUNCTION in self.functions:
+            self.bootstrap()
+        else:
+            self.ram[SP] = STACK_BASE
+            self.reset()
+
+    def run(self, max_steps: int) -> str:
+        """Executes up to max_steps VM commands. Labels are not commands.
+
+        Returns:
+            str: HALT_STEPS if the budget was spent, HALT_END if the program
+            ran off its end (or Sys.init returned to the bootstrap code) and
+            HALT_IDLE if it reached a "goto" to itself.
+        """
+        ops, arg1s, arg2s, ram = self.ops, self.arg1s, self.arg2s, self.ram
+        natives = self.native_functions
+        frame_address, return_address_address = \
+            (self.statics.get(variable, 0) for variable in RETURN_VARIABLES)
+        pc = self.pc
+        sp = ram[SP]
+        sp_peak = max(self.sp_peak, sp)
+        reason = HALT_STEPS
+        executed = max_steps
+        try:
+            for step in range(max_steps):
+                op = ops[pc]
+                pc += 1
+                if op == PUSH_CONSTANT:
+                    ram[sp] = arg1s[pc - 1]
+                    sp += 1
+                elif op == PUSH_SEGMENT:
+                    ram[sp] = ram[(ram[arg1s[pc - 1]] + arg2s[pc - 1]) & ADDRESS_MASK]
+                    sp += 1
+                elif op == POP_SEGMENT:
+                    sp -= 1
+                    ram[(ram[arg1s[pc - 1]] + arg2s[pc - 1]) & ADDRESS_MASK] = ram[sp]
+                elif op == PUSH_ADDRESS:
+                    ram[sp] = ram[arg1s[pc - 1]]
+                    sp += 1
+                elif op == POP_ADDRESS:
+                    sp -= 1
+                    ram[arg1s[pc - 1]] = ram[sp]
+                elif op == ADD:
+                    sp -= 1
+                    ram[sp - 1] = (ram[sp - 1] + ram[sp]) & WORD_MASK
+                elif op == SUB:
+                    sp -= 1
+                    ram[sp - 1] = (ram[sp - 1] - ram[sp]) & WORD_MASK
+                elif op == IF_GOTO:
+                    sp -= 1
+                    if ram[sp]:
+                        pc = arg1s[pc - 1]
+                elif op == GOTO:
+                    if arg1s[pc - 1] == pc - 1:
+                        pc -= 1
+                        reason = HALT_IDLE
+                        executed = step + 1
+                        break
+                    pc = arg1s[pc - 1]
+                elif op == CALL:
+                    ram[sp] = pc
+                    ram[sp + 1] = ram[LCL]
+                    ram[sp + 2] = ram[ARG]
+                    ram[sp + 3] = ram[THIS]
+                    ram[sp + 4] = ram[THAT]
+                    ram[ARG] = sp - arg2s[pc - 1]
+                    sp += FRAME_SIZE
+                    ram[LCL] = sp
+                    pc = arg1s[pc - 1]
+                elif op == CALL_NATIVE:
+                    sp -= arg2s[pc - 1]
+                    ram[sp] = natives[arg1s[pc - 1]](ram, *ram[sp:sp + arg2s[pc - 1]]) \
+                        & WORD_MASK
+                    sp += 1
+                elif op == FUNCTION:
+                    for _ in range(arg2s[pc - 1]):
+                        ram[sp] = 0
+                        sp += 1
+                    if sp + arg1s[pc - 1] > sp_peak:
+                        sp_peak = sp + arg1s[pc - 1]
+                elif op == RETURN:
+                    frame = ram[frame_address] = ram[LCL]
+                    return_address = ram[return_address_address] = ram[frame - 5]
+                    ram[ram[ARG]] = ram[sp - 1]
+                    sp = ram[ARG] + 1
+                    ram[THAT] = ram[frame - 1]
+                    ram[THIS] = ram[frame - 2]
+                    ram[ARG] = ram[frame - 3]
+                    ram[LCL] = ram[frame - 4]
+                    pc = return_address
+                elif op == EQ:
+                    sp -= 1
+                    ram[sp - 1] = TRUE if ram[sp - 1] == ram[sp] else FALSE
+                elif op == GT:
+                    sp -= 1
+                    ram[sp - 1] = TRUE if ram[sp - 1] ^ SIGN_BIT > ram[sp] ^ SIGN_BIT else FALSE
+                elif op == LT:
+                    sp -= 1
+                    ram[sp - 1] = TRUE if ram[sp - 1] ^ SIGN_BIT < ram[sp] ^ SIGN_BIT else FALSE
+                elif op == AND:
+                    sp -= 1
+                    ram[sp - 1] &= ram[sp]
+                elif op == OR:
+                    sp -= 1
+                    ram[sp - 1] |= ram[sp]
+                elif op == NOT:
+                    ram[sp - 1] ^= WORD_MASK
+                elif op == NEG:
+                    ram[sp - 1] = -ram[sp - 1] & WORD_MASK
+                elif op == SHIFT_LEFT:
+                    ram[sp - 1] = (ram[sp - 1] << 1) & WORD_MASK
+                elif op == SHIFT_RIGHT:
+                    ram[sp - 1] = (ram[sp - 1] >> 1) | (ram[sp - 1] & SIGN_BIT)
+                elif op == HALT:
+                    pc -= 1
+                    reason = HALT_END
+                    executed = step
+                    break
+                else:
+                    pc, sp = self.execute_observed(op, pc - 1, sp, self.steps + step + 1)
+        except VMError as error:
+            self.pc = pc - 1
+            ram[SP] = sp
+            self.sp_peak = sp_peak
+            self.steps += step
+            raise VMError(self.location(pc - 1) + ": " + str(error))
+        self.pc = pc
+        ram[SP] = sp
+        self.sp_peak = sp_peak
+        self.steps += executed
+        return reason
+
+    def execute_observed(self, op: int, pc: int, sp: int, steps: int) -> \
+            typing.Tuple[int, int]:
+        """Tells the profiler or the watcher about a call or return and
+        executes it. This is the slow path; run() inlines the same logic.
+
+        Args:
+            op (int): one of the OBSERVED_ and WATCHED_ opcodes.
+            pc (int): the index of the command.
+            sp (int): the stack pointer.
+            steps (int): the commands executed so far, this one included.
+
+        Returns:
+            the program counter and stack pointer after the command.
+        """
+        ram = self.ram
+        if op == WATCHED_NATIVE:
+            name = self.native_names[self.arg1s[pc]]
+            sp -= self.arg2s[pc]
+            arguments = ram[sp:sp + self.arg2s[pc]].tolist()
+            self.watcher.called(name, arguments, steps)
+            ram[sp] = self.native_functions[self.arg1s[pc]](ram, *arguments) & WORD_MASK
+            self.watcher.returned(name, ram[sp], steps)
+            return pc + 1, sp + 1
+        if op in [OBSERVED_CALL, WATCHED_CALL]:
+            callee = self.arg1s[pc]
+            n_args = self.arg2s[pc]
+            if op == WATCHED_CALL:
+                self.watcher.called(self.function_at[callee],
+                                    ram[sp - n_args:sp].tolist(), steps)
+            if self.profiler is not None:
+                self.profiler.enter(self.function_at[callee], steps, sp, sp - n_args)
+            ram[sp] = pc + 1
+            for offset in range(1, FRAME_SIZE):
+                ram[sp + offset] = ram[offset]
+            ram[ARG] = sp - n_args
+            sp += FRAME_SIZE
+            ram[LCL] = sp
+            return callee, sp
+        if op == WATCHED_RETURN:
+            self.watcher.returned(self.watched_returns[pc], ram[sp - 1], steps)
+        if self.profiler is not None:
+            self.profiler.leave(steps, sp)
+        frame = ram[LCL]
+        return_address = ram[frame - 5]
+        for variable, value in zip(RETURN_VARIABLES, [frame, return_address]):
+            ram[self.statics[variable]] = value
+        ram[ram[ARG]] = ram[sp - 1]
+        sp = ram[ARG] + 1
+        for offset in range(1, FRAME_SIZE):
+            ram[FRAME_SIZE - offset] = ram[frame - offset]
+        return return_address, sp
+
+    def set_profiler(self, profiler) -> None:
+        """Attaches a profiler, or detaches it when given None. The profiler
+        gets enter(function name, steps, SP, address of the first argument)
+        before every call and leave(steps, SP) before every return, where
+        steps counts the commands executed so far, the call or return
+        included.
+        """
+        self.profiler = profiler
+        self.relink()
+
+    def set_watcher(self, watcher, functions: typing.List[str]) -> None:
+        """Attaches a watcher of the given functions (VM or native), or
+        detaches it when given None. The watcher gets called(function,
+        arguments, steps) before every call to one of them and
+        returned(function, value, steps) before it returns.
+        """
+        self.watcher = watcher
+        self.watched = set(functions) if watcher is not None else set()
+        self.relink()
+
+    def relink(self) -> None:
+        """Sets every call and return to the plain, observed or watched
+        opcode, for the profiler and watcher attached now.
+        """
+        self.watched_returns = {}
+        function = ""
+        for index, op in enumerate(self.ops):
+            function = self.function_at.get(index, function)
+            op = PLAIN_OPCODES.get(op, op)
+            if op == CALL and self.function_at.get(self.arg1s[index]) in self.watched:
+                op = WATCHED_CALL
+            elif op == CALL_NATIVE and self.native_names[self.arg1s[index]] in self.watched:
+                op = WATCHED_NATIVE
+            elif op == RETURN and function in self.watched:
+                op = WATCHED_RETURN
+                self.watched_returns[index] = function
+            elif self.profiler is not None and op in OBSERVED_OPCODES:
+                op = OBSERVED_OPCODES[op]
+            self.ops[index] = op
+
+
+if "__main__" == __name__:
+    # Runs a VM program (a .vm file, or a directory with Sys.init) and
+    # reports how fast it ran, e.g.: VMEmulator Pong 10000000
+    if len(sys.argv) not in [2, 3]:
+        sys.exit("Invalid usage, please use: VMEmulator <input path> [max steps]")
+    emulator = VMEmulator()
+    try:
+        emulator.load(os.path.abspath(sys.argv[1]))
+    except VMError as error:
+        sys.exit(str(error))
+    emulator.start()
+    start = time.perf_counter()
+    halt_reason = emulator.run(int(sys.argv[2]) if len(sys.argv) == 3 else 10 ** 7)
+    seconds = time.perf_counter() - start
+    print("stopped:", halt_reason, "after", emulator.steps, "commands in",
+          "%.3f" % seconds, "seconds")
+    print("commands per second:", int(emulator.steps / seconds) if seconds else 0)
+    print("SP:", emulator.ram[SP])
@@ -0,0 +1,198 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import argparse
+import os
+import sys
+import typing
+from VMEmulator import VMEmulator, VMError, SP, ARG
+
+# the function of the commands that run outside any call
+TOP_LEVEL = "<top>"
+DEFAULT_MAX_STEPS = 10000000
+
+
+class FunctionProfile:
+    """The counters of a single VM function."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0
+        self.exclusive = 0
+        self.inclusive = 0
+        # the most words of the stack it used: arguments, frame, locals and
+        # operands
+        self.max_stack = 0
+
+
+class VMProfiler:
+    """
+    Profiles the functions of a program running on a VMEmulator: how often
+    each one was called, how many VM commands ran in it (exclusive) and in
+    it and its callees (inclusive), and the most words of the stack it used,
+    from its first argument up. Function names are the ones of the
+    "function Xxx.foo n" commands.
+
+    The profiler only hears about calls and returns, and charges the
+    commands between two of them to the function on top of its call stack.
+    The stack a function uses is sampled at these events too: at the calls
+    it makes and at its return. Native functions (see JackOS) run in a
+    single command without a call or return, so they have no profile: their
+    command is charged to the function that called them.
+    """
+
+    def __init__(self) -> None:
+        self.profiles = {}
+        self.edges = {}
+        self.stack = []
+        self.active = {}
+        self.last_steps = 0
+        self.emulator = None
+
+    def attach(self, emulator: VMEmulator) -> None:
+        """Starts profiling the given emulator from where it is now."""
+        self.emulator = emulator
+        self.last_steps = emulator.steps
+        function = emulator.function_of(emulator.pc)
+        base = emulator.ram[ARG] if function else emulator.ram[SP]
+        self.push(function or TOP_LEVEL, emulator.steps, base)
+        emulator.set_profiler(self)
+
+    def profile(self, function: str) -> FunctionProfile:
+        if function not in self.profiles:
+            self.profiles[function] = FunctionProfile(function)
+        return self.profiles[function]
+
+    def push(self, function: str, steps: int, base: int) -> None:
+        profile = self.profile(function)
+        profile.calls += 1
+        self.stack.append((function, steps, base))
+        self.active[function] = self.active.get(function, 0) + 1
+
+    def sample(self, sp: int) -> None:
+        """Records the words of the stack the function on top of the call
+        stack uses, given SP.
+        """
+        function, _, base = self.stack[-1]
+        profile = self.profiles[function]
+        profile.max_stack = max(profile.max_stack, sp - base)
+
+    def charge(self, steps: int) -> None:
+        """Charges the commands run since the last event to the function on
+        top of the call stack.
+        """
+        self.profiles[self.stack[-1][0]].exclusive += steps - self.last_steps
+        self.last_steps = steps
+
+    def enter(self, function: str, steps: int, sp: int, arg: int) -> None:
+        """Called by the emulator before a call to function, with SP and the
+        address of the first argument of the call.
+        """
+        self.charge(steps)
+        self.sample(sp)
+        edge = (self.stack[-1][0], function)
+        self.edges[edge] = self.edges.get(edge, 0) + 1
+        self.push(function, steps, arg)
+
+    def leave(self, steps: int, sp: int) -> None:
+        """Called by the emulator before a return, with SP."""
+        self.charge(steps)
+        self.sample(sp)
+        function, entry_steps, base = self.stack.pop()
+        self.active[function] -= 1
+        # recursive calls are already counted by the outermost one
+        if not self.active[function]:
+            self.profiles[function].inclusive += steps - entry_steps
+        if not self.stack:
+            self.push(TOP_LEVEL, steps, base)
+
+    def results(self) -> typing.List[FunctionProfile]:
+        """Returns the profiles up to now, by exclusive commands, most first.
+        Functions that are still running are charged up to now.
+        """
+        now = self.emulator.steps
+        self.charge(now)
+        open_inclusive = {}
+        for function, entry_steps, _ in self.stack:
+            open_inclusive.setdefault(function, now - entry_steps)
+        self.sample(self.emulator.ram[SP])
+        results = []
+        for function, profile in self.profiles.items():
+            result = FunctionProfile(function)
+            result.calls = profile.calls
+            result.exclusive = profile.exclusive
+            result.inclusive = profile.inclusive + open_inclusive.get(function, 0)
+            result.max_stack = profile.max_stack
+            results.append(result)
+        return sorted(results, key=lambda result: (-result.exclusive, result.name))
+
+    def write_report(self, output: typing.TextIO) -> None:
+        """Writes a text table of the profiles, most expensive first."""
+        results = self.results()
+        total = max(self.emulator.steps, 1)
+        name_width = max([len(result.name) for result in results] + [8]) + 2
+        output.write("// " + str(self.emulator.steps) + " VM commands\n")
+        output.write("// max stack: the most stack words a function used, sampled at its\n"
+                     "// calls and returns; native functions are not profiled, their\n"
+                     "// commands are charged to their callers\n")
+        output.write("function".ljust(name_width) + "calls".rjust(10)
+                     + "exclusive".rjust(12) + "%".rjust(7)
+                     + "inclusive".rjust(12) + "%".rjust(7)
+                     + "max stack".rjust(11) + "\n")
+        for result in results:
+            output.write(result.name.ljust(name_width)
+                         + str(result.calls).rjust(10)
+                         + str(result.exclusive).rjust(12)
+                         + "{:.1f}".format(100 * result.exclusive / total).rjust(7)
+                         + str(result.inclusive).rjust(12)
+                         + "{:.1f}".format(100 * result.inclusive / total).rjust(7)
+                         + str(result.max_stack).rjust(11) + "\n")
+
+    def write_callgraph(self, output: typing.TextIO) -> None:
+        """Writes the call graph in DOT: a node per function with its
+        exclusive commands, and an edge per caller and callee with the
+        number of calls.
+        """
+        total = max(self.emulator.steps, 1)
+        output.write("digraph callgraph {\n    node [shape=box];\n")
+        for result in self.results():
+            output.write('    "{}" [label="{}\\n{} calls\\n{} commands ({:.1f}%)"];\n'.format(
+                result.name, result.name, result.calls, result.exclusive,
+                100 * result.exclusive / total))
+        for (caller, callee), calls in sorted(self.edges.items()):
+            output.write('    "{}" -> "{}" [label="{}"];\n'.format(caller, callee, calls))
+        output.write("}\n")
+
+
+if "__main__" == __name__:
+    # Runs a VM program (a .vm file, or a directory with Sys.init) and
+    # writes its profile and call graph, e.g.:
+    # VMProfiler Pong --report Pong.profile --callgraph Pong.dot
+    arg_parser = argparse.ArgumentParser(
+        description="Profiles the functions of a VM program.")
+    arg_parser.add_argument("path", help="a .vm file or a directory")
+    arg_parser.add_argument("--max-steps", type=int, default=DEFAULT_MAX_STEPS)
+    arg_parser.add_argument("--report", help="the report file (standard output if not given)")
+    arg_parser.add_argument("--callgraph", help="the DOT file of the call graph")
+    arguments = arg_parser.parse_args()
+    emulator = VMEmulator()
+    try:
+        emulator.load(os.path.abspath(arguments.path))
+    except VMError as error:
+        sys.exit(str(error))
+    emulator.start()
+    profiler = VMProfiler()
+    profiler.attach(emulator)
+    emulator.run(arguments.max_steps)
+    if arguments.report:
+        with open(arguments.report, "w") as report_file:
+            profiler.write_report(report_file)
+    else:
+        profiler.write_report(sys.stdout)
+    if arguments.callgraph:
+        with open(arguments.callgraph, "w") as callgraph_file:
+            profiler.write_callgraph(callgraph_file)
@@ -0,0 +1,136 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import json
+import os
+import sys
+import typing
+from VMEmulator import VMEmulator, VMError, FUNCTION, FRAME_SIZE, STACK_BASE
+
+HEAP_BASE = 2048
+# the functions whose calls allocate and free heap blocks. Array.new and
+# Array.dispose are watched too, for when they are native and do not call
+# Memory.alloc and Memory.deAlloc.
+ALLOCATORS = ["Memory.alloc", "Array.new"]
+DEALLOCATORS = ["Memory.deAlloc", "Array.dispose"]
+
+
+class VMTelemetry:
+    """
+    Collects the memory usage of a program running on a VMEmulator: the
+    high-water mark of the stack, operands included (see VMEmulator.sp_peak:
+    it may count a branch that was not taken), the peak of the words allocated
+    with Memory.alloc and not freed yet, and the frame size of every
+    function. Only the calls to the allocation functions are watched, so
+    the rest of the program runs at full speed.
+
+    Heap blocks allocated inside other native functions (e.g. a native
+    String.new) are not seen.
+    """
+
+    def __init__(self) -> None:
+        self.emulator = None
+        self.pending = []
+        self.blocks = {}
+        self.allocations = 0
+        self.frees = 0
+        self.live_words = 0
+        self.peak_words = 0
+        self.peak_blocks = 0
+        self.lowest_block = None
+        self.highest_block_end = None
+
+    def attach(self, emulator: VMEmulator) -> None:
+        """Starts watching the allocations of the given emulator."""
+        self.emulator = emulator
+        emulator.set_watcher(self, ALLOCATORS + DEALLOCATORS)
+
+    def called(self, function: str, arguments: typing.List[int], steps: int) -> None:
+        self.pending.append(arguments)
+
+    def returned(self, function: str, value: int, steps: int) -> None:
+        arguments = self.pending.pop() if self.pending else [0]
+        if function in DEALLOCATORS:
+            if arguments[0] in self.blocks:
+                self.live_words -= self.blocks.pop(arguments[0])
+                self.frees += 1
+            return
+        # Array.new of the Jack OS returns the block of its Memory.alloc
+        if value in self.blocks:
+            return
+        size = arguments[0]
+        self.blocks[value] = size
+        self.allocations += 1
+        self.live_words += size
+        self.peak_words = max(self.peak_words, self.live_words)
+        self.peak_blocks = max(self.peak_blocks, len(self.blocks))
+        if self.lowest_block is None or value < self.lowest_block:
+            self.lowest_block = value
+        if self.highest_block_end is None or value + size > self.highest_block_end:
+            self.highest_block_end = value + size
+
+    def frame_sizes(self) -> typing.Dict[str, typing.Dict[str, int]]:
+        """Returns the local variables and the words of a frame (the locals
+        and the 5 words call pushes) of every function.
+        """
+        emulator = self.emulator
+        sizes = {}
+        for name, index in emulator.functions.items():
+            if emulator.ops[index] == FUNCTION:
+                n_vars = emulator.arg2s[index]
+                sizes[name] = {"locals": n_vars, "frame_words": n_vars + FRAME_SIZE}
+        return sizes
+
+    def report(self) -> typing.Dict[str, typing.Any]:
+        """Returns the telemetry as a JSON-serializable dict."""
+        sp_peak = max(self.emulator.sp_peak, self.emulator.ram[0])
+        return {
+            "steps": self.emulator.steps,
+            "stack": {"base": STACK_BASE, "limit": HEAP_BASE,
+                      "sp_peak": sp_peak,
+                      "peak_words": sp_peak - STACK_BASE,
+                      "headroom_words": HEAP_BASE - sp_peak,
+                      "overflowed": sp_peak > HEAP_BASE},
+            "heap": {"allocations": self.allocations,
+                     "frees": self.frees,
+                     "live_words": self.live_words,
+                     "live_blocks": len(self.blocks),
+                     "peak_words": self.peak_words,
+                     "peak_blocks": self.peak_blocks,
+                     "lowest_block": self.lowest_block,
+                     "highest_block_end": self.highest_block_end},
+            "functions": self.frame_sizes()}
+
+    def write(self, output: typing.TextIO) -> None:
+        json.dump(self.report(), output, indent=2, sort_keys=True)
+        output.write("\n")
+
+
+if "__main__" == __name__:
+    # Runs a VM program (a .vm file, or a directory with Sys.init) and
+    # writes its memory telemetry as JSON, e.g.:
+    # VMTelemetry Pong 10000000 Pong.json
+    if len(sys.argv) not in [2, 3, 4]:
+        sys.exit("Invalid usage, please use: VMTelemetry <input path> "
+                 "[max steps] [output path]")
+    emulator = VMEmulator()
+    try:
+        emulator.load(os.path.abspath(sys.argv[1]))
+    except VMError as error:
+        sys.exit(str(error))
+    emulator.start()
+    telemetry = VMTelemetry()
+    telemetry.attach(emulator)
+    try:
+        emulator.run(int(sys.argv[2]) if len(sys.argv) >= 3 else 10 ** 7)
+    except VMError as error:
+        print(str(error), file=sys.stderr)
+    if len(sys.argv) == 4:
+        with open(sys.argv[3], "w") as output_file:
+            telemetry.write(output_file)
+    else:
+        telemetry.write(sys.stdout)
@@ -0,0 +1,135 @@
+"""
+This file is part of nand2tetris, as taught in The Hebrew University, and
+was written by Aviv Yaish. It is an extension to the specifications given
+[here](https://www.nand2tetris.org) (Shimon Schocken and Noam Nisan, 2017),
+as allowed by the Creative Common Attribution-NonCommercial-ShareAlike 3.0
+Unported [License](https://creativecommons.org/licenses/by-nc-sa/3.0/).
+"""
+import argparse
+import os
+import re
+import sys
+import typing
+from VMEmulator import VMEmulator, VMError, SP, LCL, ARG, THIS, THAT, \
+    SEGMENT_POINTERS, FIXED_SEGMENTS
+
+# the script runner and the test reports live in project 06
+PROJECT_06 = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          os.pardir, "project 06")
+sys.path.append(PROJECT_06)
+import TestScript  # noqa: E402
+from TestFarm import TestResult, write_junit_report, test_name, run_script, \
+    PASSED  # noqa: E402
+
+VM_TEST_SUFFIX = "VME.tst"
+DEFAULT_MAX_STEPS = 50000000
+DEFAULT_TIME_LIMIT = 120.0
+# the variables of the VM emulator of the course: RAM[i], the pointers by
+# their segment names and the entries of the segments, e.g. local[2]
+POINTER_VARIABLES = {"sp": SP, "local": LCL, "argument": ARG, "this": THIS,
+                     "that": THAT}
+RAM_VARIABLE = re.compile(r"^RAM\[(\d+)\]$")
+SEGMENT_VARIABLE = re.compile(r"^(\w+)\[(\d+)\]$")
+
+
+class VMTestTarget:
+    """Exposes a VMEmulator to a TestScript.ScriptRunner, with the variables
+    of the VM emulator of the course, and "vmstep" executing one command.
+    """
+    step_commands = ["vmstep"]
+
+    def __init__(self) -> None:
+        self.emulator = VMEmulator()
+
+    def load(self, path: str) -> None:
+        """Loads a .vm file, or every .vm file of a directory ("load" with no
+        file name). The RAM is kept, as scripts set it up after loading.
+        """
+        try:
+            self.emulator.load(path)
+        except (VMError, OSError) as error:
+            raise TestScript.ScriptError(str(error))
+
+    def address(self, name: str) -> int:
+        """Returns the RAM address of a variable."""
+        if name in POINTER_VARIABLES:
+            return POINTER_VARIABLES[name]
+        match = RAM_VARIABLE.match(name)
+        if match:
+            return int(match.group(1))
+        match = SEGMENT_VARIABLE.match(name)
+        if match:
+            segment, index = match.group(1), int(match.group(2))
+            if segment in SEGMENT_POINTERS:
+                return self.emulator.ram[SEGMENT_POINTERS[segment]] + index
+            if segment in FIXED_SEGMENTS:
+                return FIXED_SEGMENTS[segment] + index
+        raise TestScript.ScriptError("unknown variable: " + name)
+
+    def get_value(self, name: str) -> int:
+        return self.emulator.ram[self.address(name)]
+
+    def set_value(self, name: str, value: int) -> None:
+        self.emulator.ram[self.address(name)] = value
+
+    def run(self, steps: int) -> int:
+        before = self.emulator.steps
+        try:
+            self.emulator.run(steps)
+        except VMError as error:
+            raise TestScript.ScriptError(str(error))
+        return self.emulator.steps - before
+
+    def steps(self) -> int:
+        return self.emulator.steps
+
+
+def discover_tests(paths: typing.List[str]) -> typing.List[str]:
+    """Returns the given .tst scripts, and every XxxVME.tst script under the
+    given directories, sorted.
+    """
+    tests = []
+    for path in paths:
+        if not os.path.isdir(path):
+            tests.append(path)
+            continue
+        for directory, _, filenames in os.walk(path):
+            tests += [os.path.join(directory, filename) for filename in filenames
+                      if filename.endswith(VM_TEST_SUFFIX)]
+    return sorted(tests)
+
+
+def run_test(name: str, test_path: str, max_steps: int,
+             time_limit: float) -> TestResult:
+    """Runs a single script, stopping at the first line of output that
+    differs from its compare-to file.
+    """
+    target = VMTestTarget()
+    return run_script(name, test_path, target, target.steps, max_steps,
+                      time_limit, fail_fast=True)
+
+
+if "__main__" == __name__:
+    # Runs VM emulator test scripts in this process, one after the other,
+    # e.g.: VMTestRunner "project 07" "project 08" --report vm.xml
+    # Directories are searched for XxxVME.tst scripts.
+    arg_parser = argparse.ArgumentParser(
+        description="Runs VM emulator test scripts without the Java tools.")
+    arg_parser.add_argument("paths", nargs="+",
+                            help=".tst scripts or directories to search")
+    arg_parser.add_argument("--max-steps", type=int, default=DEFAULT_MAX_STEPS)
+    arg_parser.add_argument("--time-limit", type=float, default=DEFAULT_TIME_LIMIT)
+    arg_parser.add_argument("--report", help="the JUnit XML report to write")
+    arguments = arg_parser.parse_args()
+    root_path = os.path.commonpath([os.path.abspath(path) for path in arguments.paths])
+    if not os.path.isdir(root_path):
+        root_path = os.path.dirname(root_path)
+    test_results = [run_test(test_name(os.path.abspath(test_path), root_path),
+                             test_path, arguments.max_steps, arguments.time_limit)
+                    for test_path in discover_tests(arguments.paths)]
+    if arguments.report:
+        write_junit_report(test_results, arguments.report)
+    for test_result in test_results:
+        print(test_result.status.upper(), test_result.name, test_result.message)
+    if any(test_result.status != PASSED for test_result in test_results):
+        sys.exit(1)
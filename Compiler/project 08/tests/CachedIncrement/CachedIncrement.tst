@@ -0,0 +1,17 @@
+// Regression test of the increment and decrement superinstructions with the
+// top of the stack cached in D, for indexes after MAX_CHAINED_INDEX, whose
+// address is found through D. Translate with
+// "VMtranslator tests/CachedIncrement --peephole --cache-top" (and without
+// the options, which must give the same RAM), then assemble.
+// Sys.init pushes 7 and 9 under the increment and the decrement of local 5
+// and argument 4, and pops them to static 0 and 1.
+
+load CachedIncrement.asm,
+output-file CachedIncrement.out,
+compare-to CachedIncrement.cmp,
+output-list RAM[16]%D1.6.1 RAM[17]%D1.6.1;
+
+repeat 1000 {
+  ticktock;
+}
+output;
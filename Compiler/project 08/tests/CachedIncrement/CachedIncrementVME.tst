@@ -0,0 +1,14 @@
+// Runs the regression test of CachedIncrement.tst on the VM emulator, which
+// gives the RAM the translated program must leave.
+
+load,
+output-file CachedIncrement.out,
+compare-to CachedIncrement.cmp,
+output-list RAM[16]%D1.6.1 RAM[17]%D1.6.1;
+
+set sp 256,
+
+repeat 50 {
+  vmstep;
+}
+output;